@@ -0,0 +1,2 @@
+from bench.fakes import FakeLLM, FakeOpenAI, FakeAsyncOpenAI, FakeCollection, installed
+from bench.corpus import products, conversations, queries
@@ -0,0 +1,180 @@
+# Offline benchmark of the serving path with a fake LLM and an in-memory product collection:
+#
+#   python -m bench                                    # /api/search + /ask, 8 concurrent clients
+#   python -m bench --app async --stream               # serve_async.py, SSE responses
+#   python -m bench --save-baseline bench-baseline.json
+#   python -m bench --baseline bench-baseline.json     # exits 1 when a percentile regresses
+#
+# Only the embedding model runs for real; OpenAI and Atlas are replaced by bench.fakes.
+
+import argparse
+import os
+import platform
+import sys
+
+BENCH_MONGODB_URI = "mongodb://bench.invalid"
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark /api/search and /ask offline.")
+    parser.add_argument("--app", choices=["sync", "async"], default="sync", help="serve.py (Flask) or serve_async.py (Quart)")
+    parser.add_argument("--endpoints", default="search,ask")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--stream", action="store_true", help="request SSE responses")
+    parser.add_argument("--cold", action="store_true", help="disable the embedding and answer caches")
+    parser.add_argument("--llm-latency-ms", type=float, default=300.0, help="fake time to first token")
+    parser.add_argument("--token-ms", type=float, default=10.0, help="fake delay per generated word")
+    parser.add_argument("--completion-words", type=int, default=60)
+    parser.add_argument("--mongo-latency-ms", type=float, default=5.0, help="fake Atlas round trip")
+    parser.add_argument("--products", type=int, default=300)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeats", type=int, default=3, help="passes over the queries per micro-benchmark")
+    parser.add_argument("--backends", default=None, help="comma-separated embedding backends (default: all)")
+    parser.add_argument("--skip-load", action="store_true")
+    parser.add_argument("--skip-micro", action="store_true")
+    parser.add_argument("--output", default=None, help="write the JSON report here")
+    parser.add_argument("--baseline", default=None, help="compare against this JSON report")
+    parser.add_argument("--save-baseline", default=None, help="write the JSON report as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="relative slowdown counted as a regression")
+    return parser.parse_args(argv)
+
+
+def configure_environment(args):
+    # serve.py reads its configuration at import time; never reach a real database or API key
+    os.environ.update({
+        "MONGODB_URI": BENCH_MONGODB_URI,
+        "DB_NAME": "bench",
+        "DB_COLLECTION": "products",
+        "ASK_DB_NAME": "bench",
+        "ASK_DB_COLLECTION": "products",
+        "OPEN_AI_KEY": "bench",
+        "GEMINI_KEY": "",
+        "RETRIEVER_BACKEND": "atlas",
+        "EMBEDDING_CACHE_PATH": "",
+        "REQUEST_LOG": "false",
+    })
+    if args.cold:
+        os.environ["EMBEDDING_CACHE_SIZE"] = "0"
+        os.environ["ANSWER_CACHE_TTL"] = "0"
+
+
+def micro_benchmarks(serve, collection, args, report):
+    from embeddings.registry import BACKENDS
+    from embeddings.sbert import SBERTEmbedding
+    from rag.core import RAG
+    from rag.mongo import SEARCH_FIELDS
+    from rag.retriever import AtlasRetriever
+    from semantic_router import SemanticRouter, TieredRouter
+    from bench.core import time_calls
+    from bench.corpus import queries
+
+    texts = queries()
+    micro, skipped = report.setdefault("micro", {}), report.setdefault("skipped", {})
+
+    # Uncached encoder, so every call pays for the model; the route index comes from the artifact
+    router = SemanticRouter(
+        serve.sbertEmbedding, serve.semanticRouter.routes,
+        aggregation=serve.semanticRouter.aggregation, cacheDir=serve.semanticRouter.cacheDir,
+    )
+    micro["router.guide"] = time_calls(router.guide, texts, args.repeats)
+    micro["router.guide (cached encoder)"] = time_calls(serve.semanticRouter.guide, texts, args.repeats)
+    if serve.semanticRouter.lexical is not None:
+        micro["router.lexical"] = time_calls(serve.semanticRouter.lexical.classify, texts, args.repeats)
+        # Lexical tier in front of the uncached encoder
+        micro["router.tiered"] = time_calls(TieredRouter(router, serve.semanticRouter.lexical).guide, texts, args.repeats)
+
+    rag = RAG(
+        mongodbUri=BENCH_MONGODB_URI, dbName="bench", dbCollection="products", llm=None,
+        embedding=serve.sbertEmbedding,
+        retriever=AtlasRetriever(collection, serve.sbertEmbedding, fields=SEARCH_FIELDS, name="bench"),
+        searchLimit=serve.SEARCH_LIMIT,
+    )
+    micro["rag.enhance_prompt"] = time_calls(rag.enhance_prompt, texts, args.repeats)
+
+    batches = [texts[i:i + 32] for i in range(0, len(texts), 32)]
+    for backend in (args.backends.split(",") if args.backends else BACKENDS):
+        try:
+            embedding = SBERTEmbedding(
+                serve.EMBEDDING_MODEL, device=serve.EMBEDDING_DEVICE, backend=backend, threads=serve.EMBEDDING_THREADS
+            )
+        except (ImportError, ValueError) as e:
+            skipped[f"embedding.{backend}"] = str(e).splitlines()[0]
+            continue
+        micro[f"embedding.{backend}.single"] = time_calls(embedding.encode, texts, args.repeats)
+        micro[f"embedding.{backend}.batch32"] = time_calls(embedding.encode, batches, args.repeats, warmup=1)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    configure_environment(args)
+
+    from embeddings.sbert import SBERTEmbedding
+    from metrics import metrics
+    from bench import core
+    from bench.corpus import conversations, products
+    from bench.fakes import FakeCollection, FakeLLM, installed
+
+    # Same registry key as serve.py, so the model is loaded once and shared
+    embedding = SBERTEmbedding(
+        os.getenv('EMBEDDING_MODEL') or 'keepitreal/vietnamese-sbert',
+        device=os.getenv('EMBEDDING_DEVICE') or None,
+        backend=os.getenv('EMBEDDING_BACKEND') or 'torch',
+        threads=int(os.getenv('EMBEDDING_THREADS')) if os.getenv('EMBEDDING_THREADS') else None,
+    )
+    collection = FakeCollection.from_documents(
+        products(args.products, seed=args.seed), embedding, queryLatencyMs=args.mongo_latency_ms
+    )
+    llm = FakeLLM(args.llm_latency_ms, args.token_ms, args.completion_words, seed=args.seed)
+
+    report = {
+        "config": {
+            **{key: value for key, value in vars(args).items() if key not in ("output", "baseline", "save_baseline")},
+            "embedding_model": embedding.name,
+            "embedding_backend": embedding.backend,
+            "python": platform.python_version(),
+            "cpus": os.cpu_count(),
+        },
+    }
+
+    with installed(BENCH_MONGODB_URI, collection, llm):
+        import serve
+
+        if not args.skip_load:
+            recorder = core.StageRecorder()
+            metrics.add_listener(recorder)
+            bodies = conversations(max(args.requests, 1), seed=args.seed)
+            endpoints = args.endpoints.split(",")
+            if args.app == "async":
+                import serve_async
+                results, wallSeconds = core.run_load_async(
+                    serve_async.app, bodies, endpoints, args.requests, args.concurrency, args.stream
+                )
+            else:
+                results, wallSeconds = core.run_load(
+                    serve.app, bodies, endpoints, args.requests, args.concurrency, args.stream
+                )
+            metrics.remove_listener(recorder)
+            report["load"] = core.load_report(results, wallSeconds, recorder)
+            report["llm_calls"] = llm.calls
+
+        if not args.skip_micro:
+            micro_benchmarks(serve, collection, args, report)
+
+    comparison = None
+    if args.baseline:
+        comparison = core.compare(report, core.load(args.baseline), args.tolerance)
+    core.print_report(report, comparison)
+
+    if args.output:
+        core.save(report, args.output)
+    if args.save_baseline:
+        core.save(report, args.save_baseline)
+        print(f"✅ Saved baseline to {args.save_baseline}")
+    if comparison and any(row["regressed"] for row in comparison):
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
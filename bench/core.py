@@ -0,0 +1,193 @@
+import asyncio
+import json
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+PATHS = {"search": "/api/search", "ask": "/ask"}
+
+
+def percentiles(samples: List[float]) -> dict:
+    """Latency summary in milliseconds of a list of durations in seconds."""
+    if not samples:
+        return {"count": 0}
+    values = np.asarray(samples, dtype=np.float64) * 1000
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {
+        "count": len(values),
+        "mean_ms": float(values.mean()),
+        "p50_ms": float(p50),
+        "p95_ms": float(p95),
+        "p99_ms": float(p99),
+    }
+
+
+class StageRecorder():
+    """metrics listener that keeps every request's stage timings (the histograms only keep buckets)."""
+
+    def __init__(self):
+        self.stages = defaultdict(lambda: defaultdict(list))
+        self.routes = defaultdict(lambda: defaultdict(int))
+        self._lock = threading.Lock()
+
+    def __call__(self, trace, status: str, seconds: float):
+        with self._lock:
+            for stage, value in trace.stages.items():
+                self.stages[trace.endpoint][stage].append(value)
+            self.stages[trace.endpoint]["server_total"].append(seconds)
+            self.routes[trace.endpoint][trace.fields.get("route") or status] += 1
+
+
+def _jobs(bodies: List[list], endpoints: List[str], requests: int):
+    return [(endpoints[i % len(endpoints)], bodies[i % len(bodies)]) for i in range(requests)]
+
+
+def run_load(app, bodies, endpoints, requests: int, concurrency: int, stream: bool = False):
+    """Drive a Flask app from `concurrency` threads; returns [(endpoint, seconds, status)], wall seconds."""
+    local = threading.local()
+    query = "?stream=true" if stream else ""
+
+    def send(job):
+        endpoint, body = job
+        client = getattr(local, "client", None)
+        if client is None:
+            client = local.client = app.test_client()
+        start = time.perf_counter()
+        response = client.post(PATHS[endpoint] + query, json=body)
+        response.get_data()  # drain the SSE stream
+        return endpoint, time.perf_counter() - start, response.status_code
+
+    jobs = _jobs(bodies, endpoints, requests)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(send, jobs))
+    return results, time.perf_counter() - start
+
+
+def run_load_async(app, bodies, endpoints, requests: int, concurrency: int, stream: bool = False):
+    """Same as run_load for the Quart app, with `concurrency` requests in flight on one loop."""
+    query = "?stream=true" if stream else ""
+
+    async def main():
+        async with app.test_app() as testApp:
+            client = testApp.test_client()
+            semaphore = asyncio.Semaphore(concurrency)
+
+            async def send(job):
+                endpoint, body = job
+                async with semaphore:
+                    start = time.perf_counter()
+                    response = await client.post(PATHS[endpoint] + query, json=body)
+                    await response.get_data()
+                    return endpoint, time.perf_counter() - start, response.status_code
+
+            start = time.perf_counter()
+            results = await asyncio.gather(*(send(job) for job in _jobs(bodies, endpoints, requests)))
+            return results, time.perf_counter() - start
+
+    return asyncio.run(main())
+
+
+def load_report(results, wallSeconds: float, recorder: StageRecorder) -> dict:
+    report = {}
+    byEndpoint = defaultdict(list)
+    for endpoint, seconds, status in results:
+        byEndpoint[endpoint].append((seconds, status))
+    for endpoint, samples in byEndpoint.items():
+        report[endpoint] = {
+            "requests": len(samples),
+            "errors": sum(1 for _, status in samples if status >= 400),
+            "throughput_rps": len(samples) / wallSeconds if wallSeconds else 0.0,
+            "latency": percentiles([seconds for seconds, _ in samples]),
+            "stages": {stage: percentiles(values) for stage, values in recorder.stages[endpoint].items()},
+            "routes": dict(recorder.routes[endpoint]),
+        }
+    report["all"] = {
+        "requests": len(results),
+        "throughput_rps": len(results) / wallSeconds if wallSeconds else 0.0,
+        "latency": percentiles([seconds for _, seconds, _ in results]),
+    }
+    return report
+
+
+def time_calls(fn: Callable, inputs: list, repeats: int = 3, warmup: int = 3) -> dict:
+    for item in inputs[:warmup]:
+        fn(item)
+    samples = []
+    for _ in range(repeats):
+        for item in inputs:
+            start = time.perf_counter()
+            fn(item)
+            samples.append(time.perf_counter() - start)
+    return percentiles(samples)
+
+
+def _flatten(report: dict, prefix: str = "") -> Dict[str, float]:
+    values = {}
+    for key, value in report.items():
+        name = f"{prefix}.{key}" if prefix else key
+        if isinstance(value, dict):
+            values.update(_flatten(value, name))
+        elif isinstance(value, (int, float)) and (key.endswith("_ms") and key != "mean_ms" or key == "throughput_rps"):
+            values[name] = float(value)
+    return values
+
+
+def compare(report: dict, baseline: dict, tolerance: float = 0.2) -> List[dict]:
+    """
+    Percentile latencies and throughput of `report` against `baseline`.
+    A row regresses when it is more than `tolerance` (relative) worse.
+    """
+    current = _flatten({section: report.get(section, {}) for section in ("load", "micro")})
+    previous = _flatten({section: baseline.get(section, {}) for section in ("load", "micro")})
+    rows = []
+    for name in sorted(current.keys() & previous.keys()):
+        old, new = previous[name], current[name]
+        if not old:
+            continue
+        change = (new - old) / old
+        worse = -change if name.endswith("throughput_rps") else change
+        rows.append({"metric": name, "baseline": old, "current": new, "change": change, "regressed": worse > tolerance})
+    return rows
+
+
+def print_report(report: dict, comparison: Optional[List[dict]] = None):
+    for endpoint, result in report.get("load", {}).items():
+        latency = result["latency"]
+        if not latency.get("count"):
+            continue
+        print(f"\n=== {endpoint}: {result['requests']} requests, {result['throughput_rps']:.1f} req/s, "
+              f"p50 {latency['p50_ms']:.1f} / p95 {latency['p95_ms']:.1f} / p99 {latency['p99_ms']:.1f} ms")
+        if result.get("routes"):
+            print(f"    routes: {result['routes']}, errors: {result.get('errors', 0)}")
+        for stage, stats in result.get("stages", {}).items():
+            if stats.get("count"):
+                print(f"    {stage:>14}: n={stats['count']:<5} p50 {stats['p50_ms']:8.2f}  "
+                      f"p95 {stats['p95_ms']:8.2f}  p99 {stats['p99_ms']:8.2f} ms")
+
+    if report.get("micro"):
+        print("\n=== micro-benchmarks")
+        for name, stats in report["micro"].items():
+            print(f"    {name:>34}: p50 {stats['p50_ms']:8.2f}  p95 {stats['p95_ms']:8.2f}  p99 {stats['p99_ms']:8.2f} ms")
+    for name, reason in report.get("skipped", {}).items():
+        print(f"    {name:>34}: skipped ({reason})")
+
+    if comparison:
+        print("\n=== against baseline")
+        for row in comparison:
+            flag = "❌" if row["regressed"] else "  "
+            print(f" {flag} {row['metric']:<55} {row['baseline']:10.2f} -> {row['current']:10.2f} ({row['change']:+.0%})")
+
+
+def save(report: dict, path: str):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+def load(path: str) -> dict:
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
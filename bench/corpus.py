@@ -0,0 +1,105 @@
+import random
+from datetime import datetime, timedelta
+from typing import List
+
+from semantic_router.samples import productsSample, chitchatSample
+
+# Catalogue shaped like the crawled product collection (title, price, promotion, specs, ...)
+BRANDS = {
+    "iPhone": ["13", "13 Pro", "14", "14 Plus", "15", "15 Pro Max", "16", "16 Pro"],
+    "Samsung Galaxy": ["S21", "S23 Ultra", "S24", "A15", "A55", "Z Flip5", "Z Fold6", "Note 20"],
+    "Xiaomi": ["Redmi Note 13", "Redmi 13C", "14", "14T Pro", "Poco X6"],
+    "OPPO": ["Reno11 F", "Reno12", "A79", "Find N3 Flip", "A18"],
+    "vivo": ["V30e", "Y03", "Y100", "X100 Pro"],
+    "Google Pixel": ["6", "7a", "8 Pro"],
+    "OnePlus": ["9 Pro", "Nord CE3", "12"],
+    "Realme": ["C67", "11 Pro+", "Note 50"],
+    "Nokia": ["G22", "C32", "105 4G"],
+}
+STORAGE = ["64GB", "128GB", "256GB", "512GB", "1TB"]
+COLORS = ["Đen", "Trắng", "Xanh dương", "Xanh lá", "Tím", "Vàng", "Hồng", "Bạc", "Titan tự nhiên"]
+PROMOTIONS = [
+    "Giảm ngay 500.000đ khi thanh toán qua VNPAY",
+    "Tặng ốp lưng và dán cường lực",
+    "Trả góp 0% qua thẻ tín dụng",
+    "Thu cũ đổi mới trợ giá đến 2.000.000đ",
+    "",
+]
+
+FOLLOW_UPS = [
+    "Còn màu khác không?",
+    "Nó có hỗ trợ sạc nhanh không?",
+    "Máy đó giá bao nhiêu vậy?",
+    "Còn bản dung lượng lớn hơn không?",
+    "Có trả góp không em?",
+    "So với con kia thì sao?",
+]
+ANSWER = "Dạ, sản phẩm này hiện đang có sẵn tại cửa hàng DBIZ ạ."
+
+
+def _price(rng) -> str:
+    return f"{rng.randrange(2, 45) * 1_000_000 - 10_000:,}".replace(",", ".") + " ₫"
+
+
+def products(count: int = 300, seed: int = 0) -> List[dict]:
+    """Deterministic product documents with every field the prompts read."""
+    rng = random.Random(seed)
+    models = [f"{brand} {model}" for brand, names in BRANDS.items() for model in names]
+    start = datetime(2024, 1, 1)
+    documents = []
+    for i in range(count):
+        title = f"{models[i % len(models)]} {STORAGE[(i // len(models)) % len(STORAGE)]}"
+        specs = "<br>".join([
+            f"Màn hình: {rng.choice(['6.1', '6.5', '6.7', '6.8'])} inch {rng.choice(['OLED', 'AMOLED', 'IPS LCD'])}",
+            f"Chip: {rng.choice(['Apple A16 Bionic', 'Snapdragon 8 Gen 3', 'Dimensity 7050', 'Helio G99', 'Exynos 2400'])}",
+            f"RAM: {rng.choice(['4GB', '6GB', '8GB', '12GB'])}",
+            f"Pin: {rng.randrange(3000, 6000, 100)} mAh, sạc nhanh {rng.choice([18, 25, 33, 45, 67, 120])}W",
+            f"Camera sau: {rng.choice([12, 48, 50, 108, 200])} MP",
+        ])
+        documents.append({
+            "_id": i,
+            "title": title,
+            "current_price": _price(rng) if rng.random() > 0.1 else "",
+            "product_promotion": rng.choice(PROMOTIONS),
+            "product_specs": specs,
+            "color_options": rng.sample(COLORS, rng.randrange(1, 4)),
+            "url": f"https://dbiz.example/{title.lower().replace(' ', '-')}",
+            "updated_at": start + timedelta(hours=i),
+        })
+    return documents
+
+
+def _message(role: str, text: str) -> dict:
+    return {"role": role, "parts": [{"text": text}]}
+
+
+def conversations(count: int = 200, seed: int = 0, multiTurnRatio: float = 0.3, longRatio: float = 0.05) -> List[list]:
+    """
+    Request bodies for /api/search and /ask: mostly first-turn questions from
+    the router samples, plus follow-ups (reflection) and long chats (memory).
+    """
+    rng = random.Random(seed)
+    questions = productsSample + chitchatSample
+    bodies = []
+    for _ in range(count):
+        question = rng.choice(questions)
+        draw = rng.random()
+        if draw < longRatio:
+            history = []
+            for _ in range(4):
+                history += [_message("user", rng.choice(productsSample)), _message("model", ANSWER)]
+            bodies.append(history + [_message("user", rng.choice(FOLLOW_UPS))])
+        elif draw < longRatio + multiTurnRatio:
+            bodies.append([
+                _message("user", rng.choice(productsSample)),
+                _message("model", ANSWER),
+                _message("user", rng.choice(FOLLOW_UPS)),
+            ])
+        else:
+            bodies.append([_message("user", question)])
+    return bodies
+
+
+def queries() -> List[str]:
+    """Single questions for the micro-benchmarks."""
+    return productsSample + chitchatSample
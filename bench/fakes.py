@@ -0,0 +1,229 @@
+import asyncio
+import random
+import threading
+import time
+from contextlib import contextmanager
+from types import SimpleNamespace
+from typing import List, Optional
+
+import numpy as np
+
+from rag.local_index import LocalVectorIndex
+
+FILLER = (
+    "Dạ, cửa hàng DBIZ hiện có sẵn sản phẩm này với nhiều màu sắc và phiên bản dung lượng, "
+    "đang được trả góp 0% và tặng kèm phụ kiện chính hãng, anh chị có thể ghé cửa hàng để trải nghiệm trực tiếp"
+).split()
+
+
+class FakeLLM():
+    """
+    Stand-in for the OpenAI chat API with a fixed time to first token and
+    per-token delay. Reflection prompts get the last question back; anything
+    else gets `completionWords` words of a canned Vietnamese answer.
+    """
+
+    def __init__(self, latencyMs: float = 300.0, tokenMs: float = 10.0, completionWords: int = 60,
+                 jitter: float = 0.0, seed: int = 0):
+        self.latency = latencyMs / 1000.0
+        self.tokenDelay = tokenMs / 1000.0
+        self.completionWords = completionWords
+        self.jitter = jitter
+        self.calls = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _delay(self, seconds: float) -> float:
+        if not self.jitter:
+            return seconds
+        with self._lock:
+            return seconds * (1 + self.jitter * (2 * self._random.random() - 1))
+
+    def reply(self, messages) -> str:
+        with self._lock:
+            self.calls += 1
+        prompt = messages[-1]["content"]
+        if "standalone question" in prompt:
+            # Reflection: history lines are "role: text"; return the latest user question.
+            lines = [line.strip() for line in prompt.splitlines() if line.strip().startswith("user:")]
+            return lines[-1][len("user:"):].strip() if lines else prompt
+        return " ".join(FILLER[i % len(FILLER)] for i in range(self.completionWords))
+
+    @staticmethod
+    def _response(text: str):
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=text))])
+
+    @staticmethod
+    def _chunk(text: str):
+        return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=text))])
+
+    def create(self, model=None, messages=None, stream=False, **kwargs):
+        text = self.reply(messages)
+        time.sleep(self._delay(self.latency))
+        if stream:
+            return self._stream(text)
+        time.sleep(self._delay(self.tokenDelay * len(text.split())))
+        return self._response(text)
+
+    def _stream(self, text: str):
+        for word in text.split():
+            yield self._chunk(word + " ")
+            time.sleep(self._delay(self.tokenDelay))
+
+    async def acreate(self, model=None, messages=None, stream=False, **kwargs):
+        text = self.reply(messages)
+        await asyncio.sleep(self._delay(self.latency))
+        if stream:
+            return self._astream(text)
+        await asyncio.sleep(self._delay(self.tokenDelay * len(text.split())))
+        return self._response(text)
+
+    async def _astream(self, text: str):
+        for word in text.split():
+            yield self._chunk(word + " ")
+            await asyncio.sleep(self._delay(self.tokenDelay))
+
+
+class FakeOpenAI():
+    """Drop-in for `openai.OpenAI`: only `chat.completions.create` is implemented."""
+
+    def __init__(self, llm: FakeLLM, api_key: Optional[str] = None, **kwargs):
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=llm.create))
+
+
+class FakeAsyncOpenAI():
+    def __init__(self, llm: FakeLLM, api_key: Optional[str] = None, **kwargs):
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=llm.acreate))
+
+
+def _project(document: dict, projection: Optional[dict], score: Optional[float] = None) -> dict:
+    if not projection:
+        return dict(document)
+    result = {}
+    for field, value in projection.items():
+        if field == "_id":
+            continue
+        if isinstance(value, dict) and value.get("$meta") == "vectorSearchScore":
+            result[field] = score
+        elif value and field in document:
+            result[field] = document[field]
+    if projection.get("_id", 1) and "_id" in document:
+        result["_id"] = document["_id"]
+    return result
+
+
+class FakeCollection():
+    """
+    In-memory product collection answering the `$vectorSearch` pipelines of
+    rag.mongo.vector_search_pipeline with an exact LocalVectorIndex scan.
+    """
+
+    def __init__(self, documents: List[dict], vectors, queryLatencyMs: float = 0.0):
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-12
+        self.documents = documents
+        self.index = LocalVectorIndex(vectors, documents)
+        # Network round trip to Atlas, added to every aggregate
+        self.queryLatency = queryLatencyMs / 1000.0
+
+    @classmethod
+    def from_documents(cls, documents: List[dict], embedding, textFields=("title", "product_specs"), **kwargs):
+        texts = [
+            ". ".join(str(doc.get(field, "")).replace("<br>", "; ") for field in textFields if doc.get(field))
+            for doc in documents
+        ]
+        return cls(documents, embedding.encode(texts), **kwargs)
+
+    def _run(self, pipeline: List[dict]) -> List[dict]:
+        results, scores = list(self.documents), [None] * len(self.documents)
+        for stage in pipeline:
+            if "$vectorSearch" in stage:
+                search = stage["$vectorSearch"]
+                hits = self.index.search(search["queryVector"], search["limit"])
+                results = [self.documents[row] for row, _ in hits]
+                scores = [score for _, score in hits]
+            elif "$project" in stage:
+                results = [_project(doc, stage["$project"], score) for doc, score in zip(results, scores)]
+            elif "$limit" in stage:
+                results, scores = results[:stage["$limit"]], scores[:stage["$limit"]]
+            else:
+                raise NotImplementedError(f"FakeCollection does not support stage {list(stage)}")
+        return results
+
+    def aggregate(self, pipeline):
+        if self.queryLatency:
+            time.sleep(self.queryLatency)
+        return iter(self._run(pipeline))
+
+    def find(self, filter=None, projection=None):
+        return iter([_project(doc, projection) for doc in self.documents])
+
+    def find_one(self, filter=None, projection=None, sort=None):
+        documents = self.documents
+        for field, direction in sort or []:
+            documents = sorted(documents, key=lambda doc: doc.get(field) or 0, reverse=direction < 0)
+        return _project(documents[0], projection) if documents else None
+
+    def estimated_document_count(self):
+        return len(self.documents)
+
+
+class _AsyncCursor():
+    def __init__(self, collection: FakeCollection, pipeline):
+        self.collection = collection
+        self.pipeline = pipeline
+
+    async def to_list(self, length=None):
+        if self.collection.queryLatency:
+            await asyncio.sleep(self.collection.queryLatency)
+        return self.collection._run(self.pipeline)
+
+
+class FakeAsyncCollection():
+    """motor-style view of a FakeCollection for serve_async.py."""
+
+    def __init__(self, collection: FakeCollection):
+        self.collection = collection
+
+    def aggregate(self, pipeline):
+        return _AsyncCursor(self.collection, pipeline)
+
+
+class FakeMongoClient():
+    """Every database/collection name resolves to the same product collection."""
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    def __getitem__(self, name):
+        return _FakeDatabase(self.collection)
+
+
+class _FakeDatabase():
+    def __init__(self, collection):
+        self.collection = collection
+
+    def __getitem__(self, name):
+        return self.collection
+
+
+@contextmanager
+def installed(mongodbUri: str, collection: FakeCollection, llm: FakeLLM):
+    """
+    Route `openai.OpenAI`/`AsyncOpenAI` and the pooled Mongo clients for
+    `mongodbUri` (rag.mongo) to the fakes while serve.py is imported and run.
+    """
+    import openai
+    from rag import mongo
+
+    saved = (openai.OpenAI, openai.AsyncOpenAI)
+    openai.OpenAI = lambda *args, **kwargs: FakeOpenAI(llm, *args, **kwargs)
+    openai.AsyncOpenAI = lambda *args, **kwargs: FakeAsyncOpenAI(llm, *args, **kwargs)
+    mongo._clients[mongodbUri] = FakeMongoClient(collection)
+    mongo._asyncClients[mongodbUri] = FakeMongoClient(FakeAsyncCollection(collection))
+    try:
+        yield
+    finally:
+        openai.OpenAI, openai.AsyncOpenAI = saved
+        mongo._clients.pop(mongodbUri, None)
+        mongo._asyncClients.pop(mongodbUri, None)
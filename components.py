@@ -0,0 +1,259 @@
+# Components shared by serve.py (Flask) and serve_async.py (Quart): configuration,
+# the query encoder and router, retrievers, caches, conversation memory and the
+# product watchers. Importing this module starts no threads and binds no web
+# framework; each server calls start_background() once it runs.
+
+import os
+
+import openai
+from dotenv import load_dotenv
+
+from rag.answer_cache import SemanticAnswerCache
+from rag.retriever import AtlasRetriever, LocalRetriever
+from rag.mongo import SEARCH_FIELDS, ASK_FIELDS, collection_version, ensure_version_index, get_collection, queryStats
+from rag.local_index import LocalVectorIndex
+from rag.hybrid import BM25Index, HybridRetriever
+from rag.rerank import CrossEncoderReranker, RerankingRetriever
+from rag.snippets import ASK_PROMPT, render_ask_context, snippetCache
+from rag.singleflight import SingleFlight
+from embeddings.sbert import SBERTEmbedding
+from embeddings.remote import RemoteEmbedding
+from embeddings.batcher import MicroBatchEncoder
+from embeddings.cache import EmbeddingCache, CachedEmbedding
+from semantic_router import SemanticRouter, LexicalRouter, TieredRouter, Route
+from semantic_router.samples import productsSample, chitchatSample, productsKeywords, chitchatPhrases
+from memory import ConversationMemory
+from metrics import metrics
+
+# === Load .env ===
+load_dotenv()
+print("✅ OPEN_AI_KEY:", "set" if os.getenv('OPEN_AI_KEY') else "missing")
+
+# === ENV CONFIG ===
+MONGODB_URI = os.getenv('MONGODB_URI')
+DB_NAME = os.getenv('DB_NAME')
+DB_COLLECTION = os.getenv('DB_COLLECTION')
+LLM_KEY = os.getenv('GEMINI_KEY')
+OPEN_AI_KEY = os.getenv('OPEN_AI_KEY')
+EMBEDDING_MODEL = os.getenv('EMBEDDING_MODEL') or 'keepitreal/vietnamese-sbert'
+EMBEDDING_DEVICE = os.getenv('EMBEDDING_DEVICE') or None
+# 'torch', 'torch-int8', 'onnx' or 'onnx-int8'; check parity first with `python -m embeddings.parity`
+EMBEDDING_BACKEND = os.getenv('EMBEDDING_BACKEND') or 'torch'
+EMBEDDING_THREADS = int(os.getenv('EMBEDDING_THREADS')) if os.getenv('EMBEDDING_THREADS') else None
+# 'atlas' ($vectorSearch) or 'local' (in-process index built with `python -m rag.local_index`)
+RETRIEVER_BACKEND = os.getenv('RETRIEVER_BACKEND') or 'atlas'
+LOCAL_INDEX_PATH = os.getenv('LOCAL_INDEX_PATH') or 'local_index'
+# /ask reads its own collection
+ASK_DB_NAME = os.getenv('ASK_DB_NAME') or 'hoanghamobilenew'
+ASK_DB_COLLECTION = os.getenv('ASK_DB_COLLECTION') or 'embedding_for_vector_search'
+# 'true' fuses vector search with a BM25 index over titles/specs (exact model names)
+HYBRID_SEARCH = (os.getenv('HYBRID_SEARCH') or 'false').lower() == 'true'
+# Optional cross-encoder re-ranking between retrieval and prompt building
+RERANK_MODEL = os.getenv('RERANK_MODEL') or None
+SEARCH_LIMIT = int(os.getenv('SEARCH_LIMIT') or (5 if HYBRID_SEARCH or RERANK_MODEL else 10))
+# 'true' applies product changes (change stream, or updated_at polling) to the caches and indexes
+WATCH_PRODUCTS = (os.getenv('WATCH_PRODUCTS') or 'false').lower() == 'true'
+# 'true' prints one JSON line per request with its stage timings, route, cache result and tokens
+REQUEST_LOG = (os.getenv('REQUEST_LOG') or 'false').lower() == 'true'
+# 'false' stops identical concurrent questions from sharing one reflection/retrieval/LLM call
+SINGLE_FLIGHT = (os.getenv('SINGLE_FLIGHT') or 'true').lower() == 'true'
+# 'false' sends every /api/search query through the embedding router
+LEXICAL_ROUTER = (os.getenv('LEXICAL_ROUTER') or 'true').lower() == 'true'
+# Socket of a shared encode process (launch.py); unset loads the model in this process
+ENCODE_SERVER = os.getenv('ENCODE_SERVER') or None
+ENCODE_SERVER_KEY = os.getenv('ENCODE_SERVER_KEY') or None
+# 'true' when launch.py preloads serve.py in the gunicorn master: per-process
+# threads are started in each worker after the fork (start_background)
+SERVE_PRELOAD = (os.getenv('SERVE_PRELOAD') or 'false').lower() == 'true'
+
+# === Embeddings & Routing ===
+if ENCODE_SERVER:
+    # One model for every worker, in the encode process; it also batches their requests
+    sbertEmbedding = batchedEmbedding = RemoteEmbedding(
+        ENCODE_SERVER, authkey=ENCODE_SERVER_KEY.encode() if ENCODE_SERVER_KEY else None,
+        connectTimeout=float(os.getenv('ENCODE_SERVER_TIMEOUT') or 120),
+        requestTimeout=float(os.getenv('ENCODE_SERVER_REQUEST_TIMEOUT') or 30),
+    )
+else:
+    # Router, RAG and /ask all share one model instance via the embeddings registry
+    sbertEmbedding = SBERTEmbedding(
+        EMBEDDING_MODEL, device=EMBEDDING_DEVICE, backend=EMBEDDING_BACKEND, threads=EMBEDDING_THREADS
+    )
+    # Concurrent request threads share encode batches instead of encoding one query each
+    batchedEmbedding = MicroBatchEncoder(
+        sbertEmbedding,
+        maxBatchSize=int(os.getenv('EMBEDDING_MAX_BATCH') or 32),
+        maxWaitMs=float(os.getenv('EMBEDDING_MAX_WAIT_MS') or 5),
+    )
+# Every query encode (router, RAG, /ask) goes through one normalized-text cache
+embeddingCache = EmbeddingCache(
+    maxSize=int(os.getenv('EMBEDDING_CACHE_SIZE') or 10000),
+    ttl=float(os.getenv('EMBEDDING_CACHE_TTL')) if os.getenv('EMBEDDING_CACHE_TTL') else None,
+    path=os.getenv('EMBEDDING_CACHE_PATH') or None,
+)
+# Vectors differ slightly between backends (torch, onnx, int8): they never share entries
+queryEmbedding = CachedEmbedding(
+    batchedEmbedding, embeddingCache, namespace=f"{sbertEmbedding.name}:{sbertEmbedding.backend}"
+)
+routes = [
+    Route(name='products', samples=productsSample, keywords=productsKeywords),
+    Route(name='chitchat', samples=chitchatSample, phrases=chitchatPhrases),
+]
+# Confident lexical decisions (brand names, greetings, close paraphrases of the
+# samples) skip the query encode; the rest goes to the embedding router. The answer
+# cache then only uses a vector already cached and encodes the query once it stores.
+semanticRouter = TieredRouter(
+    SemanticRouter(
+        queryEmbedding,
+        routes=routes,
+        # Route embeddings are reused across restarts until the model or samples change
+        cacheDir=os.getenv('ROUTE_CACHE_DIR') or os.path.join('.cache', 'routes'),
+    ),
+    lexical=LexicalRouter(
+        routes, threshold=float(os.getenv('LEXICAL_ROUTER_THRESHOLD') or 0.9),
+    ) if LEXICAL_ROUTER else None,
+)
+
+# === Conversation memory ===
+# Older turns are folded into a per-conversation summary; recent turns stay verbatim
+conversationMemory = ConversationMemory(
+    llm=openai.OpenAI(api_key=OPEN_AI_KEY),
+    recentTurns=int(os.getenv('MEMORY_RECENT_TURNS') or 6),
+    maxTokens=int(os.getenv('MEMORY_MAX_TOKENS') or 2000),
+)
+
+# === Retrievers ===
+# Both collections share one pooled client (rag.mongo)
+mongo_collection = get_collection(MONGODB_URI, ASK_DB_NAME, ASK_DB_COLLECTION)
+if RETRIEVER_BACKEND == 'local':
+    localIndex = LocalVectorIndex.load(LOCAL_INDEX_PATH)
+    searchRetriever = LocalRetriever(localIndex, queryEmbedding, fields=SEARCH_FIELDS)
+    askRetriever = LocalRetriever(localIndex, queryEmbedding, fields=ASK_FIELDS)
+elif RETRIEVER_BACKEND == 'atlas':
+    searchRetriever = AtlasRetriever(
+        get_collection(MONGODB_URI, DB_NAME, DB_COLLECTION), queryEmbedding,
+        fields=SEARCH_FIELDS, name="search",
+    )
+    askRetriever = AtlasRetriever(
+        mongo_collection, queryEmbedding, fields=ASK_FIELDS, numCandidates=300, name="ask",
+    )
+else:
+    raise ValueError(f"Unknown RETRIEVER_BACKEND '{RETRIEVER_BACKEND}', expected 'atlas' or 'local'")
+
+searchLexicalIndex = askLexicalIndex = None
+if HYBRID_SEARCH:
+    if RETRIEVER_BACKEND == 'local':
+        searchLexicalIndex = askLexicalIndex = BM25Index(localIndex.documents)
+    else:
+        askLexicalIndex = BM25Index.from_collection(mongo_collection, fields=ASK_FIELDS)
+        searchLexicalIndex = askLexicalIndex
+        if (DB_NAME, DB_COLLECTION) != (ASK_DB_NAME, ASK_DB_COLLECTION):
+            searchLexicalIndex = BM25Index.from_collection(
+                get_collection(MONGODB_URI, DB_NAME, DB_COLLECTION), fields=SEARCH_FIELDS
+            )
+    searchRetriever = HybridRetriever(searchRetriever, searchLexicalIndex)
+    askRetriever = HybridRetriever(askRetriever, askLexicalIndex)
+
+reranker = None
+if RERANK_MODEL:
+    reranker = CrossEncoderReranker(
+        RERANK_MODEL,
+        threshold=float(os.getenv('RERANK_THRESHOLD')) if os.getenv('RERANK_THRESHOLD') else None,
+        latencyBudgetMs=float(os.getenv('RERANK_BUDGET_MS') or 150),
+        device=EMBEDDING_DEVICE,
+        maxPending=int(os.getenv('RERANK_MAX_PENDING') or 4),
+    )
+    rerankCandidates = int(os.getenv('RERANK_CANDIDATES') or 10)
+    searchRetriever = RerankingRetriever(searchRetriever, reranker, candidates=rerankCandidates)
+    askRetriever = RerankingRetriever(askRetriever, reranker, candidates=rerankCandidates)
+
+# === Semantic answer cache for /api/search and /ask ===
+def answer_collections_version():
+    """Fingerprints of every collection an answer reads from: /api/search's and /ask's."""
+    return tuple(collection_version(get_collection(MONGODB_URI, *key)) for key in ANSWER_COLLECTIONS)
+
+ANSWER_COLLECTIONS = list(dict.fromkeys([(DB_NAME, DB_COLLECTION), (ASK_DB_NAME, ASK_DB_COLLECTION)]))
+
+# With the product watcher, answers are dropped on every product change instead of
+# polling the collection fingerprints, so they can live much longer.
+answerCache = SemanticAnswerCache(
+    threshold=float(os.getenv('ANSWER_CACHE_THRESHOLD') or 0.95),
+    ttl=float(os.getenv('ANSWER_CACHE_TTL') or (86400 if WATCH_PRODUCTS else 600)),
+    maxSize=int(os.getenv('ANSWER_CACHE_SIZE') or 1000),
+    versionFn=answer_collections_version if RETRIEVER_BACKEND == 'atlas' and not WATCH_PRODUCTS else None,
+)
+
+# === Single-flight: concurrent identical questions share the leader's answer ===
+singleFlight = SingleFlight(maxWait=float(os.getenv('SINGLE_FLIGHT_MAX_WAIT') or 15)) if SINGLE_FLIGHT else None
+
+# === Product watchers ===
+productWatchers = []
+if WATCH_PRODUCTS:
+    from rag.watcher import ProductWatcher
+
+    # (db, collection) -> what was built from it; the local index comes from DB_COLLECTION
+    watched = {
+        (DB_NAME, DB_COLLECTION): [snippetCache, answerCache],
+        (ASK_DB_NAME, ASK_DB_COLLECTION): [snippetCache, answerCache],
+    }
+    if reranker is not None:
+        for sinks in watched.values():
+            sinks.append(reranker)
+    if RETRIEVER_BACKEND == 'local':
+        watched[(DB_NAME, DB_COLLECTION)].append(localIndex)
+        if searchLexicalIndex is not None:
+            watched[(DB_NAME, DB_COLLECTION)].append(searchLexicalIndex)
+    elif searchLexicalIndex is not None:
+        watched[(DB_NAME, DB_COLLECTION)].append(searchLexicalIndex)
+        if askLexicalIndex is not searchLexicalIndex:
+            watched[(ASK_DB_NAME, ASK_DB_COLLECTION)].append(askLexicalIndex)
+
+    for (dbName, dbCollection), sinks in watched.items():
+        productWatchers.append(ProductWatcher(
+            get_collection(MONGODB_URI, dbName, dbCollection),
+            sinks,
+            withEmbedding=RETRIEVER_BACKEND == 'local' and localIndex in sinks,
+            mode=os.getenv('WATCH_MODE') or 'auto',
+            pollInterval=float(os.getenv('WATCH_POLL_INTERVAL') or 5),
+            name=f"{dbName}.{dbCollection}",
+        ))
+
+_backgroundPid = None
+
+def start_background():
+    """
+    Start this process's product watchers (threads do not survive a fork) and
+    make sure the updated_at index the answer cache's version poll reads exists; idempotent.
+    """
+    global _backgroundPid
+    if _backgroundPid == os.getpid():
+        return
+    _backgroundPid = os.getpid()
+    if answerCache.versionFn is not None:
+        for key in ANSWER_COLLECTIONS:
+            ensure_version_index(get_collection(MONGODB_URI, *key))
+    for watcher in productWatchers:
+        watcher.start()
+
+# === Prompt for /ask ===
+def build_prompt(user_query, search_results):
+    # Product blocks come pre-rendered from the shared snippet cache
+    return ASK_PROMPT.format(query=user_query, context=render_ask_context(search_results))
+
+# === Metrics (/metrics) ===
+# Component counters are read at scrape time; request stages are recorded by RequestTrace
+metrics.register_stats('embedding_cache', embeddingCache.stats)
+metrics.register_stats('embedding_remote' if ENCODE_SERVER else 'embedding_batcher', batchedEmbedding.stats)
+metrics.register_stats('answer_cache', answerCache.stats)
+metrics.register_stats('snippet_cache', snippetCache.stats)
+metrics.register_stats('router', semanticRouter.stats)
+metrics.register_stats('memory', conversationMemory.stats)
+metrics.register_stats('mongo_query', queryStats.stats, by='query')
+if singleFlight is not None:
+    metrics.register_stats('single_flight', singleFlight.stats)
+if reranker is not None:
+    metrics.register_stats('reranker', reranker.stats)
+if productWatchers:
+    metrics.register_stats(
+        'product_watcher', lambda: {watcher.name: watcher.stats() for watcher in productWatchers}, by='collection'
+    )
@@ -1,5 +1,23 @@
 from embeddings.base import BaseEmbedding, APIBaseEmbedding, EmbeddingConfig
-from embeddings.sentenceTransformer import SentenceTransformerEmbedding
-from embeddings.openai import OpenAIEmbedding
-from embeddings.google import GoogleEmbedding
+from embeddings.registry import EmbeddingRegistry, SharedModel, get_shared_model
 
+# Provider backends pull in heavy SDKs (sentence_transformers, openai, vertexai,
+# mistralai, fastembed); they are only imported when first accessed.
+_LAZY_IMPORTS = {
+    "SentenceTransformerEmbedding": "embeddings.sentenceTransformer",
+    "SBERTEmbedding": "embeddings.sbert",
+    "OpenAIEmbedding": "embeddings.openai",
+    "GoogleEmbedding": "embeddings.google",
+    "MistralEmbedding": "embeddings.mistral",
+    "FastEmbedding": "embeddings.fastEmbed",
+}
+
+
+def __getattr__(name):
+    module = _LAZY_IMPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module 'embeddings' has no attribute '{name}'")
+    import importlib
+    value = getattr(importlib.import_module(module), name)
+    globals()[name] = value
+    return value
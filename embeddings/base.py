@@ -1,5 +1,10 @@
 from pydantic.v1 import BaseModel, Field, validator
-from typing import Any, Optional
+from typing import List, Optional, Union
+from concurrent.futures import ThreadPoolExecutor
+import random
+import time
+
+import numpy as np
 
 class EmbeddingConfig(BaseModel):
     name: str = Field(..., description="The name of the SentenceTransformer model")
@@ -11,21 +16,145 @@ class EmbeddingConfig(BaseModel):
         return value
 
 class BaseEmbedding():
+    """
+    Encoder contract: `encode(List[str])` returns a C-contiguous float32 array
+    of shape (n, dim); `encode(str)` returns the single (dim,) row. When
+    `normalized` is true, rows are L2-normalized. Convert to lists only where
+    a driver needs them (e.g. a Mongo `queryVector`).
+    """
     name: str
+    dim: Optional[int] = None
+    normalized: bool = False
 
-    def __init__(self, name: str):
+    def __init__(self, name: str, normalize: bool = False):
         super().__init__()
         self.name = name
+        self.normalized = normalize
 
-    def encode(self, text: str):
+    def encode(self, text: Union[str, List[str]]):
         raise NotImplementedError("The encode method must be implemented by subclasses")
 
+    def _as_embeddings(self, vectors, single: bool = False):
+        """Coerce encoder output to the contract, copying only when the input is not float32/contiguous."""
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        if vectors.ndim == 1:
+            vectors = vectors.reshape(1, -1)
+        if self.normalized and vectors.size:
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            vectors /= norms
+        if self.dim is None and vectors.size:
+            self.dim = vectors.shape[1]
+        return vectors[0] if single else vectors
+
+
+def estimate_tokens(text: str) -> int:
+    # ~3 characters per token is a safe upper bound for Vietnamese and English
+    return len(text) // 3 + 1
+
+
+def truncate_tokens(text: str, limit: int) -> str:
+    """`text` cut to at most `limit` estimated tokens."""
+    if estimate_tokens(text) <= limit:
+        return text
+    return text[:3 * max(limit - 1, 0)]
+
 
 class APIBaseEmbedding(BaseEmbedding):
+    """
+    Base for hosted embedding APIs.
+
+    `encode` cuts every text to the model's `tokenLimit` estimated tokens,
+    splits the input into requests of at most `maxBatchSize` texts and
+    `requestTokenLimit` estimated tokens (None: no token budget), sends up to
+    `maxConcurrency` of them at once, retries rate-limited (429) and transient
+    (5xx) failures with exponential backoff, and returns one float32 array in
+    input order.
+    Subclasses implement `_encode_batch` for a single request.
+    """
     baseUrl: str
     apiKey: str
 
-    def __init__(self, name: str = None, baseUrl: str = None, apiKey: str = None):
-        super().__init__(name)
+    def __init__(
+            self,
+            name: str = None,
+            baseUrl: str = None,
+            apiKey: str = None,
+            maxBatchSize: int = 256,
+            tokenLimit: int = 8192,
+            requestTokenLimit: Optional[int] = None,
+            maxConcurrency: int = 4,
+            maxRetries: int = 6,
+            normalize: bool = False,
+        ):
+        super().__init__(name, normalize=normalize)
         self.baseUrl = baseUrl
         self.apiKey = apiKey
+        self.maxBatchSize = maxBatchSize
+        self.tokenLimit = tokenLimit
+        self.requestTokenLimit = requestTokenLimit
+        self.maxConcurrency = maxConcurrency
+        self.maxRetries = maxRetries
+
+    def _encode_batch(self, docs: List[str]) -> List[List[float]]:
+        raise NotImplementedError("The _encode_batch method must be implemented by subclasses")
+
+    def _batches(self, docs: List[str]):
+        batch, tokens = [], 0
+        for doc in docs:
+            doc = truncate_tokens(doc, self.tokenLimit)
+            docTokens = estimate_tokens(doc)
+            full = len(batch) >= self.maxBatchSize or (
+                self.requestTokenLimit is not None and tokens + docTokens > self.requestTokenLimit
+            )
+            if batch and full:
+                yield batch
+                batch, tokens = [], 0
+            batch.append(doc)
+            tokens += docTokens
+        if batch:
+            yield batch
+
+    @staticmethod
+    def _is_retryable(error: Exception) -> bool:
+        status = (
+            getattr(error, "status_code", None)  # openai
+            or getattr(error, "http_status", None)  # mistralai
+            or getattr(error, "code", None)  # google.api_core
+        )
+        if isinstance(status, int):
+            return status == 429 or status >= 500
+        name = type(error).__name__
+        return "RateLimit" in name or "ResourceExhausted" in name or "Timeout" in name or "429" in str(error)
+
+    def _encode_with_retry(self, docs: List[str]):
+        for attempt in range(self.maxRetries + 1):
+            try:
+                return self._encode_batch(docs)
+            except Exception as e:
+                if attempt == self.maxRetries or not self._is_retryable(e):
+                    raise
+                # 0.5s, 1s, 2s, ... capped at 30s, with jitter so workers do not retry in lockstep
+                time.sleep(min(30.0, 0.5 * 2 ** attempt) * (0.5 + random.random()))
+
+    def encode(self, docs: Union[str, List[str]]):
+        single = isinstance(docs, str)
+        docs = [docs] if single else list(docs)
+        if not docs:
+            return np.empty((0, self.dim or 0), dtype=np.float32)
+
+        batches = list(self._batches(docs))
+        try:
+            if len(batches) == 1 or self.maxConcurrency <= 1:
+                results = [self._encode_with_retry(batch) for batch in batches]
+            else:
+                with ThreadPoolExecutor(max_workers=min(self.maxConcurrency, len(batches))) as executor:
+                    results = list(executor.map(self._encode_with_retry, batches))
+        except Exception as e:
+            raise ValueError(
+                f"Failed to get embeddings from {type(self).__name__}. Error details: {e}"
+            ) from e
+
+        if len(results) == 1:
+            return self._as_embeddings(results[0], single)
+        return self._as_embeddings(np.concatenate([np.asarray(r, dtype=np.float32) for r in results]), single)
@@ -0,0 +1,99 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import List, Union
+
+import numpy as np
+
+
+class MicroBatchEncoder():
+    """
+    Collects texts from concurrent request threads and encodes them together.
+
+    A background worker flushes the queue as one `encode` call once
+    `maxBatchSize` texts are waiting or the oldest one has waited `maxWaitMs`.
+    Wraps any encoder with an `encode(List[str])` method (SBERTEmbedding,
+    SentenceTransformerEmbedding, ...) and exposes the same interface.
+    """
+
+    def __init__(self, embedding, maxBatchSize: int = 32, maxWaitMs: float = 5.0):
+        self.embedding = embedding
+        self.maxBatchSize = maxBatchSize
+        self.maxWait = maxWaitMs / 1000.0
+        self.batches = 0
+        self.texts = 0
+
+        self._forkLock = threading.Lock()
+        self._start_worker()
+
+    def _start_worker(self):
+        # Also called in a forked child (launch.py workers): the parent's thread and queue do not exist there
+        self._queue = queue.Queue()
+        self._worker = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+        self._worker.start()
+        self._pid = os.getpid()
+
+    def __getattr__(self, attr):
+        # name, dim, normalized, backend, ... of the wrapped encoder
+        if attr == 'embedding':
+            raise AttributeError(attr)
+        return getattr(self.embedding, attr)
+
+    def encode(self, texts: Union[str, List[str]]):
+        single = isinstance(texts, str)
+        batch = [texts] if single else list(texts)
+        if not batch:
+            return np.empty((0, getattr(self, 'dim', None) or 0), dtype=np.float32)
+
+        if self._pid != os.getpid():
+            with self._forkLock:
+                if self._pid != os.getpid():
+                    self._start_worker()
+        future = Future()
+        self._queue.put((batch, future))
+        embeddings = future.result()
+        return embeddings[0] if single else embeddings
+
+    def _collect(self):
+        pending = [self._queue.get()]
+        size = len(pending[0][0])
+        deadline = time.monotonic() + self.maxWait
+
+        while size < self.maxBatchSize:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            pending.append(item)
+            size += len(item[0])
+        return pending
+
+    def _run(self):
+        while True:
+            pending = self._collect()
+            texts = [text for batch, _ in pending for text in batch]
+            try:
+                embeddings = np.asarray(self.embedding.encode(texts), dtype=np.float32)
+            except Exception as e:
+                for _, future in pending:
+                    future.set_exception(e)
+                continue
+
+            self.batches += 1
+            self.texts += len(texts)
+            offset = 0
+            for batch, future in pending:
+                future.set_result(embeddings[offset:offset + len(batch)])
+                offset += len(batch)
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "texts": self.texts,
+            "mean_batch_size": self.texts / self.batches if self.batches else 0.0,
+        }
@@ -0,0 +1,224 @@
+import atexit
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import List, Optional, Union
+
+import numpy as np
+
+
+def normalize_text(text: str) -> str:
+    """Cache key for a text: NFC, collapsed whitespace, case-folded."""
+    return ' '.join(unicodedata.normalize('NFC', text).split()).casefold()
+
+
+def strip_accents(text: str) -> str:
+    """'điện thoại' -> 'dien thoai', so unaccented typing matches accented text."""
+    decomposed = unicodedata.normalize('NFD', text.replace('đ', 'd').replace('Đ', 'D'))
+    return ''.join(char for char in decomposed if unicodedata.category(char) != 'Mn')
+
+
+class EmbeddingCache():
+    """
+    Bounded LRU cache of float32 embeddings with an optional TTL.
+
+    When `path` is given, entries are also kept in a SQLite file and looked
+    up there on a memory miss, so the cache survives restarts. New entries
+    are written in batches, one transaction per `flushSize` entries or every
+    `flushInterval` seconds, and SQLite is never used under the cache lock.
+    """
+
+    def __init__(
+            self,
+            maxSize: int = 10000,
+            ttl: Optional[float] = None,
+            path: Optional[str] = None,
+            flushSize: int = 64,
+            flushInterval: float = 1.0,
+        ):
+        self.maxSize = maxSize
+        self.ttl = ttl
+        self.path = path
+        self.flushSize = flushSize
+        self.flushInterval = flushInterval
+        self.hits = 0
+        self.misses = 0
+        self.flushes = 0
+
+        self._entries = OrderedDict()
+        self._pending = []
+        self._lock = threading.Lock()
+        # Serializes use of the SQLite connection
+        self._dbLock = threading.Lock()
+        self._db = None
+        self._dbPid = None
+        self._flusherPid = None
+        if path:
+            self._db = self._connect()
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings "
+                "(key TEXT PRIMARY KEY, vector BLOB NOT NULL, created REAL NOT NULL)"
+            )
+            if ttl is not None:
+                self._db.execute("DELETE FROM embeddings WHERE created < ?", (time.time() - ttl,))
+            self._db.commit()
+            atexit.register(self.flush)
+
+    def _connect(self):
+        # A SQLite connection must not be used across fork (launch.py workers): each process opens its own
+        self._dbPid = os.getpid()
+        return sqlite3.connect(self.path, check_same_thread=False)
+
+    def _connection(self):
+        if self._db is not None and self._dbPid != os.getpid():
+            self._db = self._connect()
+        return self._db
+
+    def _expired(self, created: float) -> bool:
+        return self.ttl is not None and time.time() - created > self.ttl
+
+    def get(self, key: str, record: bool = True) -> Optional[np.ndarray]:
+        """Cached vector or None; `record=False` leaves the hit/miss counters alone."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._expired(entry[1]):
+                del self._entries[key]
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += record
+                return entry[0]
+
+        if self._db is not None:
+            with self._dbLock:
+                row = self._connection().execute(
+                    "SELECT vector, created FROM embeddings WHERE key = ?", (key,)
+                ).fetchone()
+            if row is not None and not self._expired(row[1]):
+                entry = (np.frombuffer(row[0], dtype=np.float32), row[1])
+
+        with self._lock:
+            if entry is None:
+                self.misses += record
+                return None
+            self._store(key, entry)
+            self.hits += record
+            return entry[0]
+
+    def set(self, key: str, vector: np.ndarray):
+        vector = np.ascontiguousarray(vector, dtype=np.float32)
+        created = time.time()
+        with self._lock:
+            self._store(key, (vector, created))
+            if self._db is None:
+                return
+            self._pending.append((key, vector.tobytes(), created))
+            flushNow = len(self._pending) >= self.flushSize
+            # Threads do not survive a fork: each process starts its own flusher
+            startFlusher = self._flusherPid != os.getpid()
+            self._flusherPid = os.getpid()
+        if startFlusher:
+            threading.Thread(target=self._flush_loop, name="embedding-cache-flush", daemon=True).start()
+        if flushNow:
+            self.flush()
+
+    def flush(self):
+        """Write the pending entries to SQLite in one transaction."""
+        with self._lock:
+            rows, self._pending = self._pending, []
+        if not rows:
+            return
+        with self._dbLock:
+            db = self._connection()
+            db.executemany("INSERT OR REPLACE INTO embeddings (key, vector, created) VALUES (?, ?, ?)", rows)
+            db.commit()
+        with self._lock:
+            self.flushes += 1
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flushInterval)
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"⚠️ Embedding cache flush failed: {e}")
+
+    def _store(self, key: str, entry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxSize:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._pending = []
+        if self._db is not None:
+            with self._dbLock:
+                db = self._connection()
+                db.execute("DELETE FROM embeddings")
+                db.commit()
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "pending_writes": len(self._pending),
+                "flushes": self.flushes,
+            }
+
+
+class CachedEmbedding():
+    """
+    Encoder wrapper that serves repeated texts from an EmbeddingCache.
+
+    Texts that differ only in case or whitespace share one entry. Misses are
+    encoded together in one call to the wrapped encoder.
+    """
+
+    def __init__(self, embedding, cache: EmbeddingCache, namespace: str = ''):
+        self.embedding = embedding
+        self.cache = cache
+        self.namespace = namespace
+
+    def __getattr__(self, attr):
+        # name, dim, normalized, backend, ... of the wrapped encoder
+        if attr == 'embedding':
+            raise AttributeError(attr)
+        return getattr(self.embedding, attr)
+
+    def _key(self, text: str) -> str:
+        return f"{self.namespace}|{normalize_text(text)}"
+
+    def cached(self, text: str) -> Optional[np.ndarray]:
+        """The vector of `text` if it is already cached, else None; never encodes."""
+        return self.cache.get(self._key(text), record=False)
+
+    def encode(self, texts: Union[str, List[str]]):
+        single = isinstance(texts, str)
+        batch = [texts] if single else list(texts)
+
+        keys = [self._key(text) for text in batch]
+        vectors = [self.cache.get(key) for key in keys]
+
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            encoded = np.asarray(
+                self.embedding.encode([batch[i] for i in missing]), dtype=np.float32
+            )
+            for i, vector in zip(missing, encoded):
+                self.cache.set(keys[i], vector)
+                vectors[i] = vector
+
+        if single:
+            return vectors[0]
+        if not vectors:
+            return np.empty((0, getattr(self, 'dim', None) or 0), dtype=np.float32)
+        return np.stack(vectors)
@@ -1,5 +1,6 @@
 import os
 from typing import Optional, Union, List
+import numpy as np
 from fastembed import TextEmbedding
 from embeddings import BaseEmbedding
 
@@ -8,9 +9,10 @@ class FastEmbedding(BaseEmbedding):
             self,
             # Multilingual model
             name: str = 'BAAI/bge-m3',
-            max_length:int = 512
+            max_length:int = 512,
+            normalize: bool = False,
         ):
-        super().__init__(name=name)
+        super().__init__(name=name, normalize=normalize)
         
         try:
             self.embedding_model = TextEmbedding(
@@ -22,11 +24,14 @@ class FastEmbedding(BaseEmbedding):
                 f"Fastembed failed to initialize. Error: {e}"
             ) from e
 
-    def encode(self, docs: List[str]):
+    def encode(self, docs: Union[str, List[str]]):
+        single = isinstance(docs, str)
         try:
-            embeds = self.embedding_model.embed(docs)
-            embeddings: List[List[float]] = [e.tolist() for e in embeds]
-            return embeddings
+            # fastembed yields one ndarray per document; stack them once
+            embeds = list(self.embedding_model.embed([docs] if single else docs))
+            if not embeds:
+                return np.empty((0, self.dim or 0), dtype=np.float32)
+            return self._as_embeddings(np.stack(embeds), single)
         except Exception as e:
             raise ValueError(
                 f"Failed to get embeddings. Error details: {e}"
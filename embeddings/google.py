@@ -3,7 +3,6 @@
 
 from embeddings import APIBaseEmbedding
 import os
-import openai
 from typing import Any, List, Optional
 from dotenv import load_dotenv
 load_dotenv()
@@ -13,13 +12,20 @@ class GoogleEmbedding(APIBaseEmbedding):
         self,
         name: str = "textembedding-gecko@003",
         dimensions: int = 768,
-        token_limit: int = 8192,
+        token_limit: int = 2048,
+        request_token_limit: int = 20000,
         baseUrl: str = None,
         apiKey: str = None,
         projectId: str = None,
         location: str = None,
+        max_batch_size: int = 250,
+        max_concurrency: int = 4,
     ):
-        super().__init__(name=name, baseUrl=baseUrl, apiKey=apiKey)
+        super().__init__(
+            name=name, baseUrl=baseUrl, apiKey=apiKey,
+            maxBatchSize=max_batch_size, tokenLimit=token_limit, requestTokenLimit=request_token_limit,
+            maxConcurrency=max_concurrency,
+        )
         self.name = name
 
         try:
@@ -49,10 +55,7 @@ class GoogleEmbedding(APIBaseEmbedding):
                 f"Failed to initialize Google AI Platform client. Error: {err}"
             ) from err
 
-    def encode(self, docs: List[str]):
-        try:
-            embeddings = self.client.get_embeddings(docs)
-            return [embedding.values for embedding in embeddings]
-        except Exception as e:
-            raise ValueError(f"Google AI Platform API call failed. Error: {e}") from e
+    def _encode_batch(self, docs: List[str]):
+        embeddings = self.client.get_embeddings(docs)
+        return [embedding.values for embedding in embeddings]
         
\ No newline at end of file
@@ -8,8 +8,16 @@ class MistralEmbedding(APIBaseEmbedding):
             self,
             name: str = "mistral-embed",
             apiKey: str = None,
+            token_limit: int = 8192,
+            request_token_limit: int = 16384,
+            max_batch_size: int = 128,
+            max_concurrency: int = 2,
         ):
-        super().__init__(name=name, apiKey=apiKey)
+        super().__init__(
+            name=name, apiKey=apiKey,
+            maxBatchSize=max_batch_size, tokenLimit=token_limit, requestTokenLimit=request_token_limit,
+            maxConcurrency=max_concurrency,
+        )
         self.apiKey = apiKey or os.getenv("MISTRAL_KEY")
         
         if not self.apiKey:
@@ -24,15 +32,9 @@ class MistralEmbedding(APIBaseEmbedding):
                 f"Mistral API client failed to initialize. Error: {e}"
             ) from e
 
-    def encode(self, docs: List[str]):
-        try:
-            embeds = self.client.embeddings(
-                    input=docs,
-                    model=self.name,
-                )
-            embeddings = [embeds_obj.embedding for embeds_obj in embeds.data]
-            return embeddings
-        except Exception as e:
-            raise ValueError(
-                f"Failed to get embeddings. Error details: {e}"
-            ) from e
\ No newline at end of file
+    def _encode_batch(self, docs: List[str]):
+        embeds = self.client.embeddings(
+                input=docs,
+                model=self.name,
+            )
+        return [embeds_obj.embedding for embeds_obj in embeds.data]
\ No newline at end of file
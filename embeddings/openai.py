@@ -11,13 +11,21 @@ class OpenAIEmbedding(APIBaseEmbedding):
             self,
             name: str = "text-embedding-3-small",
             dimensions: int = 768,
-            token_limit: int = 8192,
+            token_limit: int = 8191,
+            request_token_limit: int = 300000,
             baseUrl: str = None,
             apiKey: str = None,
             orgId: str = None,
+            max_batch_size: int = 2048,
+            max_concurrency: int = 4,
         ):
-        super().__init__(name=name, baseUrl=baseUrl, apiKey=apiKey)
+        super().__init__(
+            name=name, baseUrl=baseUrl, apiKey=apiKey,
+            maxBatchSize=max_batch_size, tokenLimit=token_limit, requestTokenLimit=request_token_limit,
+            maxConcurrency=max_concurrency,
+        )
         self.dimensions = dimensions
+        self.dim = dimensions
         self.apiKey = apiKey or os.getenv("OPENAI_API_KEY")
         self.orgId = orgId or os.getenv("OPENAI_ORG_ID")
         self.baseUrl = orgId or os.getenv("OPENAI_BASE_URL")
@@ -34,16 +42,10 @@ class OpenAIEmbedding(APIBaseEmbedding):
                 f"OpenAI API client failed to initialize. Error: {e}"
             ) from e
 
-    def encode(self, docs: List[str]):
-        try:
-            embeds = self.client.embeddings.create(
-                    input=docs,
-                    model=self.name,
-                    dimensions=self.dimensions,
-                )
-            embeddings = [embeds_obj.embedding for embeds_obj in embeds.data]
-            return embeddings
-        except Exception as e:
-            raise ValueError(
-                f"Failed to get embeddings. Error details: {e}"
-            ) from e
\ No newline at end of file
+    def _encode_batch(self, docs: List[str]):
+        embeds = self.client.embeddings.create(
+                input=docs,
+                model=self.name,
+                dimensions=self.dimensions,
+            )
+        return [embeds_obj.embedding for embeds_obj in embeds.data]
\ No newline at end of file
@@ -0,0 +1,63 @@
+# Accuracy/latency parity of an accelerated embedding backend against PyTorch:
+#   python -m embeddings.parity --backend onnx-int8 --threads 4
+
+import argparse
+import time
+
+import numpy as np
+
+from embeddings.registry import get_shared_model
+
+
+def _timed_encode(shared, texts, repeats):
+    shared.encode(texts[:8])  # warm-up
+    start = time.perf_counter()
+    for _ in range(repeats):
+        vectors = shared.encode(texts, convert_to_numpy=True)
+    return np.asarray(vectors, dtype=np.float32), (time.perf_counter() - start) / repeats
+
+
+def parity_check(name: str, backend: str, texts, threads: int = None, repeats: int = 3):
+    """Compare `backend` with the torch reference on `texts`: cosine agreement and encode speed."""
+    reference = get_shared_model(name, "cpu", backend="torch", threads=threads)
+    candidate = get_shared_model(name, "cpu", backend=backend, threads=threads)
+
+    expected, referenceSeconds = _timed_encode(reference, texts, repeats)
+    actual, candidateSeconds = _timed_encode(candidate, texts, repeats)
+
+    expected /= np.linalg.norm(expected, axis=1, keepdims=True)
+    actual /= np.linalg.norm(actual, axis=1, keepdims=True)
+    cosines = (expected * actual).sum(axis=1)
+
+    # Same nearest neighbour among the samples for every text?
+    sameNeighbour = ((expected @ expected.T).argsort(axis=1)[:, -2] == (actual @ actual.T).argsort(axis=1)[:, -2])
+    return {
+        "backend": backend,
+        "texts": len(texts),
+        "min_cosine": float(cosines.min()),
+        "mean_cosine": float(cosines.mean()),
+        "neighbour_agreement": float(sameNeighbour.mean()),
+        "torch_ms": referenceSeconds * 1000,
+        "backend_ms": candidateSeconds * 1000,
+        "speedup": referenceSeconds / candidateSeconds if candidateSeconds else 0.0,
+        "torch_memory_bytes": reference.memoryBytes,
+        "backend_memory_bytes": candidate.memoryBytes,
+    }
+
+
+if __name__ == "__main__":
+    from semantic_router.samples import productsSample, chitchatSample
+
+    parser = argparse.ArgumentParser(description="Check an embedding backend against PyTorch on the route samples.")
+    parser.add_argument("--model", default="keepitreal/vietnamese-sbert")
+    parser.add_argument("--backend", default="onnx-int8", choices=["torch-int8", "onnx", "onnx-int8"])
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument("--min-cosine", type=float, default=0.98)
+    args = parser.parse_args()
+
+    result = parity_check(args.model, args.backend, productsSample + chitchatSample, threads=args.threads)
+    for key, value in result.items():
+        print(f"{key:>22}: {value:.4f}" if isinstance(value, float) else f"{key:>22}: {value}")
+    if result["min_cosine"] < args.min_cosine:
+        raise SystemExit(f"❌ min cosine {result['min_cosine']:.4f} < {args.min_cosine}")
+    print("✅ Parity OK")
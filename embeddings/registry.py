@@ -0,0 +1,196 @@
+import os
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+# Inference backends for a SentenceTransformer model:
+#   torch       - regular PyTorch weights
+#   torch-int8  - PyTorch with dynamically int8-quantized Linear layers (CPU)
+#   onnx        - ONNX Runtime export of the same model (CPU)
+#   onnx-int8   - ONNX Runtime with dynamic int8 quantization (CPU, AVX2)
+BACKENDS = ("torch", "torch-int8", "onnx", "onnx-int8")
+
+
+class SharedModel():
+    """A loaded SentenceTransformer shared by every encoder in the process."""
+
+    def __init__(
+            self,
+            name: str,
+            device: Optional[str],
+            model,
+            loadSeconds: float,
+            memoryBytes: int,
+            backend: str = "torch",
+        ):
+        self.name = name
+        self.device = device
+        self.backend = backend
+        self.model = model
+        self.loadSeconds = loadSeconds
+        self.memoryBytes = memoryBytes
+        # HF fast tokenizers are not safe to call from several threads at once.
+        self.lock = threading.Lock()
+
+    def encode(self, texts, **kwargs):
+        with self.lock:
+            return self.model.encode(texts, **kwargs)
+
+
+def _rss_bytes() -> Optional[int]:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+class EmbeddingRegistry():
+    """
+    Loaded models by (name, device, backend, threads).
+
+    ONNX Runtime threads belong to a session, so they are part of the key.
+    torch.set_num_threads is process-wide: torch models share one setting,
+    `torchThreads`, and a request for a different thread count is rejected
+    instead of silently changing it for every model (see set_torch_threads).
+    """
+
+    def __init__(self, cacheDir: str = None):
+        self._models: Dict[Tuple[str, Optional[str], str, Optional[int]], SharedModel] = {}
+        self._lock = threading.Lock()
+        self.torchThreads: Optional[int] = None
+        # Where ONNX exports are kept between restarts
+        self.cacheDir = cacheDir or os.getenv("EMBEDDING_ONNX_CACHE") or os.path.join(".cache", "onnx")
+
+    def get(
+            self,
+            name: str,
+            device: Optional[str] = None,
+            backend: str = "torch",
+            threads: Optional[int] = None,
+        ) -> SharedModel:
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown embedding backend '{backend}', expected one of {BACKENDS}")
+
+        onnx = backend.startswith("onnx")
+        if not onnx:
+            self._check_torch_threads(threads)
+        key = (name, device, backend, threads if onnx else None)
+        shared = self._models.get(key)
+        if shared is not None:
+            return shared
+
+        with self._lock:
+            # Another thread may have finished loading while we waited.
+            shared = self._models.get(key)
+            if shared is None:
+                if not onnx:
+                    self._check_torch_threads(threads)
+                shared = self._load(name, device, backend, threads)
+                self._models[key] = shared
+                if not onnx and threads:
+                    self.torchThreads = threads
+        return shared
+
+    def _check_torch_threads(self, threads: Optional[int]):
+        if threads and self.torchThreads and threads != self.torchThreads:
+            raise ValueError(
+                f"torch threads are process-wide and already set to {self.torchThreads}, "
+                f"cannot load a model with threads={threads}"
+            )
+
+    def set_torch_threads(self, threads: int):
+        """Change the process-wide torch thread count of every loaded torch model (e.g. after a fork)."""
+        import torch
+
+        with self._lock:
+            torch.set_num_threads(threads)
+            self.torchThreads = threads
+
+    def _load_onnx(self, name: str, threads: Optional[int], quantize: bool):
+        from sentence_transformers import SentenceTransformer
+        try:
+            import onnxruntime
+        except ImportError:
+            raise ImportError(
+                "To use the ONNX embedding backend, please install ONNX Runtime and Optimum "
+                "You can do this with the following command: "
+                "`pip install sentence-transformers[onnx]`"
+            )
+
+        sessionOptions = onnxruntime.SessionOptions()
+        if threads:
+            sessionOptions.intra_op_num_threads = threads
+        modelKwargs = {"provider": "CPUExecutionProvider", "session_options": sessionOptions}
+
+        if not quantize:
+            return SentenceTransformer(name, device="cpu", backend="onnx", model_kwargs=modelKwargs)
+
+        from sentence_transformers import export_dynamic_quantized_onnx_model
+
+        exportPath = os.path.join(self.cacheDir, name.replace("/", "__"))
+        quantizedFile = os.path.join("onnx", "model_qint8_avx2.onnx")
+        if not os.path.exists(os.path.join(exportPath, quantizedFile)):
+            model = SentenceTransformer(name, device="cpu", backend="onnx")
+            model.save(exportPath)
+            export_dynamic_quantized_onnx_model(model, "avx2", exportPath)
+        return SentenceTransformer(
+            exportPath, device="cpu", backend="onnx",
+            model_kwargs={**modelKwargs, "file_name": quantizedFile},
+        )
+
+    def _load(self, name: str, device: Optional[str], backend: str, threads: Optional[int]) -> SharedModel:
+        from sentence_transformers import SentenceTransformer
+
+        rssBefore = _rss_bytes()
+        start = time.perf_counter()
+        try:
+            if backend.startswith("onnx"):
+                model = self._load_onnx(name, threads, quantize=backend == "onnx-int8")
+            else:
+                import torch
+                if threads:
+                    torch.set_num_threads(threads)
+                model = SentenceTransformer(name, device="cpu" if backend == "torch-int8" else device)
+                if backend == "torch-int8":
+                    model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        except ImportError:
+            raise
+        except Exception as e:
+            raise ValueError(
+                f"Failed to load embedding model '{name}' ({backend}). Error: {e}"
+            ) from e
+        loadSeconds = time.perf_counter() - start
+
+        rssAfter = _rss_bytes()
+        if rssBefore is not None and rssAfter is not None:
+            memoryBytes = max(rssAfter - rssBefore, 0)
+        else:
+            memoryBytes = sum(p.numel() * p.element_size() for p in model.parameters())
+        print(f"✅ Loaded embedding model {name} ({backend}, {device or 'auto'}) "
+              f"in {loadSeconds:.2f}s, {memoryBytes / 2**20:.1f} MiB")
+        return SharedModel(name, device, model, loadSeconds, memoryBytes, backend=backend)
+
+    def stats(self):
+        return [
+            {
+                "name": shared.name,
+                "device": shared.device,
+                "backend": shared.backend,
+                "load_seconds": shared.loadSeconds,
+                "memory_bytes": shared.memoryBytes,
+            }
+            for shared in list(self._models.values())
+        ]
+
+
+registry = EmbeddingRegistry()
+
+
+def get_shared_model(
+        name: str,
+        device: Optional[str] = None,
+        backend: str = "torch",
+        threads: Optional[int] = None,
+    ) -> SharedModel:
+    return registry.get(name, device, backend, threads)
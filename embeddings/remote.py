@@ -0,0 +1,202 @@
+import os
+import threading
+import time
+import traceback
+from multiprocessing.connection import Client, Listener
+from typing import List, Optional, Union
+
+import numpy as np
+
+from embeddings.base import BaseEmbedding
+
+
+class EncodeServer():
+    """
+    Serves one in-process encoder to other processes over a local socket.
+
+    launch.py runs it in a dedicated process so the model is loaded once
+    for all gunicorn workers. Each client connection is handled by its own
+    thread; with a MicroBatchEncoder as `embedding`, concurrent requests
+    from every worker are encoded together.
+    """
+
+    def __init__(self, embedding, address: str, authkey: Optional[bytes] = None):
+        self.embedding = embedding
+        self.address = address
+        self.authkey = authkey
+        self.connections = 0
+
+    def info(self):
+        return {
+            "name": self.embedding.name,
+            "dim": getattr(self.embedding, 'dim', None),
+            "normalized": getattr(self.embedding, 'normalized', False),
+            "backend": getattr(self.embedding, 'backend', None),
+        }
+
+    def _handle(self, connection):
+        with connection:
+            while True:
+                try:
+                    op, payload = connection.recv()
+                except (EOFError, OSError):
+                    return
+                try:
+                    if op == "encode":
+                        reply = ("ok", np.asarray(self.embedding.encode(payload), dtype=np.float32))
+                    elif op == "info":
+                        reply = ("ok", self.info())
+                    else:
+                        reply = ("error", f"Unknown operation '{op}'")
+                except Exception as e:
+                    traceback.print_exc()
+                    reply = ("error", f"{type(e).__name__}: {e}")
+                try:
+                    connection.send(reply)
+                except (EOFError, OSError):
+                    return
+
+    def serve_forever(self):
+        if os.path.exists(self.address):
+            # Left behind by a previous run that was killed
+            os.unlink(self.address)
+        with Listener(self.address, family="AF_UNIX", authkey=self.authkey) as listener:
+            print(f"✅ Encode server for {self.embedding.name} listening on {self.address}")
+            while True:
+                try:
+                    connection = listener.accept()
+                except Exception as e:
+                    # e.g. AuthenticationError from a client with the wrong key
+                    print(f"⚠️ Encode server rejected a connection: {e}")
+                    continue
+                self.connections += 1
+                threading.Thread(target=self._handle, args=(connection,), name="encode-client", daemon=True).start()
+
+
+class RemoteEmbedding(BaseEmbedding):
+    """
+    Encoder backed by an EncodeServer in another process.
+
+    Same contract as the local encoders (`encode(List[str])` -> float32 array),
+    so it drops in under CachedEmbedding. Every thread keeps its own
+    connection, opened again in a forked child and after a broken pipe.
+    A reply that takes longer than `requestTimeout` raises TimeoutError and
+    drops the connection (a late reply must not answer the next request).
+    """
+
+    def __init__(
+            self,
+            address: str,
+            authkey: Optional[bytes] = None,
+            connectTimeout: float = 120.0,
+            requestTimeout: float = 30.0,
+        ):
+        self.address = address
+        self.authkey = authkey
+        self.connectTimeout = connectTimeout
+        self.requestTimeout = requestTimeout
+        self.calls = 0
+        self.texts = 0
+        self.reconnects = 0
+        self.timeouts = 0
+        self._local = threading.local()
+
+        # Waits for the server while its model is still loading
+        info = self._call("info", None, timeout=connectTimeout)
+        super().__init__(info["name"], normalize=info["normalized"])
+        self.dim = info["dim"]
+        self.backend = info["backend"]
+
+    def _connect(self, timeout: float):
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                return Client(self.address, family="AF_UNIX", authkey=self.authkey)
+            except (FileNotFoundError, ConnectionRefusedError):
+                if time.monotonic() >= deadline:
+                    raise ConnectionError(f"No encode server at {self.address} after {timeout:g}s")
+                time.sleep(0.1)
+
+    def _connection(self, timeout: float):
+        connection = getattr(self._local, "connection", None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = self._local.connection = self._connect(timeout)
+            self._local.pid = os.getpid()
+        return connection
+
+    def _drop(self, connection):
+        self._local.connection = None
+        try:
+            connection.close()
+        except OSError:
+            pass
+
+    def _call(self, op: str, payload, timeout: float = 5.0):
+        for attempt in range(2):
+            connection = self._connection(timeout)
+            try:
+                connection.send((op, payload))
+                replied = connection.poll(self.requestTimeout)
+                if replied:
+                    status, result = connection.recv()
+                    break
+            except (EOFError, OSError):
+                # Server restarted or the socket broke: reconnect once
+                self._drop(connection)
+                if attempt:
+                    raise
+                self.reconnects += 1
+                continue
+            # Stuck or overloaded server: the next call reconnects
+            self._drop(connection)
+            self.timeouts += 1
+            raise TimeoutError(f"No reply from the encode server within {self.requestTimeout:g}s")
+        if status != "ok":
+            raise RuntimeError(f"Encode server error: {result}")
+        return result
+
+    def encode(self, texts: Union[str, List[str]]):
+        single = isinstance(texts, str)
+        batch = [texts] if single else list(texts)
+        if not batch:
+            return np.empty((0, self.dim or 0), dtype=np.float32)
+        vectors = self._call("encode", batch)
+        self.calls += 1
+        self.texts += len(batch)
+        return vectors[0] if single else vectors
+
+    def stats(self):
+        return {
+            "calls": self.calls,
+            "texts": self.texts,
+            "reconnects": self.reconnects,
+            "timeouts": self.timeouts,
+        }
+
+
+def run_encode_server(address: str, authkey: Optional[bytes] = None):
+    """Load the configured SBERT model (same env as serve.py) and serve it until killed."""
+    from dotenv import load_dotenv
+    from embeddings.batcher import MicroBatchEncoder
+    from embeddings.sbert import SBERTEmbedding
+    load_dotenv()
+
+    embedding = SBERTEmbedding(
+        os.getenv('EMBEDDING_MODEL') or 'keepitreal/vietnamese-sbert',
+        device=os.getenv('EMBEDDING_DEVICE') or None,
+        backend=os.getenv('EMBEDDING_BACKEND') or 'torch',
+        threads=int(os.getenv('EMBEDDING_THREADS')) if os.getenv('EMBEDDING_THREADS') else None,
+    )
+    batched = MicroBatchEncoder(
+        embedding,
+        maxBatchSize=int(os.getenv('EMBEDDING_MAX_BATCH') or 32),
+        maxWaitMs=float(os.getenv('EMBEDDING_MAX_WAIT_MS') or 5),
+    )
+    EncodeServer(batched, address, authkey).serve_forever()
+
+
+if __name__ == "__main__":
+    # python -m embeddings.remote <socket path>; clients set ENCODE_SERVER to the same path
+    import sys
+    key = os.getenv('ENCODE_SERVER_KEY')
+    run_encode_server(sys.argv[1] if len(sys.argv) > 1 else "encode.sock", key.encode() if key else None)
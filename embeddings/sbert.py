@@ -1,9 +1,19 @@
 # embeddings/sbert.py
-from sentence_transformers import SentenceTransformer
+from typing import List, Union
+from embeddings.base import BaseEmbedding
+from embeddings.registry import get_shared_model
 
-class SBERTEmbedding:
-    def __init__(self, model_name='keepitreal/vietnamese-sbert'):
-        self.model = SentenceTransformer(model_name)
+class SBERTEmbedding(BaseEmbedding):
+    def __init__(self, model_name='keepitreal/vietnamese-sbert', device=None, normalize=False,
+                 backend='torch', threads=None):
+        super().__init__(model_name, normalize=normalize)
+        # backend: 'torch', 'torch-int8', 'onnx' or 'onnx-int8' (see embeddings.registry)
+        self.model = get_shared_model(model_name, device, backend=backend, threads=threads)
+        self.backend = backend
+        self.dim = self.model.model.get_sentence_embedding_dimension()
 
-    def encode(self, texts):
-        return self.model.encode(texts).tolist()
+    def encode(self, texts: Union[str, List[str]]):
+        vectors = self.model.encode(
+            texts, convert_to_numpy=True, normalize_embeddings=self.normalized
+        )
+        return self._as_embeddings(vectors, single=isinstance(texts, str))
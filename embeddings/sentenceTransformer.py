@@ -1,12 +1,18 @@
 from pydantic.v1 import BaseModel, Field, validator
 from embeddings import BaseEmbedding, EmbeddingConfig
-from sentence_transformers import SentenceTransformer
+from embeddings.registry import get_shared_model
 
 class SentenceTransformerEmbedding(BaseEmbedding):
-    def __init__(self, config: EmbeddingConfig):
-        super().__init__(config.name)
+    def __init__(self, config: EmbeddingConfig, device: str = None, normalize: bool = False,
+                 backend: str = 'torch', threads: int = None):
+        super().__init__(config.name, normalize=normalize)
         self.config = config
-        self.embedding_model = SentenceTransformer(self.config.name)
+        self.embedding_model = get_shared_model(self.config.name, device, backend=backend, threads=threads)
+        self.backend = backend
+        self.dim = self.embedding_model.model.get_sentence_embedding_dimension()
 
-    def encode(self, text: str):
-        return self.embedding_model.encode(text)
+    def encode(self, text):
+        vectors = self.embedding_model.encode(
+            text, convert_to_numpy=True, normalize_embeddings=self.normalized
+        )
+        return self._as_embeddings(vectors, single=isinstance(text, str))
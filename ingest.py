@@ -0,0 +1,269 @@
+# Bulk (re-)embedding of the product collection.
+#
+#   python ingest.py                                   # re-embed DB_COLLECTION in place
+#   python ingest.py --source jsonl --input products.jsonl --key-field url
+#   python ingest.py --backend sbert --workers 4         # one encoder process per core
+#   python ingest.py --backend openai --model text-embedding-3-small
+#
+# Documents whose text and model are unchanged (same `embedding_hash`) are not
+# re-encoded (edited JSONL fields such as the price are still written), and
+# progress is checkpointed so an interrupted run resumes (only with the same
+# source, target collection, backend and model).
+
+import argparse
+import datetime
+import hashlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from bson import json_util
+from dotenv import load_dotenv
+from pymongo import UpdateOne
+
+from rag.mongo import get_collection
+load_dotenv()
+
+DEFAULT_TEXT_FIELDS = ["title", "product_specs"]
+
+
+def make_embedding(backend: str, model: str = None):
+    """Any BaseEmbedding implementation by short backend name."""
+    if backend == "sbert":
+        from embeddings import SentenceTransformerEmbedding, EmbeddingConfig
+        return SentenceTransformerEmbedding(EmbeddingConfig(name=model or "keepitreal/vietnamese-sbert"))
+    if backend == "fastembed":
+        from embeddings.fastEmbed import FastEmbedding
+        return FastEmbedding(name=model) if model else FastEmbedding()
+    if backend == "openai":
+        from embeddings import OpenAIEmbedding
+        return OpenAIEmbedding(name=model) if model else OpenAIEmbedding()
+    if backend == "mistral":
+        from embeddings.mistral import MistralEmbedding
+        return MistralEmbedding(name=model) if model else MistralEmbedding()
+    if backend == "google":
+        from embeddings import GoogleEmbedding
+        return GoogleEmbedding(name=model) if model else GoogleEmbedding()
+    raise ValueError(f"Unknown embedding backend '{backend}'")
+
+
+def document_text(document: dict, fields):
+    parts = []
+    for field in fields:
+        value = document.get(field)
+        if isinstance(value, str) and value.strip():
+            parts.append(value.replace("<br>", "; ").strip())
+    return ". ".join(parts)
+
+
+def content_hash(text: str, backend: str, model: str):
+    return hashlib.sha1(f"{backend}\x00{model}\x00{text}".encode("utf-8")).hexdigest()
+
+
+# === Process-pool workers: each process loads its own encoder once ===
+_workerEmbedding = None
+
+
+def _init_worker(backend, model):
+    global _workerEmbedding
+    _workerEmbedding = make_embedding(backend, model)
+
+
+def _encode_batch(texts):
+    return np.asarray(_workerEmbedding.encode(texts), dtype=np.float32)
+
+
+# === Checkpoints ===
+# Extended JSON, so the resume position keeps its BSON type (ObjectId, int, string, ...)
+def load_checkpoint(path):
+    if path and os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            return json_util.loads(f.read())
+    return {}
+
+
+def check_resume(checkpoint, run):
+    """Refuse to resume a checkpoint written by a run over other data or with another encoder."""
+    if "after" not in checkpoint:
+        return
+    mismatched = [key for key, value in run.items() if checkpoint.get(key) != value]
+    if mismatched:
+        details = ", ".join(f"{key}: {checkpoint.get(key)!r} != {run[key]!r}" for key in mismatched)
+        sys.exit(f"❌ The checkpoint is from another run ({details}); delete it or pass another --checkpoint")
+
+
+def save_checkpoint(path, checkpoint):
+    if not path:
+        return
+    tmpPath = f"{path}.tmp"
+    with open(tmpPath, "w", encoding="utf-8") as f:
+        f.write(json_util.dumps(checkpoint))
+    os.replace(tmpPath, path)
+
+
+# === Sources ===
+def mongo_documents(collection, fields, after=None):
+    """Stream documents in _id order, resuming after the checkpointed _id."""
+    query = {"_id": {"$gt": after}} if after is not None else {}
+    projection = {field: 1 for field in fields}
+    projection["embedding_hash"] = 1
+    for document in collection.find(query, projection).sort("_id", 1).batch_size(1000):
+        yield document["_id"], document
+
+
+def jsonl_documents(path, after=None):
+    """Stream documents from a JSONL file, resuming after the checkpointed line."""
+    start = int(after) if after is not None else -1
+    with open(path, encoding="utf-8") as f:
+        for lineNo, line in enumerate(f):
+            if lineNo <= start or not line.strip():
+                continue
+            yield lineNo, json.loads(line)
+
+
+def fields_changed(document: dict, existing: dict) -> bool:
+    """Whether a JSONL document differs from its stored copy outside the embedding."""
+    return any(
+        existing.get(field) != value
+        for field, value in document.items() if field not in ("_id", "embedding_hash", "updated_at")
+    )
+
+
+def jsonl_upsert(document: dict, update: dict, keyField: str):
+    """Upsert of a JSONL document's fields plus `update` (embedding, hash) by its key field."""
+    document = {k: v for k, v in document.items() if k not in ("_id", "embedding_hash")}
+    return UpdateOne({keyField: document[keyField]}, {"$set": {**document, **update}}, upsert=True)
+
+
+def chunked(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def run(args):
+    dbName = args.db or os.getenv("DB_NAME")
+    dbCollection = args.collection or os.getenv("DB_COLLECTION")
+    collection = get_collection(args.mongodb_uri or os.getenv("MONGODB_URI"), dbName, dbCollection)
+    model = args.model or ""
+    # What the checkpoint's position means: the same source read into the same collection
+    source = f"{dbName}.{dbCollection}" if args.source == "mongo" else os.path.abspath(args.input)
+    identity = {"source": source, "target": f"{dbName}.{dbCollection}", "backend": args.backend, "model": model}
+    checkpoint = load_checkpoint(args.checkpoint)
+    check_resume(checkpoint, identity)
+    checkpoint.update(identity)
+
+    if args.source == "mongo":
+        documents = mongo_documents(collection, args.text_fields, checkpoint.get("after"))
+    else:
+        documents = jsonl_documents(args.input, checkpoint.get("after"))
+
+    executor = None
+    if args.workers > 1:
+        executor = ProcessPoolExecutor(
+            max_workers=args.workers, initializer=_init_worker, initargs=(args.backend, args.model)
+        )
+    else:
+        _init_worker(args.backend, args.model)
+
+    written = skipped = updated = 0
+    start = time.perf_counter()
+    try:
+        for chunk in chunked(documents, args.chunk_size):
+            stored = {}
+            if args.source == "jsonl":
+                # Look up stored documents so unchanged JSONL documents are not re-encoded
+                keys = [document.get(args.key_field) for _, document in chunk]
+                fields = {field for _, document in chunk for field in document} - {"_id", "embedding"}
+                stored = {
+                    existing[args.key_field]: existing
+                    for existing in collection.find(
+                        {args.key_field: {"$in": keys}}, {"_id": 0, "embedding_hash": 1, **{field: 1 for field in fields}}
+                    )
+                }
+                for _, document in chunk:
+                    document["embedding_hash"] = stored.get(document.get(args.key_field), {}).get("embedding_hash")
+
+            # Bumped on every write, so watchers polling updated_at and the answer
+            # cache's collection fingerprint see re-embedded and edited products
+            now = datetime.datetime.now(datetime.timezone.utc)
+            pending = []
+            operations = []
+            for position, document in chunk:
+                text = document_text(document, args.text_fields)
+                digest = content_hash(text, args.backend, model)
+                if not text:
+                    skipped += 1
+                elif document.get("embedding_hash") != digest:
+                    pending.append((document, text, digest))
+                else:
+                    skipped += 1
+                    if args.source == "jsonl" and fields_changed(document, stored[document[args.key_field]]):
+                        # Same text, so the same vector: only price, promotion, ... changed
+                        operations.append(jsonl_upsert(document, {"updated_at": now}, args.key_field))
+
+            if pending:
+                texts = [text for _, text, _ in pending]
+                batches = [texts[i:i + args.batch_size] for i in range(0, len(texts), args.batch_size)]
+                results = executor.map(_encode_batch, batches) if executor else map(_encode_batch, batches)
+                vectors = np.concatenate(list(results))
+
+                for (document, _, digest), vector in zip(pending, vectors):
+                    # Lists only at the Mongo boundary
+                    update = {"embedding": vector.tolist(), "embedding_hash": digest, "updated_at": now}
+                    if args.source == "mongo":
+                        operations.append(UpdateOne({"_id": document["_id"]}, {"$set": update}))
+                    else:
+                        operations.append(jsonl_upsert(document, update, args.key_field))
+                written += len(pending)
+            if operations:
+                collection.bulk_write(operations, ordered=False)
+                updated += len(operations) - len(pending)
+
+            checkpoint["after"] = chunk[-1][0]
+            save_checkpoint(args.checkpoint, checkpoint)
+            elapsed = time.perf_counter() - start
+            print(f"⏳ {written} embedded, {skipped} not re-embedded, {updated} of them updated ({written / elapsed:.1f} docs/s)")
+    finally:
+        if executor:
+            executor.shutdown()
+
+    print(f"✅ Done: {written} embedded, {skipped} not re-embedded, {updated} of them updated in {time.perf_counter() - start:.1f}s")
+    if args.checkpoint and os.path.exists(args.checkpoint):
+        os.remove(args.checkpoint)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Embed product documents and write the `embedding` field.")
+    parser.add_argument("--source", choices=["mongo", "jsonl"], default="mongo")
+    parser.add_argument("--input", help="JSONL file for --source jsonl")
+    parser.add_argument("--key-field", default="url", help="Field identifying a JSONL document in the collection")
+    parser.add_argument("--backend", choices=["sbert", "fastembed", "openai", "mistral", "google"], default="sbert")
+    parser.add_argument("--model", help="Model name; default EMBEDDING_MODEL for sbert, the backend's own model otherwise")
+    parser.add_argument("--text-fields", nargs="+", default=DEFAULT_TEXT_FIELDS)
+    parser.add_argument("--batch-size", type=int, default=64, help="Texts per encode call")
+    parser.add_argument("--chunk-size", type=int, default=1000, help="Documents per bulk_write and checkpoint")
+    parser.add_argument("--workers", type=int, default=1, help="Encoding processes, each loads its own model")
+    parser.add_argument("--checkpoint", default="ingest.checkpoint.json")
+    parser.add_argument("--mongodb-uri")
+    parser.add_argument("--db")
+    parser.add_argument("--collection")
+    args = parser.parse_args(argv)
+    if args.source == "jsonl" and not args.input:
+        parser.error("--input is required with --source jsonl")
+    if args.model is None and args.backend == "sbert":
+        # EMBEDDING_MODEL names serve.py's SBERT model, not an API model
+        args.model = os.getenv("EMBEDDING_MODEL")
+    return args
+
+
+if __name__ == "__main__":
+    run(parse_args())
@@ -0,0 +1,132 @@
+# Multi-process production launcher for serve.py (gunicorn, Linux):
+#
+#   python launch.py --workers 8 --threads 4 --bind 0.0.0.0:5002
+#   python launch.py --no-encode-server    # model in the master, weights shared copy-on-write;
+#                                          # every worker encodes (set EMBEDDING_THREADS per worker)
+#
+# - The SBERT model is loaded once, in a dedicated encode process (embeddings.remote).
+#   Workers send it their query texts over a unix socket; it batches them across workers.
+# - serve.py is imported once, in the master (preload_app), then forked into the workers.
+#   The route index and local product vectors are memory-mapped .npy files; the rest
+#   (BM25 postings, documents, samples) is frozen out of the garbage collector before
+#   forking, so workers keep sharing those pages instead of copying them.
+# - Threads do not survive a fork: the embedding batcher restarts itself in each worker
+#   and product watchers are started per worker (serve.start_background).
+# - Request counters and histograms use prometheus_client's multiprocess mode in a shared
+#   PROMETHEUS_MULTIPROC_DIR, so a /metrics scrape of any worker reports all of them.
+# - With --no-encode-server the master loads the model and encodes while preloading. A
+#   torch/OpenMP (or ONNX Runtime) thread pool started there is not valid in a forked child
+#   and the first encode in a worker can hang, so the master loads the model with
+#   EMBEDDING_THREADS=1 (no pool) and post_fork sets each worker's torch threads to
+#   EMBEDDING_THREADS, by default cpu_count // workers. ONNX sessions keep one thread.
+
+import argparse
+import gc
+import multiprocessing
+import os
+import secrets
+import shutil
+import sys
+import tempfile
+import time
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Serve serve.py with gunicorn workers sharing one model.")
+    parser.add_argument("--bind", default=os.getenv('BIND') or "0.0.0.0:5002")
+    parser.add_argument("--workers", type=int, default=int(os.getenv('WORKERS') or (os.cpu_count() or 1)))
+    parser.add_argument("--threads", type=int, default=int(os.getenv('WORKER_THREADS') or 4), help="request threads per worker")
+    parser.add_argument("--timeout", type=int, default=120, help="seconds before a silent worker is restarted")
+    parser.add_argument("--encode-socket", default=None, help="unix socket of the encode process")
+    parser.add_argument(
+        "--no-encode-server", dest="encode_server", action="store_false",
+        help="load the model in the master; every worker encodes with the shared weights",
+    )
+    return parser.parse_args(argv)
+
+
+def start_encode_server(address: str, authkey: bytes):
+    """Encode process, started fresh (spawn) so it holds the only loaded copy of the model."""
+    from embeddings.remote import run_encode_server
+
+    process = multiprocessing.get_context("spawn").Process(
+        target=run_encode_server, args=(address, authkey), name="encode-server", daemon=True
+    )
+    process.start()
+    # The socket appears once the model is loaded
+    while not os.path.exists(address):
+        if not process.is_alive():
+            sys.exit(f"❌ Encode server exited with code {process.exitcode}")
+        time.sleep(0.1)
+    return process
+
+
+def main(argv=None):
+    from gunicorn.app.base import BaseApplication
+
+    args = parse_args(argv)
+    encodeProcess = None
+    if args.encode_server:
+        address = args.encode_socket or os.path.join(tempfile.gettempdir(), f"rag-encode-{os.getpid()}.sock")
+        authkey = secrets.token_hex(16)
+        encodeProcess = start_encode_server(address, authkey.encode())
+        os.environ.update({"ENCODE_SERVER": address, "ENCODE_SERVER_KEY": authkey})
+    else:
+        workerThreads = int(os.getenv('EMBEDDING_THREADS') or max(1, (os.cpu_count() or 1) // args.workers))
+        # Read by components when serve.py is preloaded: no thread pool in the master to fork
+        os.environ["EMBEDDING_THREADS"] = "1"
+    os.environ["SERVE_PRELOAD"] = "true"
+    # Must be set before serve.py (and so metrics) is imported; stale files from a
+    # previous run would be summed in, so only a directory created here is used
+    metricsDir = tempfile.mkdtemp(prefix="rag-metrics-")
+    os.environ["PROMETHEUS_MULTIPROC_DIR"] = metricsDir
+
+    def when_ready(server):
+        # Everything serve.py allocated is now permanent: the collector never touches
+        # (and so never dirties) those objects in the workers
+        gc.freeze()
+        server.log.info("Preloaded serve.py, %d objects frozen", gc.get_freeze_count())
+
+    def post_fork(server, worker):
+        if not args.encode_server and "torch" in sys.modules:
+            from embeddings.registry import registry
+            registry.set_torch_threads(workerThreads)
+        import components
+        components.start_background()
+
+    def child_exit(server, worker):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid, path=metricsDir)
+
+    def on_exit(server):
+        if encodeProcess is not None:
+            encodeProcess.terminate()
+            encodeProcess.join(5)
+        shutil.rmtree(metricsDir, ignore_errors=True)
+
+    class ServeApplication(BaseApplication):
+        def load_config(self):
+            options = {
+                "bind": args.bind,
+                "workers": args.workers,
+                "worker_class": "gthread",
+                "threads": args.threads,
+                "timeout": args.timeout,
+                "preload_app": True,
+                "when_ready": when_ready,
+                "post_fork": post_fork,
+                "child_exit": child_exit,
+                "on_exit": on_exit,
+            }
+            for key, value in options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            import serve
+            return serve.app
+
+    ServeApplication().run()
+
+
+if __name__ == "__main__":
+    main()
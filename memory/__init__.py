@@ -0,0 +1 @@
+from memory.core import ConversationMemory
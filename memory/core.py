@@ -0,0 +1,144 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+from embeddings.base import estimate_tokens
+
+
+class ConversationMemory():
+    """
+    Rolling summary of older turns plus the most recent turns verbatim.
+
+    The client still sends the full history; entries older than the last
+    `recentTurns` are folded into a summary, `foldBatch` at a time, so each
+    update only summarizes the new entries on top of the previous summary.
+    Summaries are keyed by a hash of the entries they cover (within the
+    conversation id, when there is one), so chats that only share their
+    opening message never share or reset each other's summary. `build`
+    returns Gemini-style messages (role + parts) that fit in `maxTokens`,
+    usable for both reflection and generation; the injected acknowledgement
+    uses the OpenAI "assistant" role (rag.core maps it to "model" for Gemini).
+    """
+
+    def __init__(
+            self,
+            llm,
+            recentTurns: int = 6,
+            foldBatch: int = 4,
+            maxTokens: int = 2000,
+            maxConversations: int = 10000,
+            model: str = "gpt-4o-mini",
+        ):
+        self.llm = llm
+        self.recentTurns = recentTurns
+        self.foldBatch = foldBatch
+        self.maxTokens = maxTokens
+        self.maxConversations = maxConversations
+        self.model = model
+        self.summaryUpdates = 0
+
+        self._summaries = OrderedDict()  # (conversation id, prefix hash) -> (summary, entries covered)
+        self._folding = set()  # keys being summarized right now
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _text(entry):
+        return ' '.join(part.get('text', '') for part in entry.get('parts', []))
+
+    def _prefix_hashes(self, entries):
+        """hashes[i] identifies entries[:i], in one pass over the entries."""
+        digest = hashlib.sha1()
+        hashes = [digest.hexdigest()]
+        for entry in entries:
+            digest.update(f"{entry.get('role', '')}\x00{self._text(entry)}\x01".encode('utf-8'))
+            hashes.append(digest.hexdigest())
+        return hashes
+
+    def _lookup(self, namespace, hashes):
+        """Longest summarized prefix: (summary, entries covered)."""
+        with self._lock:
+            for count in range(len(hashes) - 1, 0, -1):
+                entry = self._summaries.get((namespace, hashes[count]))
+                if entry is not None:
+                    self._summaries.move_to_end((namespace, hashes[count]))
+                    return entry
+        return "", 0
+
+    def _store(self, key, summary, count):
+        with self._lock:
+            self._summaries[key] = (summary, count)
+            self._summaries.move_to_end(key)
+            while len(self._summaries) > self.maxConversations:
+                self._summaries.popitem(last=False)
+
+    def _summarize(self, summary, entries):
+        transcript = ''.join(f"{entry.get('role', '')}: {self._text(entry)}\n" for entry in entries)
+        prompt = (
+            "Update the summary of a conversation between a customer and a phone store assistant "
+            "with the new messages below. Keep product names, prices, preferences and open questions. "
+            "Answer in Vietnamese with the updated summary only, in at most 150 words.\n\n"
+            f"Current summary:\n{summary or '(empty)'}\n\nNew messages:\n{transcript}"
+        )
+        completion = self.llm.chat.completions.create(
+            model=self.model,
+            messages=[{"role": "user", "content": prompt}],
+        )
+        self.summaryUpdates += 1
+        return completion.choices[0].message.content.strip()
+
+    def _fold(self, history, conversationId=None):
+        """Summary and number of history entries it covers, folding new entries when enough are pending."""
+        older = history[:max(len(history) - self.recentTurns, 0)]
+        namespace = conversationId or ""
+        hashes = self._prefix_hashes(older)
+        summary, count = self._lookup(namespace, hashes)
+        if len(older) - count < self.foldBatch:
+            return summary, count
+
+        key = (namespace, hashes[len(older)])
+        with self._lock:
+            if key in self._folding:
+                # Another request is summarizing the same entries: use the older summary meanwhile
+                return summary, count
+            self._folding.add(key)
+        try:
+            # The LLM call runs without any lock held
+            summary = self._summarize(summary, older[count:])
+            self._store(key, summary, len(older))
+            return summary, len(older)
+        finally:
+            with self._lock:
+                self._folding.discard(key)
+
+    def build(self, history, conversationId=None):
+        """Messages for the LLM: summary (if any) + the newest turns within the token budget."""
+        history = list(history)
+        if len(history) <= self.recentTurns:
+            return history
+
+        summary, count = self._fold(history, conversationId)
+        verbatim = history[count:]
+
+        budget = self.maxTokens - (estimate_tokens(summary) if summary else 0)
+        kept = []
+        for entry in reversed(verbatim):
+            tokens = estimate_tokens(self._text(entry))
+            if kept and tokens > budget:
+                break
+            kept.append(entry)
+            budget -= tokens
+        kept.reverse()
+
+        if not summary:
+            return kept
+        messages = [{"role": "user", "parts": [{"text": f"Tóm tắt cuộc trò chuyện trước đó: {summary}"}]}]
+        if kept[0].get('role') == 'user':
+            # Keep user/assistant turns alternating
+            messages.append({"role": "assistant", "parts": [{"text": "Đã hiểu."}]})
+        return messages + kept
+
+    def stats(self):
+        return {
+            "conversations": len(self._summaries),
+            "summary_updates": self.summaryUpdates,
+        }
@@ -0,0 +1 @@
+from metrics.core import MetricsRegistry, RequestTrace, metrics
@@ -0,0 +1,246 @@
+import json
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+import prometheus_client
+from prometheus_client import multiprocess
+from prometheus_client.core import GaugeMetricFamily
+
+from embeddings.base import estimate_tokens
+
+# Request stages are mostly 1 ms .. 10 s; LLM calls dominate the upper buckets.
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+TOKEN_BUCKETS = (16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192)
+
+
+def _metric_name(name: str) -> str:
+    return re.sub(r"[^a-zA-Z0-9_]", "_", name)
+
+
+class _StatsCollector():
+    """prometheus_client collector exporting the registered `stats()` dicts as gauges at scrape time."""
+
+    def __init__(self, registry: "MetricsRegistry", processLabels: Dict[str, str]):
+        self.registry = registry
+        self.processLabels = processLabels
+
+    def collect(self):
+        gauges = {}
+        for component, statsFn, by in list(self.registry._collectors):
+            try:
+                stats = statsFn()
+            except Exception as e:
+                print(f"⚠️ Metrics collector '{component}' failed: {e}")
+                continue
+            groups = stats.items() if by else [(None, stats)]
+            for labelValue, group in groups:
+                labels = {by: str(labelValue), **self.processLabels} if by else dict(self.processLabels)
+                for key, value in (group or {}).items():
+                    name = _metric_name(f"{self.registry.prefix}_{component}_{key}")
+                    if isinstance(value, dict):
+                        samples = [({**labels, "key": str(subKey)}, subValue) for subKey, subValue in value.items()]
+                    else:
+                        samples = [(labels, value)]
+                    for sampleLabels, sampleValue in samples:
+                        if not isinstance(sampleValue, (int, float)):
+                            continue
+                        gauge = gauges.get(name)
+                        if gauge is None:
+                            gauge = gauges[name] = GaugeMetricFamily(name, f"{component} stats: {key}")
+                        gauge.add_sample(name, sampleLabels, float(sampleValue))
+        return list(gauges.values())
+
+
+class MetricsRegistry():
+    """
+    Process-wide prometheus_client metrics, rendered for a Prometheus `/metrics` scrape.
+
+    Besides counters and histograms, components that already keep a
+    `stats()` dict (caches, batcher, reflection, ...) are registered with
+    `register_stats` and exported as gauges at scrape time.
+
+    With `multiprocessDir` (default: PROMETHEUS_MULTIPROC_DIR, set by
+    launch.py for its gunicorn workers before prometheus_client is imported),
+    counters and histograms use prometheus_client's multiprocess mode, and a
+    scrape of any worker renders their sums over every worker. Component
+    gauges describe the worker that answered the scrape and carry its `pid`.
+    """
+
+    def __init__(self, prefix: str = "rag", multiprocessDir: Optional[str] = None):
+        self.prefix = prefix
+        self.multiprocessDir = multiprocessDir or os.getenv("PROMETHEUS_MULTIPROC_DIR") or None
+        self._metrics = {}
+        self._collectors = []
+        self._listeners = []
+        self._lock = threading.Lock()
+        # Per-process metrics; in multiprocess mode they live in the shared files instead
+        self.registry = prometheus_client.CollectorRegistry()
+        if not self.multiprocessDir:
+            self.registry.register(_StatsCollector(self, {}))
+
+        self.stageSeconds = self.histogram(
+            "stage_seconds", "Latency of one request stage.", ("endpoint", "stage"))
+        self.requestSeconds = self.histogram(
+            "request_seconds", "End-to-end request latency.", ("endpoint", "status"))
+        self.requests = self.counter(
+            "requests_total", "Requests by endpoint, status and route.", ("endpoint", "status", "route"))
+        self.tokens = self.histogram(
+            "llm_tokens", "Estimated LLM prompt/completion tokens per request.", ("endpoint", "kind"),
+            buckets=TOKEN_BUCKETS)
+        self.answerCache = self.counter(
+            "answer_cache_total", "Semantic answer cache lookups.", ("endpoint", "result"))
+
+    def _register(self, name: str, factory):
+        name = _metric_name(f"{self.prefix}_{name}")
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                # registry=None in multiprocess mode: values only reach a scrape through MultiProcessCollector
+                metric = self._metrics[name] = factory(name, None if self.multiprocessDir else self.registry)
+            return metric
+
+    def counter(self, name: str, help: str, labelNames: Tuple[str, ...] = ()) -> prometheus_client.Counter:
+        return self._register(
+            name, lambda fullName, registry: prometheus_client.Counter(fullName, help, labelNames, registry=registry))
+
+    def histogram(
+            self, name: str, help: str, labelNames: Tuple[str, ...] = (), buckets=LATENCY_BUCKETS
+    ) -> prometheus_client.Histogram:
+        return self._register(name, lambda fullName, registry: prometheus_client.Histogram(
+            fullName, help, labelNames, buckets=buckets, registry=registry))
+
+    def register_stats(self, component: str, statsFn: Callable[[], dict], by: Optional[str] = None):
+        """
+        Export `statsFn()` as gauges named `<prefix>_<component>_<key>`.
+
+        Nested dicts of numbers become a `key` label. With `by`, the top-level
+        keys are label values instead (e.g. QueryStats: query name -> stats).
+        """
+        with self._lock:
+            self._collectors.append((component, statsFn, by))
+
+    def add_listener(self, listener: Callable[["RequestTrace", str, float], None]):
+        """Call `listener(trace, status, seconds)` for every finished request (e.g. the benchmark)."""
+        with self._lock:
+            self._listeners.append(listener)
+
+    def remove_listener(self, listener):
+        with self._lock:
+            self._listeners.remove(listener)
+
+    def _notify(self, trace: "RequestTrace", status: str, seconds: float):
+        for listener in list(self._listeners):
+            listener(trace, status, seconds)
+
+    def render(self) -> str:
+        if not self.multiprocessDir:
+            return prometheus_client.generate_latest(self.registry).decode("utf-8")
+        registry = prometheus_client.CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry, path=self.multiprocessDir)
+        registry.register(_StatsCollector(self, {"pid": str(os.getpid())}))
+        return prometheus_client.generate_latest(registry).decode("utf-8")
+
+
+metrics = MetricsRegistry()
+
+
+class RequestTrace():
+    """
+    Timings and attributes of one request.
+
+    Each `stage` is observed into `stage_seconds{endpoint,stage}`; `finish`
+    records the end-to-end latency and, when `log` is true, prints one JSON
+    line with every stage and attribute. A streamed answer finishes the trace
+    when the stream is exhausted (see `stream`/`astream`).
+    """
+
+    def __init__(self, endpoint: str, log: bool = False, registry: MetricsRegistry = None):
+        self.endpoint = endpoint
+        self.log = log
+        self.registry = registry or metrics
+        self.start = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+        self.fields = {}
+        self._finished = False
+
+    def record(self, stage: str, seconds: float):
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+        self.registry.stageSeconds.labels(endpoint=self.endpoint, stage=stage).observe(seconds)
+
+    @contextmanager
+    def stage(self, stage: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - start)
+
+    def set(self, **fields):
+        self.fields.update(fields)
+
+    def cache(self, hit: bool):
+        self.fields["cache"] = "hit" if hit else "miss"
+        self.registry.answerCache.labels(endpoint=self.endpoint, result=self.fields["cache"]).inc()
+
+    def tokens(self, kind: str, text: str):
+        count = estimate_tokens(text)
+        self.fields[f"{kind}_tokens"] = self.fields.get(f"{kind}_tokens", 0) + count
+        self.registry.tokens.labels(endpoint=self.endpoint, kind=kind).observe(count)
+
+    def stream(self, chunks: Iterable[str], stage: str = "llm_stream"):
+        """
+        Pass streamed text pieces through, recording time to the first piece,
+        the whole stream and the completion tokens, then finish the trace.
+        """
+        start = time.perf_counter()
+        parts = []
+        status = "error"
+        try:
+            for text in chunks:
+                if not parts:
+                    self.record("first_token", time.perf_counter() - start)
+                parts.append(text)
+                yield text
+            status = "ok"
+        finally:
+            self._end_stream(stage, start, parts, status)
+
+    async def astream(self, chunks, stage: str = "llm_stream"):
+        start = time.perf_counter()
+        parts = []
+        status = "error"
+        try:
+            async for text in chunks:
+                if not parts:
+                    self.record("first_token", time.perf_counter() - start)
+                parts.append(text)
+                yield text
+            status = "ok"
+        finally:
+            self._end_stream(stage, start, parts, status)
+
+    def _end_stream(self, stage: str, start: float, parts, status: str):
+        self.record(stage, time.perf_counter() - start)
+        self.tokens("completion", "".join(parts))
+        self.finish(status)
+
+    def finish(self, status: str = "ok"):
+        if self._finished:
+            return
+        self._finished = True
+        seconds = time.perf_counter() - self.start
+        self.registry.requestSeconds.labels(endpoint=self.endpoint, status=status).observe(seconds)
+        self.registry.requests.labels(endpoint=self.endpoint, status=status, route=self.fields.get("route", "")).inc()
+        self.registry._notify(self, status, seconds)
+        if self.log:
+            print(json.dumps({
+                "endpoint": self.endpoint,
+                "status": status,
+                "total_ms": round(seconds * 1000, 2),
+                "stages_ms": {stage: round(value * 1000, 2) for stage, value in self.stages.items()},
+                **self.fields,
+            }, ensure_ascii=False, default=str), flush=True)
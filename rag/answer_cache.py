@@ -0,0 +1,126 @@
+import threading
+import time
+from typing import Any, Callable, Optional
+
+import numpy as np
+
+
+class SemanticAnswerCache():
+    """
+    Caches final answers by query embedding.
+
+    A query whose cosine similarity to a cached query reaches `threshold`
+    (within the same namespace, e.g. endpoint + route) is answered from the
+    cache. Entries expire after `ttl` seconds, and everything is dropped when
+    `versionFn()` (e.g. a product collection fingerprint) changes; it is
+    polled at most every `versionCheckInterval` seconds.
+    """
+
+    def __init__(
+            self,
+            threshold: float = 0.95,
+            ttl: float = 600,
+            maxSize: int = 1000,
+            versionFn: Optional[Callable[[], Any]] = None,
+            versionCheckInterval: float = 30,
+        ):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.maxSize = maxSize
+        self.versionFn = versionFn
+        self.versionCheckInterval = versionCheckInterval
+        self.hits = 0
+        self.misses = 0
+
+        self._vectors = None  # (maxSize, dim) float32, allocated on first store
+        self._expires = np.zeros(maxSize, dtype=np.float64)  # 0 marks an empty slot
+        self._namespaces = [None] * maxSize
+        self._answers = [None] * maxSize
+        self._version = None
+        self._versionCheckedAt = 0.0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _normalize(embedding):
+        vector = np.asarray(embedding, dtype=np.float32).reshape(-1)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _check_version(self):
+        if self.versionFn is None:
+            return
+        now = time.monotonic()
+        if now - self._versionCheckedAt < self.versionCheckInterval:
+            return
+        self._versionCheckedAt = now
+
+        try:
+            version = self.versionFn()
+        except Exception as e:
+            print(f"⚠️ Answer cache version check failed: {e}")
+            return
+        if self._version is not None and version != self._version:
+            self.invalidate()
+        self._version = version
+
+    def lookup(self, embedding, namespace: str = ''):
+        """Cached answer or None; `embedding=None` (a query not encoded yet) is a miss."""
+        if embedding is None:
+            with self._lock:
+                self.misses += 1
+            return None
+        self._check_version()
+        query = self._normalize(embedding)
+
+        with self._lock:
+            if self._vectors is None:
+                self.misses += 1
+                return None
+
+            valid = self._expires > time.time()
+            valid &= np.array([ns == namespace for ns in self._namespaces])
+            if not valid.any():
+                self.misses += 1
+                return None
+
+            similarities = np.where(valid, self._vectors @ query, -np.inf)
+            best = int(similarities.argmax())
+            if similarities[best] < self.threshold:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            return self._answers[best]
+
+    def store(self, embedding, answer, namespace: str = ''):
+        vector = self._normalize(embedding)
+        with self._lock:
+            if self._vectors is None:
+                self._vectors = np.zeros((self.maxSize, vector.shape[0]), dtype=np.float32)
+
+            # Reuse an empty or expired slot, otherwise evict the oldest entry.
+            slot = int(self._expires.argmin())
+            self._vectors[slot] = vector
+            self._expires[slot] = time.time() + self.ttl
+            self._namespaces[slot] = namespace
+            self._answers[slot] = answer
+
+    def invalidate(self):
+        with self._lock:
+            self._expires[:] = 0
+            self._answers = [None] * self.maxSize
+            self._namespaces = [None] * self.maxSize
+
+    def apply_changes(self, upserts, deletes):
+        """rag.watcher sink: an answer may quote any product, so any change drops them all."""
+        if upserts or deletes:
+            self.invalidate()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "size": int((self._expires > time.time()).sum()),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
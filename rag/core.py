@@ -1,8 +1,61 @@
-import pymongo
-import google.generativeai as genai
-from IPython.display import Markdown
 import textwrap
 from embeddings import SentenceTransformerEmbedding, EmbeddingConfig
+from rag.retriever import AtlasRetriever
+from rag.mongo import collection_version, get_client
+from rag.snippets import SnippetCache, render_knowledge, snippetCache as sharedSnippetCache
+
+
+def stream_text(chunks):
+    """Yield the text pieces of a streamed Gemini or OpenAI response."""
+    for chunk in chunks:
+        text = _chunk_text(chunk)
+        if text:
+            yield text
+
+
+async def astream_text(chunks):
+    async for chunk in chunks:
+        text = _chunk_text(chunk)
+        if text:
+            yield text
+
+
+def to_gpt_messages(messages):
+    """Gemini-style history (role + parts) as OpenAI chat messages; "model" turns become "assistant"."""
+    # GPT - chuyển parts -> content
+    valid_roles = {"system", "user", "assistant", "function", "tool", "developer"}
+    gpt_messages = []
+
+    for m in messages:
+        role = m.get("role")
+
+        # Xử lý role không hợp lệ
+        if role not in valid_roles:
+            if role == "model":
+                role = "assistant"
+            else:
+                continue
+
+        parts = m.get("parts", [])
+        content = "\n".join(
+            p.get("text", "") for p in parts if isinstance(p, dict) and "text" in p
+        )
+        gpt_messages.append({"role": role, "content": content})
+    return gpt_messages
+
+
+def to_gemini_messages(messages):
+    """Gemini only knows "user" and "model": "assistant" turns (e.g. ConversationMemory's) become "model"."""
+    return [{**m, "role": "model"} if m.get("role") == "assistant" else m for m in messages]
+
+
+def _chunk_text(chunk):
+    if hasattr(chunk, "choices"):
+        # OpenAI ChatCompletionChunk
+        return chunk.choices[0].delta.content if chunk.choices else None
+    # Gemini GenerateContentResponse chunk
+    return chunk.text
+
 
 class RAG():
     def __init__(self, 
@@ -11,28 +64,42 @@ class RAG():
             dbCollection: str,
             llm,
             embeddingName: str ='keepitreal/vietnamese-sbert',
+            embeddingDevice: str = None,
+            embedding=None,
+            retriever=None,
+            searchLimit: int = 10,
+            snippetCache: SnippetCache = None,
         ):
-        self.client = pymongo.MongoClient(mongodbUri)
+        # Pooled client shared with every other user of the same URI
+        self.client = get_client(mongodbUri)
         self.db = self.client[dbName] 
         self.collection = self.db[dbCollection]
-        self.embedding_model = SentenceTransformerEmbedding(
-            EmbeddingConfig(name=embeddingName)
+        # Shared through the embeddings registry, so this does not load a second copy.
+        # Callers can pass their own encoder (e.g. a CachedEmbedding) instead.
+        self.embedding_model = embedding or SentenceTransformerEmbedding(
+            EmbeddingConfig(name=embeddingName), device=embeddingDevice
         )
+        self.retriever = retriever or AtlasRetriever(self.collection, self.embedding_model)
+        # Products retrieved per question; a hybrid retriever needs fewer
+        self.searchLimit = searchLimit
+        # Rendered product lines, shared with /ask's prompt builder by default
+        self.snippetCache = snippetCache or sharedSnippetCache
         self.llm = llm
 
     def get_embedding(self, text):
+        """float32 (dim,) query vector, or None for an empty query."""
         if not text.strip():
-            return []
+            return None
 
-        embedding = self.embedding_model.encode(text)
-        return embedding.tolist()
+        return self.embedding_model.encode(text)
 
     def vector_search(
             self, 
             user_query: str, 
             limit=4):
         """
-        Perform a vector search in the MongoDB collection based on the user query.
+        Perform a vector search based on the user query, using the configured
+        retriever backend (Atlas $vectorSearch by default, or a local index).
 
         Args:
         user_query (str): The user's query string.
@@ -40,101 +107,77 @@ class RAG():
         Returns:
         list: A list of matching documents.
         """
+        return self.retriever.vector_search(user_query, limit)
 
-        # Generate embedding for the user query
-        query_embedding = self.get_embedding(user_query)
-
-        if query_embedding is None:
-            return "Invalid query or embedding generation failed."
-
-        # Define the vector search pipeline
-        vector_search_stage = {
-            "$vectorSearch": {
-                "index": "vector_index",
-                "queryVector": query_embedding,
-                "path": "embedding",
-                "numCandidates": 400,
-                "limit": limit,
-            }
-        }
-
-        unset_stage = {
-            "$unset": "embedding" 
-        }
-
-        project_stage = {
-            "$project": {
-                "_id": 0,  
-                "title": 1, 
-                # "product_specs": 1,
-                "color_options": 1,
-                "current_price": 1,
-                "product_promotion": 1,
-                "score": {
-                    "$meta": "vectorSearchScore"
-                }
-            }
-        }
-
-        pipeline = [vector_search_stage, unset_stage, project_stage]
-
-        # Execute the search
-        results = self.collection.aggregate(pipeline)
-
-        return list(results)
+    def collection_version(self):
+        """Cheap fingerprint of the product collection, used to invalidate caches."""
+        return collection_version(self.collection)
+
+    def format_knowledge(self, get_knowledge):
+        """
+        Numbered "Tên, Giá, Ưu đãi" lines of the priced products, with `<br>`
+        already turned into newlines. Each line comes from the snippet cache.
+        """
+        return render_knowledge(get_knowledge, self.snippetCache)
 
     def enhance_prompt(self, query):
-        get_knowledge = self.vector_search(query, 10)
-        enhanced_prompt = ""
-        i = 0
-        for result in get_knowledge:
-            if result.get('current_price'):
-                i += 1
-                enhanced_prompt += f"\n {i}) Tên: {result.get('title')}"
-                
-                if result.get('current_price'):
-                    enhanced_prompt += f", Giá: {result.get('current_price')}"
-                else:
-                    # Mock up data
-                    # Retrieval model pricing from the internet.
-                    enhanced_prompt += f", Giá: Liên hệ để trao đổi thêm!"
-                
-                if result.get('product_promotion'):
-                    enhanced_prompt += f", Ưu đãi: {result.get('product_promotion')}"
-        return enhanced_prompt
-    
-    def generate_content(self, messages):
+        return self.format_knowledge(self.vector_search(query, self.searchLimit))
+
+    async def aenhance_prompt(self, query):
+        return self.format_knowledge(await self.retriever.avector_search(query, self.searchLimit))
+
+    def _to_gpt_messages(self, messages):
+        return to_gpt_messages(messages)
+
+    def generate_content(self, messages, stream=False):
+        """
+        Generate the answer. With stream=True, returns a generator of text
+        pieces as the model produces them instead of a response with `.text`.
+        """
         if hasattr(self.llm, "generate_content"):
             # Gemini
+            messages = to_gemini_messages(messages)
+            if stream:
+                return stream_text(self.llm.generate_content(messages, stream=True))
             return self.llm.generate_content(messages)
         else:
-            # GPT - chuyển parts -> content
-            valid_roles = {"system", "user", "assistant", "function", "tool", "developer"}
-            gpt_messages = []
-
-            for m in messages:
-                role = m.get("role")
-
-                # Xử lý role không hợp lệ
-                if role not in valid_roles:
-                    if role == "model":
-                        role = "assistant"
-                    else:
-                        continue
-
-                parts = m.get("parts", [])
-                content = "\n".join(
-                    p.get("text", "") for p in parts if isinstance(p, dict) and "text" in p
-                )
-                gpt_messages.append({"role": role, "content": content})
-
             response = self.llm.chat.completions.create(
                 model="gpt-4o-mini",
-                messages=gpt_messages,
+                messages=self._to_gpt_messages(messages),
+                stream=stream,
             )
+            if stream:
+                return stream_text(response)
+            return type("Response", (object,), {"text": response.choices[0].message.content})()
+
+    async def agenerate_content(self, messages, stream=False):
+        """Same as generate_content, for async clients (openai.AsyncOpenAI or Gemini)."""
+        if hasattr(self.llm, "generate_content_async"):
+            # Gemini
+            messages = to_gemini_messages(messages)
+            if stream:
+                return astream_text(await self.llm.generate_content_async(messages, stream=True))
+            return await self.llm.generate_content_async(messages)
+        else:
+            response = await self.llm.chat.completions.create(
+                model="gpt-4o-mini",
+                messages=self._to_gpt_messages(messages),
+                stream=stream,
+            )
+            if stream:
+                return astream_text(response)
             return type("Response", (object,), {"text": response.choices[0].message.content})()
 
 
+    @staticmethod
     def _to_markdown(text):
+        # Notebook helper; IPython is an optional dependency
+        try:
+            from IPython.display import Markdown
+        except ImportError:
+            raise ImportError(
+                "RAG._to_markdown needs IPython. "
+                "You can install it with the following command: `pip install ipython`"
+            )
         text = text.replace('•', '  *')
         return Markdown(textwrap.indent(text, '> ', predicate=lambda _: True))
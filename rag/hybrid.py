@@ -0,0 +1,243 @@
+import asyncio
+import math
+import re
+import threading
+import unicodedata
+from collections import defaultdict
+from typing import Dict, List
+
+import numpy as np
+
+from embeddings.cache import strip_accents
+from rag.mongo import SEARCH_FIELDS, KEY_FIELDS
+
+TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Vietnamese-aware tokens: lower-cased syllables, their accent-free forms
+    (customers often type "gia" for "giá") and syllable bigrams, so that model
+    names like "z fold 3" or compounds like "điện thoại" match as units.
+    """
+    if not text:
+        return []
+    syllables = TOKEN_PATTERN.findall(unicodedata.normalize('NFC', text).lower().replace('<br>', ' '))
+    folded = [strip_accents(s) for s in syllables]
+
+    tokens = list(folded)
+    tokens += [s for s, f in zip(syllables, folded) if s != f]
+    tokens += [f"{a}_{b}" for a, b in zip(folded, folded[1:])]
+    return tokens
+
+
+class BM25Index():
+    """
+    Okapi BM25 over an inverted index of selected document fields.
+
+    Row numbers are stable: `apply_changes` re-tokenizes only the changed
+    documents, replaces the postings of their tokens and leaves deleted rows
+    as empty slots. Every version is swapped in as one tuple, so a search
+    never mixes two of them.
+    """
+
+    def __init__(
+            self,
+            documents: List[dict],
+            fields: Dict[str, float] = None,
+            k1: float = 1.2,
+            b: float = 0.75,
+            storedFields: List[str] = None,
+        ):
+        # field -> weight; the title matters more than a long specs blob
+        self.fields = fields or {"title": 3.0, "product_specs": 1.0}
+        self.k1 = k1
+        self.b = b
+        # Fields kept for results (None keeps whatever the documents have)
+        self.storedFields = storedFields
+        self._writeLock = threading.Lock()
+
+        self._index(documents)
+
+    def _terms(self, document: dict):
+        """Weighted term frequencies and length of one document."""
+        frequencies = defaultdict(float)
+        length = 0.0
+        for field, weight in self.fields.items():
+            value = document.get(field)
+            if not isinstance(value, str):
+                continue
+            tokens = tokenize(value)
+            length += weight * len(tokens)
+            for token in tokens:
+                frequencies[token] += weight
+        return frequencies, length
+
+    def _norms(self, lengths, live: int):
+        # Empty slots have length 0, so the sum only counts live documents
+        averageLength = float(lengths.sum()) / live if live else 0.0
+        return self.k1 * (1 - self.b + self.b * lengths / (averageLength or 1.0))
+
+    def _index(self, documents: List[dict]):
+        postings = defaultdict(lambda: defaultdict(float))
+        lengths = np.zeros(len(documents), dtype=np.float32)
+        for docId, document in enumerate(documents):
+            frequencies, lengths[docId] = self._terms(document)
+            for token, frequency in frequencies.items():
+                postings[token][docId] = frequency
+
+        index = {}
+        for token, frequencies in postings.items():
+            docIds = np.fromiter(frequencies.keys(), dtype=np.int64)
+            tfs = np.fromiter(frequencies.values(), dtype=np.float32)
+            index[token] = (docIds, tfs)
+        self._state = (list(documents), lengths, self._norms(lengths, len(documents)), index, len(documents))
+
+    @property
+    def documents(self) -> List[dict]:
+        """Live documents (deleted rows left out)."""
+        return [document for document in self._state[0] if document is not None]
+
+    def _project(self, document: dict) -> dict:
+        if self.storedFields is None:
+            return {key: value for key, value in document.items() if key != "embedding"}
+        keep = KEY_FIELDS + self.storedFields + list(self.fields)
+        return {field: document[field] for field in keep if field in document}
+
+    def apply_changes(self, upserts: List[dict], deletes: List):
+        """
+        Apply product changes (rag.watcher). Edits that leave the indexed
+        fields alone (price, promotion) only replace the stored document;
+        otherwise the document's old postings are replaced by its new ones.
+        """
+        with self._writeLock:
+            documents, lengths, _, index, live = self._state
+            documents, lengths, index = list(documents), lengths.copy(), dict(index)
+            rows = {str(document["_id"]): row for row, document in enumerate(documents)
+                    if document is not None and document.get("_id") is not None}
+            removed = defaultdict(set)  # token -> rows whose old postings go
+            added = defaultdict(dict)  # token -> {row: tf}
+
+            for document in upserts:
+                stored = self._project(document)
+                row = rows.get(str(document["_id"]))
+                if row is not None:
+                    old = documents[row]
+                    documents[row] = stored
+                    if all(old.get(field) == stored.get(field) for field in self.fields):
+                        continue
+                    for token in self._terms(old)[0]:
+                        removed[token].add(row)
+                else:
+                    row = rows[str(document["_id"])] = len(documents)
+                    documents.append(stored)
+                    lengths = np.append(lengths, np.float32(0.0))
+                    live += 1
+                frequencies, lengths[row] = self._terms(stored)
+                for token, frequency in frequencies.items():
+                    added[token][row] = frequency
+
+            for productId in deletes:
+                row = rows.pop(str(productId), None)
+                if row is None:
+                    continue
+                for token in self._terms(documents[row])[0]:
+                    removed[token].add(row)
+                for frequencies in added.values():
+                    frequencies.pop(row, None)
+                documents[row] = None
+                lengths[row] = 0.0
+                live -= 1
+
+            for token in removed.keys() | added.keys():
+                docIds, tfs = index.get(token, (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)))
+                drop = removed.get(token, set()) | added.get(token, {}).keys()
+                if drop:
+                    keep = ~np.isin(docIds, np.fromiter(drop, dtype=np.int64, count=len(drop)))
+                    docIds, tfs = docIds[keep], tfs[keep]
+                if added.get(token):
+                    docIds = np.concatenate([docIds, np.fromiter(added[token].keys(), dtype=np.int64)])
+                    tfs = np.concatenate([tfs, np.fromiter(added[token].values(), dtype=np.float32)])
+                if len(docIds):
+                    index[token] = (docIds, tfs)
+                else:
+                    index.pop(token, None)
+
+            self._state = (documents, lengths, self._norms(lengths, live), index, live)
+
+    def __len__(self):
+        return self._state[4]
+
+    @classmethod
+    def from_collection(cls, collection, fields: List[str] = SEARCH_FIELDS, **kwargs):
+        """Index the product collection; `fields` are kept for results, title/specs are searched."""
+        projection = {"product_specs": 1, **{field: 1 for field in KEY_FIELDS + list(fields)}}
+        return cls(list(collection.find({}, projection)), storedFields=list(fields), **kwargs)
+
+    def search(self, query: str, limit: int = 10):
+        """Return [(docId, score), ...] best first."""
+        return [(docId, score) for docId, score, _ in self.search_documents(query, limit)]
+
+    def search_documents(self, query: str, limit: int = 10):
+        """Return [(docId, score, document), ...] best first, from one consistent index version."""
+        documents, _, norms, index, live = self._state
+        scores = np.zeros(len(documents), dtype=np.float32)
+        for token in set(tokenize(query)):
+            posting = index.get(token)
+            if posting is None:
+                continue
+            docIds, tfs = posting
+            idf = math.log(1 + (live - len(docIds) + 0.5) / (len(docIds) + 0.5))
+            scores[docIds] += idf * tfs * (self.k1 + 1) / (tfs + norms[docIds])
+
+        matched = np.flatnonzero(scores)
+        if not len(matched):
+            return []
+        limit = min(limit, len(matched))
+        top = matched[np.argpartition(-scores[matched], limit - 1)[:limit]]
+        top = top[np.argsort(-scores[top])]
+        return [(int(i), float(scores[i]), documents[i]) for i in top]
+
+
+class HybridRetriever():
+    """
+    Reciprocal-rank fusion of a vector retriever and a BM25 index.
+
+    Both sides return `candidates` hits, fused by sum(1 / (rrfK + rank)) per
+    product title; `score` in the results is the fused score.
+    """
+
+    def __init__(self, vectorRetriever, lexicalIndex: BM25Index, candidates: int = 20, rrfK: int = 60):
+        self.vectorRetriever = vectorRetriever
+        self.lexicalIndex = lexicalIndex
+        self.fields = vectorRetriever.fields
+        self.candidates = candidates
+        self.rrfK = rrfK
+
+    def _lexical(self, user_query: str):
+        results = []
+        for _, _, document in self.lexicalIndex.search_documents(user_query, self.candidates):
+            results.append({field: document[field] for field in KEY_FIELDS + self.fields if field in document})
+        return results
+
+    def _fuse(self, vectorHits, lexicalHits, limit: int):
+        fused = {}
+        for hits in (vectorHits, lexicalHits):
+            for rank, hit in enumerate(hits):
+                key = hit.get("title") or id(hit)
+                entry = fused.setdefault(key, [0.0, hit])
+                entry[0] += 1.0 / (self.rrfK + rank + 1)
+
+        ranked = sorted(fused.values(), key=lambda entry: entry[0], reverse=True)[:limit]
+        return [{**hit, "score": score} for score, hit in ranked]
+
+    def vector_search(self, user_query: str, limit: int = 4):
+        vectorHits = self.vectorRetriever.vector_search(user_query, self.candidates)
+        return self._fuse(vectorHits, self._lexical(user_query), limit)
+
+    async def avector_search(self, user_query: str, limit: int = 4):
+        vectorHits, lexicalHits = await asyncio.gather(
+            self.vectorRetriever.avector_search(user_query, self.candidates),
+            asyncio.to_thread(self._lexical, user_query),
+        )
+        return self._fuse(vectorHits, lexicalHits, limit)
@@ -0,0 +1,249 @@
+import json
+import os
+import sys
+import threading
+from typing import List, Optional
+
+import numpy as np
+
+# Fields kept next to the vectors; covers both the /api/search and /ask projections.
+DEFAULT_FIELDS = [
+    "title",
+    "current_price",
+    "product_promotion",
+    "product_specs",
+    "color_options",
+    "url",
+    "updated_at",
+]
+
+
+class LocalVectorIndex():
+    """
+    In-process vector index over a memory-mapped float32 matrix.
+
+    Rows are L2-normalized, so search is an exact (flat) inner product. When
+    the index was built with `nlist > 0`, vectors are also bucketed by k-means
+    centroids (IVF) and only the `nprobe` closest buckets are scanned.
+    Scores follow Atlas' cosine `vectorSearchScore`: (1 + cosine) / 2.
+
+    `apply_changes` updates the index in memory as products change: it
+    builds new arrays (the live matrix is never written) and swaps them in
+    as one state tuple. Row numbers never move (deleted rows are masked),
+    so a search running during an update still resolves its rows to the
+    right documents.
+    """
+
+    def __init__(self, vectors, documents: List[dict], centroids=None, assignments=None, nprobe: int = 8):
+        self.centroids = centroids
+        self.nprobe = nprobe
+        self._writeLock = threading.Lock()
+        lists = None
+        if centroids is not None:
+            assignments = np.asarray(assignments, dtype=np.int64)
+            order = np.argsort(assignments, kind="stable")
+            bounds = np.searchsorted(assignments[order], np.arange(len(centroids) + 1))
+            lists = [order[bounds[i]:bounds[i + 1]] for i in range(len(centroids))]
+        # documents, vectors (starts as a read-only memmap), deleted mask (None until
+        # the first delete), IVF lists and row -> list assignments
+        self._state = (documents, vectors, None, lists, assignments)
+
+    @property
+    def documents(self) -> List[dict]:
+        return self._state[0]
+
+    @property
+    def vectors(self):
+        return self._state[1]
+
+    def __len__(self):
+        documents, _, deleted, _, _ = self._state
+        return len(documents) - (int(deleted.sum()) if deleted is not None else 0)
+
+    @classmethod
+    def load(cls, path: str, nprobe: int = 8):
+        vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r")
+        with open(os.path.join(path, "documents.json"), encoding="utf-8") as f:
+            documents = json.load(f)
+
+        centroids = assignments = None
+        if os.path.exists(os.path.join(path, "centroids.npy")):
+            centroids = np.load(os.path.join(path, "centroids.npy"))
+            assignments = np.load(os.path.join(path, "assignments.npy"))
+        return cls(vectors, documents, centroids, assignments, nprobe=nprobe)
+
+    @classmethod
+    def build(cls, vectors, documents: List[dict], path: Optional[str] = None, nlist: int = 0, nprobe: int = 8):
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        vectors = vectors / norms
+
+        centroids = assignments = None
+        if nlist and len(vectors) > nlist:
+            centroids, assignments = _kmeans(vectors, nlist)
+
+        if path:
+            os.makedirs(path, exist_ok=True)
+            np.save(os.path.join(path, "vectors.npy"), vectors)
+            with open(os.path.join(path, "documents.json"), "w", encoding="utf-8") as f:
+                json.dump(documents, f, ensure_ascii=False, default=str)
+            if centroids is not None:
+                np.save(os.path.join(path, "centroids.npy"), centroids)
+                np.save(os.path.join(path, "assignments.npy"), assignments)
+            return cls.load(path, nprobe=nprobe)
+        return cls(vectors, documents, centroids, assignments, nprobe=nprobe)
+
+    @staticmethod
+    def _stored(document: dict) -> dict:
+        stored = {field: document[field] for field in DEFAULT_FIELDS if field in document}
+        stored["_id"] = str(document["_id"])
+        if "updated_at" in stored:
+            # Same form as documents.json, so snippet cache keys match after a reload
+            stored["updated_at"] = str(stored["updated_at"])
+        return stored
+
+    def apply_changes(self, upserts: List[dict], deletes: List):
+        """
+        Apply product changes (rag.watcher). Upserts carrying an `embedding`
+        replace or append a vector; without one only the stored fields change
+        (e.g. a new price). New products without an embedding are skipped.
+        """
+        with self._writeLock:
+            documents, vectors, deleted, lists, assignments = self._state
+            documents = list(documents)
+            rows = {str(document.get("_id")): row for row, document in enumerate(documents)}
+
+            updated = {}  # row -> new vector
+            appended, appendedVectors = [], []
+            for document in upserts:
+                row = rows.get(str(document["_id"]))
+                vector = document.get("embedding")
+                if vector is not None:
+                    vector = np.asarray(vector, dtype=np.float32)
+                    vector = vector / (np.linalg.norm(vector) or 1.0)
+                if row is None:
+                    if vector is not None:
+                        rows[str(document["_id"])] = len(documents) + len(appended)
+                        appended.append(self._stored(document))
+                        appendedVectors.append(vector)
+                    continue
+                if row >= len(documents):
+                    # Appended earlier in this batch
+                    appended[row - len(documents)] = self._stored(document)
+                    if vector is not None:
+                        appendedVectors[row - len(documents)] = vector
+                    continue
+                documents[row] = self._stored(document)
+                if deleted is not None and deleted[row]:
+                    deleted = deleted.copy()
+                    deleted[row] = False
+                if vector is not None:
+                    updated[row] = vector
+
+            for productId in deletes:
+                row = rows.get(str(productId))
+                if row is not None and row < len(documents):
+                    deleted = np.zeros(len(documents), dtype=bool) if deleted is None else deleted.copy()
+                    deleted[row] = True
+
+            updatedRows, updatedVectors = list(updated), list(updated.values())
+            if updated or appended:
+                # New arrays only: readers keep scanning the matrix they started with
+                vectors = np.vstack([vectors, np.stack(appendedVectors)]) if appended else np.array(vectors)
+                if updated:
+                    vectors[updatedRows] = np.stack(updatedVectors)
+
+            if lists is not None and (updated or appended):
+                changedRows = np.array(updatedRows + list(range(len(documents), len(documents) + len(appended))), dtype=np.int64)
+                nearest = (np.stack(updatedVectors + appendedVectors) @ self.centroids.T).argmax(axis=1)
+                assignments = np.concatenate([assignments, np.full(len(appended), -1, dtype=np.int64)])
+                lists = list(lists)
+                for bucket in set(assignments[changedRows].tolist()) - {-1}:
+                    # Re-embedded rows leave their old list...
+                    lists[bucket] = lists[bucket][~np.isin(lists[bucket], changedRows)]
+                for bucket in set(nearest.tolist()):
+                    # ...and join the list of their nearest centroid
+                    lists[bucket] = np.concatenate([lists[bucket], changedRows[nearest == bucket]])
+                assignments[changedRows] = nearest
+
+            if appended:
+                documents += appended
+                if deleted is not None:
+                    deleted = np.concatenate([deleted, np.zeros(len(appended), dtype=bool)])
+
+            self._state = (documents, vectors, deleted, lists, assignments)
+
+    def _candidates(self, lists, query):
+        if lists is None:
+            return None
+        nearest = np.argsort(-(self.centroids @ query))[:self.nprobe]
+        return np.concatenate([lists[i] for i in nearest])
+
+    def search(self, queryVector, limit: int = 4):
+        """Return [(row, score), ...] for the `limit` best rows."""
+        documents, vectors, deleted, lists, _ = self._state
+        if not len(documents):
+            return []
+        query = np.asarray(queryVector, dtype=np.float32).reshape(-1)
+        norm = np.linalg.norm(query)
+        if norm:
+            query = query / norm
+
+        rows = self._candidates(lists, query)
+        similarities = vectors @ query if rows is None else vectors[rows] @ query
+        if deleted is not None:
+            similarities[deleted[:len(similarities)] if rows is None else deleted[rows]] = -np.inf
+            limit = min(limit, int(np.isfinite(similarities).sum()))
+        limit = min(limit, len(similarities))
+        if limit <= 0:
+            return []
+        top = np.argpartition(-similarities, limit - 1)[:limit]
+        top = top[np.argsort(-similarities[top])]
+        if rows is not None:
+            return [(int(rows[i]), float((1 + similarities[i]) / 2)) for i in top]
+        return [(int(i), float((1 + similarities[i]) / 2)) for i in top]
+
+
+def _kmeans(vectors, k: int, iterations: int = 20, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), k, replace=False)].copy()
+    for _ in range(iterations):
+        assignments = (vectors @ centroids.T).argmax(axis=1)
+        for i in range(k):
+            members = vectors[assignments == i]
+            if len(members):
+                centroid = members.mean(axis=0)
+                centroids[i] = centroid / (np.linalg.norm(centroid) or 1.0)
+    return centroids, (vectors @ centroids.T).argmax(axis=1)
+
+
+def build_from_collection(collection, path: str, fields: List[str] = DEFAULT_FIELDS, nlist: int = 0):
+    """Export the `embedding` field of a Mongo collection into a local index directory."""
+    projection = {field: 1 for field in fields}
+    projection["embedding"] = 1
+
+    vectors, documents = [], []
+    for doc in collection.find({"embedding": {"$exists": True}}, projection):
+        vectors.append(doc.pop("embedding"))
+        # JSON-safe id, still the snippet cache key of the product (rag.snippets)
+        doc["_id"] = str(doc["_id"])
+        documents.append(doc)
+
+    if not vectors:
+        raise ValueError("No documents with an 'embedding' field found in the collection.")
+    return LocalVectorIndex.build(np.asarray(vectors, dtype=np.float32), documents, path=path, nlist=nlist)
+
+
+if __name__ == "__main__":
+    # python -m rag.local_index <output dir> [nlist]
+    import pymongo
+    from dotenv import load_dotenv
+    load_dotenv()
+
+    outputPath = sys.argv[1] if len(sys.argv) > 1 else "local_index"
+    nlist = int(sys.argv[2]) if len(sys.argv) > 2 else 0
+    client = pymongo.MongoClient(os.getenv("MONGODB_URI"))
+    collection = client[os.getenv("DB_NAME")][os.getenv("DB_COLLECTION")]
+    index = build_from_collection(collection, outputPath, nlist=nlist)
+    print(f"✅ Built local index with {len(index)} documents in {outputPath}")
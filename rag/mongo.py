@@ -0,0 +1,152 @@
+import os
+import threading
+import time
+from typing import Dict, List
+
+import pymongo
+
+# Fields each endpoint's prompt actually reads; nothing else is sent back by Atlas.
+SEARCH_FIELDS = ["title", "current_price", "product_promotion"]
+ASK_FIELDS = ["title", "current_price", "product_promotion", "url", "product_specs", "color_options"]
+# Identity and version of a product, kept in every result so rendered prompt
+# snippets can be cached per document version (rag.snippets). They are cache
+# keys only: `_id` is an ObjectId, so results go through rag.snippets templates
+# and never straight into a JSON response.
+KEY_FIELDS = ["_id", "updated_at"]
+
+_clients: Dict[str, pymongo.MongoClient] = {}
+_asyncClients = {}
+_lock = threading.Lock()
+
+
+def _pool_options():
+    return {
+        "maxPoolSize": int(os.getenv("MONGODB_MAX_POOL_SIZE") or 50),
+        "minPoolSize": int(os.getenv("MONGODB_MIN_POOL_SIZE") or 2),
+        "maxIdleTimeMS": int(os.getenv("MONGODB_MAX_IDLE_MS") or 60000),
+        "serverSelectionTimeoutMS": int(os.getenv("MONGODB_SERVER_SELECTION_TIMEOUT_MS") or 5000),
+        "retryReads": True,
+    }
+
+
+def get_client(uri: str) -> pymongo.MongoClient:
+    """One pooled MongoClient per URI for the whole process."""
+    with _lock:
+        client = _clients.get(uri)
+        if client is None:
+            client = pymongo.MongoClient(uri, **_pool_options())
+            _clients[uri] = client
+        return client
+
+
+def get_async_client(uri: str):
+    """motor counterpart of get_client, for serve_async.py."""
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    with _lock:
+        client = _asyncClients.get(uri)
+        if client is None:
+            client = AsyncIOMotorClient(uri, **_pool_options())
+            _asyncClients[uri] = client
+        return client
+
+
+def get_collection(uri: str, dbName: str, dbCollection: str):
+    return get_client(uri)[dbName][dbCollection]
+
+
+def ensure_version_index(collection):
+    """
+    Index {updated_at: 1, _id: 1}, read by collection_version and rag.watcher's
+    polling; without it both scan the whole collection. Failing (e.g. a
+    read-only user) only warns.
+    """
+    try:
+        collection.create_index([("updated_at", pymongo.ASCENDING), ("_id", pymongo.ASCENDING)], name="updated_at_id")
+    except Exception as e:
+        print(f"⚠️ Could not create the updated_at index on {collection.name}: {e}")
+
+
+def collection_version(collection):
+    """
+    Cheap fingerprint of a product collection (count, latest updated_at), used to invalidate caches.
+    Only cheap with ensure_version_index; not polled at all when rag.watcher is on.
+    """
+    latest = collection.find_one(
+        {}, sort=[("updated_at", pymongo.DESCENDING)], projection={"_id": 0, "updated_at": 1}
+    )
+    return (
+        collection.estimated_document_count(),
+        latest.get("updated_at") if latest else None,
+    )
+
+
+def projection_stage(fields: List[str], score: bool = True):
+    projection = {field: 1 for field in KEY_FIELDS + list(fields)}
+    if score:
+        projection["score"] = {"$meta": "vectorSearchScore"}
+    return {"$project": projection}
+
+
+def vector_search_pipeline(
+        queryVector: List[float],
+        limit: int,
+        fields: List[str] = SEARCH_FIELDS,
+        numCandidates: int = 400,
+        indexName: str = "vector_index",
+        path: str = "embedding",
+    ):
+    # An inclusion $project already drops `embedding`, so no $unset stage is needed.
+    return [
+        {
+            "$vectorSearch": {
+                "index": indexName,
+                "queryVector": queryVector,
+                "path": path,
+                "numCandidates": numCandidates,
+                "limit": limit,
+            }
+        },
+        projection_stage(fields),
+    ]
+
+
+class QueryStats():
+    """Per-query-name count and latency of Mongo calls."""
+
+    def __init__(self):
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def record(self, name: str, seconds: float):
+        with self._lock:
+            stat = self._stats.setdefault(name, {"count": 0, "total_seconds": 0.0, "max_seconds": 0.0})
+            stat["count"] += 1
+            stat["total_seconds"] += seconds
+            stat["max_seconds"] = max(stat["max_seconds"], seconds)
+
+    def stats(self):
+        with self._lock:
+            return {
+                name: {**stat, "mean_seconds": stat["total_seconds"] / stat["count"]}
+                for name, stat in self._stats.items()
+            }
+
+
+queryStats = QueryStats()
+
+
+def aggregate(collection, pipeline, name: str = "aggregate"):
+    start = time.perf_counter()
+    try:
+        return list(collection.aggregate(pipeline))
+    finally:
+        queryStats.record(name, time.perf_counter() - start)
+
+
+async def aaggregate(collection, pipeline, name: str = "aggregate"):
+    start = time.perf_counter()
+    try:
+        return await collection.aggregate(pipeline).to_list(length=None)
+    finally:
+        queryStats.record(name, time.perf_counter() - start)
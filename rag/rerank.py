@@ -0,0 +1,191 @@
+import asyncio
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from typing import List, Optional
+
+from embeddings.cache import normalize_text
+
+
+def product_text(document: dict) -> str:
+    parts = [document.get("title") or ""]
+    if document.get("current_price"):
+        parts.append(f"Giá: {document['current_price']}")
+    if isinstance(document.get("product_specs"), str):
+        parts.append(document["product_specs"].replace("<br>", "; ")[:512])
+    return ". ".join(parts)
+
+
+class CrossEncoderReranker():
+    """
+    Re-scores (query, product) pairs with a CPU cross-encoder.
+
+    Uncached pairs are scored in one batch; pair scores are kept in an LRU
+    cache keyed by query, product `_id` and product version (`updated_at`,
+    else a hash of the scored text), and dropped for products a rag.watcher
+    reports as changed. If scoring does not finish within `latencyBudgetMs`,
+    the retrieval order is kept: a batch that has not started yet is dropped,
+    one already running finishes and fills the cache. With `maxPending` batches already
+    queued or running, a request keeps the retrieval order without queueing.
+    """
+
+    def __init__(
+            self,
+            modelName: str = "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1",
+            threshold: Optional[float] = None,
+            latencyBudgetMs: float = 150,
+            cacheSize: int = 20000,
+            device: str = None,
+            maxPending: int = 4,
+        ):
+        try:
+            from sentence_transformers import CrossEncoder
+        except ImportError:
+            raise ImportError(
+                "To use CrossEncoderReranker, please install sentence-transformers "
+                "You can do this with the following command: "
+                "`pip install sentence-transformers`"
+            )
+
+        try:
+            self.model = CrossEncoder(modelName, device=device)
+        except Exception as e:
+            raise ValueError(
+                f"Failed to load cross-encoder '{modelName}'. Error: {e}"
+            ) from e
+        self.modelName = modelName
+        self.threshold = threshold
+        self.latencyBudget = latencyBudgetMs / 1000.0
+        self.cacheSize = cacheSize
+        self.maxPending = maxPending
+
+        self.cacheHits = 0
+        self.cacheMisses = 0
+        self.fallbacks = 0
+        self.shed = 0
+        self.expired = 0
+        self._pending = 0
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        # Single worker: the model is not shared between threads
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="rerank")
+
+    def _score(self, pairs, keys, deadline):
+        if time.perf_counter() > deadline:
+            # Its request has already fallen back to the retrieval order
+            with self._lock:
+                self.expired += 1
+            return None
+        scores = self.model.predict(pairs, batch_size=len(pairs), show_progress_bar=False)
+        with self._lock:
+            for key, score in zip(keys, scores):
+                self._cache[key] = float(score)
+                self._cache.move_to_end(key)
+            while len(self._cache) > self.cacheSize:
+                self._cache.popitem(last=False)
+        return scores
+
+    @staticmethod
+    def _product_key(document: dict):
+        """(product id, version): the score changes with the price, so it is part of the key."""
+        version = document.get("updated_at")
+        if version is None:
+            version = hashlib.blake2b(product_text(document).encode("utf-8"), digest_size=8).hexdigest()
+        productId = document.get("_id")
+        return str(productId if productId is not None else document.get("title")), str(version)
+
+    def rerank(self, query: str, documents: List[dict], topK: int = 4) -> List[dict]:
+        if not documents:
+            return []
+        start = time.perf_counter()
+        normalized = normalize_text(query)
+        keys = [(normalized, *self._product_key(document)) for document in documents]
+
+        with self._lock:
+            scores = [self._cache.get(key) for key in keys]
+            for key, score in zip(keys, scores):
+                if score is not None:
+                    self._cache.move_to_end(key)
+            missing = [i for i, score in enumerate(scores) if score is None]
+            self.cacheHits += len(documents) - len(missing)
+            self.cacheMisses += len(missing)
+            if missing:
+                if self._pending >= self.maxPending:
+                    self.shed += 1
+                    self.fallbacks += 1
+                    return documents[:topK]
+                self._pending += 1
+
+        if missing:
+            deadline = start + self.latencyBudget
+            future = self._executor.submit(
+                self._score,
+                [(query, product_text(documents[i])) for i in missing],
+                [keys[i] for i in missing],
+                deadline,
+            )
+            future.add_done_callback(self._done)
+            try:
+                scored = future.result(timeout=max(deadline - time.perf_counter(), 0))
+            except TimeoutError:
+                # Not started yet: never run it; already running: it only fills the cache
+                future.cancel()
+                scored = None
+            if scored is None:
+                with self._lock:
+                    self.fallbacks += 1
+                return documents[:topK]
+            for i, score in zip(missing, scored):
+                scores[i] = float(score)
+
+        ranked = sorted(zip(scores, range(len(documents))), key=lambda pair: pair[0], reverse=True)
+        results = []
+        for score, i in ranked[:topK]:
+            if self.threshold is not None and score < self.threshold:
+                break
+            results.append({**documents[i], "rerank_score": score})
+        return results
+
+    def apply_changes(self, upserts: List[dict], deletes: List):
+        """rag.watcher sink: forget the scores of changed products even when `updated_at` was not bumped."""
+        changed = {str(document["_id"]) for document in upserts} | {str(productId) for productId in deletes}
+        if not changed:
+            return
+        with self._lock:
+            for key in [key for key in self._cache if key[1] in changed]:
+                del self._cache[key]
+
+    def _done(self, future):
+        with self._lock:
+            self._pending -= 1
+
+    def stats(self):
+        with self._lock:
+            total = self.cacheHits + self.cacheMisses
+            return {
+                "cache_hit_rate": self.cacheHits / total if total else 0.0,
+                "fallbacks": self.fallbacks,
+                "shed": self.shed,
+                "expired": self.expired,
+                "pending": self._pending,
+            }
+
+
+class RerankingRetriever():
+    """Fetches `candidates` hits from a retriever and keeps the reranker's best `limit`."""
+
+    def __init__(self, retriever, reranker: CrossEncoderReranker, candidates: int = 10):
+        self.retriever = retriever
+        self.reranker = reranker
+        self.fields = retriever.fields
+        self.candidates = candidates
+
+    def vector_search(self, user_query: str, limit: int = 4):
+        hits = self.retriever.vector_search(user_query, max(self.candidates, limit))
+        return self.reranker.rerank(user_query, hits, limit)
+
+    async def avector_search(self, user_query: str, limit: int = 4):
+        hits = await self.retriever.avector_search(user_query, max(self.candidates, limit))
+        return await asyncio.to_thread(self.reranker.rerank, user_query, hits, limit)
@@ -0,0 +1,92 @@
+import asyncio
+from typing import List
+
+import numpy as np
+
+from rag.local_index import LocalVectorIndex
+from rag.mongo import SEARCH_FIELDS, KEY_FIELDS, vector_search_pipeline, aggregate, aaggregate
+
+
+class BaseRetriever():
+    """Retriever contract: vector_search(query, limit) -> list of documents with a `score`."""
+
+    def __init__(self, embedding, fields: List[str] = SEARCH_FIELDS):
+        self.embedding = embedding
+        self.fields = fields
+
+    def get_embedding(self, text: str):
+        if not text.strip():
+            return None
+        return np.asarray(self.embedding.encode(text), dtype=np.float32).reshape(-1)
+
+    def vector_search(self, user_query: str, limit: int = 4):
+        raise NotImplementedError("The vector_search method must be implemented by subclasses")
+
+    async def avector_search(self, user_query: str, limit: int = 4):
+        # Encoding and the local index are CPU-bound: keep them off the event loop.
+        return await asyncio.to_thread(self.vector_search, user_query, limit)
+
+
+class AtlasRetriever(BaseRetriever):
+    def __init__(
+            self,
+            collection,
+            embedding,
+            fields: List[str] = SEARCH_FIELDS,
+            numCandidates: int = 400,
+            indexName: str = "vector_index",
+            asyncCollection=None,
+            name: str = "vector_search",
+        ):
+        super().__init__(embedding, fields)
+        self.collection = collection
+        # Optional motor collection for avector_search
+        self.asyncCollection = asyncCollection
+        self.numCandidates = numCandidates
+        self.indexName = indexName
+        self.name = name  # label for per-query timings in rag.mongo.queryStats
+
+    def _pipeline(self, query_embedding, limit: int):
+        return vector_search_pipeline(
+            query_embedding.tolist(),
+            limit,
+            fields=self.fields,
+            numCandidates=self.numCandidates,
+            indexName=self.indexName,
+        )
+
+    def vector_search(self, user_query: str, limit: int = 4):
+        query_embedding = self.get_embedding(user_query)
+        if query_embedding is None:
+            return []
+        return aggregate(self.collection, self._pipeline(query_embedding, limit), self.name)
+
+    async def avector_search(self, user_query: str, limit: int = 4):
+        if self.asyncCollection is None:
+            return await super().avector_search(user_query, limit)
+
+        query_embedding = await asyncio.to_thread(self.get_embedding, user_query)
+        if query_embedding is None:
+            return []
+        return await aaggregate(self.asyncCollection, self._pipeline(query_embedding, limit), self.name)
+
+
+class LocalRetriever(BaseRetriever):
+    """Offline retriever over a LocalVectorIndex, same contract as AtlasRetriever."""
+
+    def __init__(self, index: LocalVectorIndex, embedding, fields: List[str] = SEARCH_FIELDS):
+        super().__init__(embedding, fields)
+        self.index = index
+
+    def vector_search(self, user_query: str, limit: int = 4):
+        query_embedding = self.get_embedding(user_query)
+        if query_embedding is None:
+            return []
+
+        results = []
+        for row, score in self.index.search(query_embedding, limit):
+            document = self.index.documents[row]
+            result = {field: document[field] for field in KEY_FIELDS + self.fields if field in document}
+            result["score"] = score
+            results.append(result)
+        return results
@@ -0,0 +1,234 @@
+import asyncio
+import threading
+import time
+from typing import AsyncIterator, Awaitable, Callable, Iterable, Optional, Tuple
+
+
+class FlightAbandoned(Exception):
+    """The leading request went away before its answer was complete."""
+
+
+class FlightTimeout(Exception):
+    """No new answer piece from the leading request within the wait bound."""
+
+
+class Flight():
+    """Answer pieces of one in-flight pipeline, readable by any number of followers."""
+
+    def __init__(self):
+        self.chunks = []
+        self.done = False
+        self.error = None
+        self.updatedAt = time.monotonic()
+        self._condition = threading.Condition()
+
+    def publish(self, text: str):
+        with self._condition:
+            self.chunks.append(text)
+            self.updatedAt = time.monotonic()
+            self._condition.notify_all()
+
+    def finish(self, error: Optional[BaseException] = None):
+        with self._condition:
+            self.done, self.error = True, error
+            self._condition.notify_all()
+
+    def follow(self, maxWait: float):
+        position = 0
+        while True:
+            with self._condition:
+                if not self._condition.wait_for(lambda: position < len(self.chunks) or self.done, maxWait):
+                    raise FlightTimeout()
+                chunks, done, error = self.chunks[position:], self.done, self.error
+            position += len(chunks)
+            yield from chunks
+            if done and position == len(self.chunks):
+                if error is not None:
+                    raise error
+                return
+
+
+class AsyncFlight():
+    """Flight for one event loop (serve_async.py)."""
+
+    def __init__(self):
+        self.chunks = []
+        self.done = False
+        self.error = None
+        self.updatedAt = time.monotonic()
+        self._changed = asyncio.Event()
+
+    def _notify(self):
+        self.updatedAt = time.monotonic()
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def publish(self, text: str):
+        self.chunks.append(text)
+        self._notify()
+
+    def finish(self, error: Optional[BaseException] = None):
+        self.done, self.error = True, error
+        self._notify()
+
+    async def follow(self, maxWait: float):
+        position = 0
+        while True:
+            if position == len(self.chunks) and not self.done:
+                try:
+                    await asyncio.wait_for(self._changed.wait(), maxWait)
+                except asyncio.TimeoutError:
+                    raise FlightTimeout()
+                continue
+            chunks = self.chunks[position:]
+            position += len(chunks)
+            for text in chunks:
+                yield text
+            if self.done and position == len(self.chunks):
+                if self.error is not None:
+                    raise self.error
+                return
+
+
+class SingleFlight():
+    """
+    Coalesces identical concurrent requests.
+
+    The first request for a key (the leader) runs the pipeline; requests for
+    the same key arriving while it is in flight follow its answer pieces as
+    they are produced instead of calling reflection, retrieval and the LLM
+    again. When the leader's pipeline raises, every follower gets the same
+    exception rather than retrying a failing upstream all at once. A follower
+    runs the pipeline itself when the leader is abandoned or produces nothing
+    for `maxWait` seconds before the first piece reached it. Finished and
+    failed flights are forgotten, so the next request for the key starts
+    afresh; repeated questions after that are the answer cache's job.
+    """
+
+    def __init__(self, maxWait: float = 15.0):
+        self.maxWait = maxWait
+        self.leaders = 0
+        self.followers = 0
+        self.fallbacks = 0
+        self._flights = {}
+        self._asyncFlights = {}
+        self._lock = threading.Lock()
+
+    def _join(self, flights: dict, key: str, factory):
+        with self._lock:
+            flight = flights.get(key)
+            # A leader that stopped making progress (e.g. its response was never read) is replaced
+            if flight is not None and not flight.done and time.monotonic() - flight.updatedAt <= self.maxWait:
+                self.followers += 1
+                return flight, False
+            flight = flights[key] = factory()
+            self.leaders += 1
+            return flight, True
+
+    def _land(self, flights: dict, key: str, flight, error: Optional[BaseException] = None):
+        if error is not None and not isinstance(error, Exception):
+            # The leader was cancelled or interrupted: nothing followers should re-raise
+            error = FlightAbandoned()
+        flight.finish(error)
+        with self._lock:
+            if flights.get(key) is flight:
+                del flights[key]
+
+    # === Threads (serve.py) ===
+    def run(self, key: Optional[str], pipeline: Callable[[], Iterable[str]]) -> Tuple[Iterable[str], bool]:
+        """
+        Answer pieces for `key`, and whether this request is the leader.
+        `pipeline()` does its work up to the first piece eagerly and returns
+        an iterable of the rest; a `None` key is never coalesced.
+        """
+        if key is None:
+            return pipeline(), True
+        flight, leader = self._join(self._flights, key, Flight)
+        if not leader:
+            return self._follow(flight, pipeline), False
+        try:
+            chunks = pipeline()
+        except BaseException as e:
+            self._land(self._flights, key, flight, e)
+            raise
+        return self._lead(key, flight, chunks), True
+
+    def _lead(self, key, flight, chunks):
+        error = FlightAbandoned()
+        try:
+            for text in chunks:
+                flight.publish(text)
+                yield text
+            error = None
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            self._land(self._flights, key, flight, error)
+
+    def _follow(self, flight: Flight, pipeline):
+        received = False
+        try:
+            for text in flight.follow(self.maxWait):
+                received = True
+                yield text
+        except (FlightAbandoned, FlightTimeout):
+            if received:
+                raise
+            with self._lock:
+                self.fallbacks += 1
+            yield from pipeline()
+
+    # === asyncio (serve_async.py) ===
+    async def arun(
+            self, key: Optional[str], pipeline: Callable[[], Awaitable[AsyncIterator[str]]],
+        ) -> Tuple[AsyncIterator[str], bool]:
+        """Async run(): `await pipeline()` returns an async iterator of answer pieces."""
+        if key is None:
+            return await pipeline(), True
+        flight, leader = self._join(self._asyncFlights, key, AsyncFlight)
+        if not leader:
+            return self._afollow(flight, pipeline), False
+        try:
+            chunks = await pipeline()
+        except BaseException as e:
+            self._land(self._asyncFlights, key, flight, e)
+            raise
+        return self._alead(key, flight, chunks), True
+
+    async def _alead(self, key, flight, chunks):
+        error = FlightAbandoned()
+        try:
+            async for text in chunks:
+                flight.publish(text)
+                yield text
+            error = None
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            self._land(self._asyncFlights, key, flight, error)
+
+    async def _afollow(self, flight: AsyncFlight, pipeline):
+        received = False
+        try:
+            async for text in flight.follow(self.maxWait):
+                received = True
+                yield text
+        except (FlightAbandoned, FlightTimeout):
+            if received:
+                raise
+            with self._lock:
+                self.fallbacks += 1
+            async for text in await pipeline():
+                yield text
+
+    def stats(self):
+        total = self.leaders + self.followers
+        return {
+            "in_flight": len(self._flights) + len(self._asyncFlights),
+            "leaders": self.leaders,
+            "followers": self.followers,
+            "fallbacks": self.fallbacks,
+            "coalesced_rate": self.followers / total if total else 0.0,
+        }
@@ -0,0 +1,184 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from string import Formatter
+from typing import Callable, Dict, List, Optional
+
+
+class SnippetTemplate():
+    """
+    A product block, e.g. one entry of the /ask context.
+
+    `fields` turns a document into the template's placeholders; the template
+    is parsed once here, so rendering is a single `str.format_map`.
+    `sources` are the document fields those functions read.
+    """
+
+    def __init__(self, name: str, template: str, fields: Dict[str, Callable[[dict], str]], sources: List[str]):
+        placeholders = {field for _, field, _, _ in Formatter().parse(template) if field}
+        if placeholders != set(fields):
+            raise ValueError(f"Template '{name}' uses {sorted(placeholders)} but defines {sorted(fields)}")
+        self.name = name
+        self.template = template
+        self.fields = fields
+        self.sources = sources
+
+    def render(self, document: dict) -> str:
+        return self.template.format_map({field: fn(document) for field, fn in self.fields.items()})
+
+
+def _promotion_suffix(document):
+    promotion = document.get('product_promotion')
+    return f", Ưu đãi: {promotion}" if promotion else ""
+
+
+def _colors(document):
+    colors = document.get('color_options')
+    return ', '.join(colors) if isinstance(colors, list) else 'Không có'
+
+
+def _specs(document):
+    specs = document.get('product_specs')
+    return specs.replace("<br>", "; ") if isinstance(specs, str) else 'Không có'
+
+
+def _detail_link(document):
+    url = document.get('url', '')
+    return f"- **[Xem chi tiết sản phẩm]({url})**\n" if url else ""
+
+
+# One line of RAG.format_knowledge (/api/search), without its "\n {i}) " prefix.
+# Line breaks in the crawled fields are already turned into newlines.
+KNOWLEDGE_SNIPPET = SnippetTemplate(
+    "knowledge",
+    "Tên: {title}, Giá: {price}{promotion}",
+    {
+        "title": lambda document: str(document.get('title')).replace('<br>', '\n'),
+        "price": lambda document: str(document.get('current_price')).replace('<br>', '\n'),
+        "promotion": lambda document: _promotion_suffix(document).replace('<br>', '\n'),
+    },
+    sources=["title", "current_price", "product_promotion"],
+)
+
+# One product of serve.build_prompt (/ask), without its "### {i}. " prefix.
+ASK_SNIPPET = SnippetTemplate(
+    "ask",
+    "**{title}**\n"
+    "- **Giá**: {price}\n"
+    "- **Ưu đãi**: {promotions}\n"
+    "- **Màu sắc**: {colors}\n"
+    "- **Thông số**: {specs}\n"
+    "{link}\n",
+    {
+        "title": lambda document: document.get('title', 'N/A'),
+        "price": lambda document: document.get('current_price', 'Liên hệ'),
+        "promotions": lambda document: str(document.get('product_promotion', '')).strip() or 'Không có',
+        "colors": _colors,
+        "specs": _specs,
+        "link": _detail_link,
+    },
+    sources=["title", "current_price", "product_promotion", "color_options", "product_specs", "url"],
+)
+
+SEARCH_PROMPT = (
+    "Hãy trở thành chuyên gia tư vấn bán hàng cho một cửa hàng điện thoại. "
+    "Câu hỏi của khách hàng: {query}\n"
+    "Trả lời dựa vào các thông tin dưới đây: {knowledge}."
+)
+
+ASK_PROMPT = """Bạn là một chuyên gia tư vấn bán điện thoại tại cửa hàng **DBIZ**.
+
+**Câu hỏi của khách hàng:** _{query}_
+
+Dưới đây là các sản phẩm liên quan:
+
+{context}
+Vui lòng trả lời khách một cách thân thiện, dễ hiểu và rõ ràng!  
+Nếu khách hàng muốn biết thêm, hãy mời họ bấm vào link để xem chi tiết sản phẩm.
+"""
+
+
+class SnippetCache():
+    """
+    LRU of rendered product snippets keyed by template, product `_id` and
+    document version, so an edited product is re-rendered. The version is
+    `updated_at` when the document has one, else a hash of the fields the
+    template reads. Documents without an `_id` (e.g. an old local index) are
+    rendered every time.
+    """
+
+    def __init__(self, maxSize: int = 5000):
+        self.maxSize = maxSize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(template: SnippetTemplate, document: dict):
+        productId = document.get('_id')
+        if productId is None:
+            return None
+        version = document.get('updated_at')
+        if version is None:
+            values = repr([document.get(field) for field in template.sources])
+            version = hashlib.blake2b(values.encode('utf-8'), digest_size=8).hexdigest()
+        return (template.name, str(productId), str(version))
+
+    def render(self, template: SnippetTemplate, document: dict) -> str:
+        key = self._key(template, document)
+        if key is not None:
+            with self._lock:
+                snippet = self._entries.get(key)
+                if snippet is not None:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return snippet
+
+        snippet = template.render(document)
+        with self._lock:
+            self.misses += 1
+            if key is not None:
+                self._entries[key] = snippet
+                while len(self._entries) > self.maxSize:
+                    self._entries.popitem(last=False)
+        return snippet
+
+    def invalidate(self, productId: Optional[str] = None):
+        """Drop every snippet of one product (any version), or everything."""
+        with self._lock:
+            if productId is None:
+                self._entries.clear()
+                return
+            for key in [key for key in self._entries if key[1] == str(productId)]:
+                del self._entries[key]
+
+    def apply_changes(self, upserts: List[dict], deletes: List):
+        """rag.watcher sink: forget changed products even when `updated_at` was not bumped."""
+        for productId in [document["_id"] for document in upserts] + list(deletes):
+            self.invalidate(productId)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+snippetCache = SnippetCache(maxSize=int(os.getenv("SNIPPET_CACHE_SIZE") or 5000))
+
+
+def render_knowledge(knowledge: List[dict], cache: SnippetCache = snippetCache) -> str:
+    """The numbered product list of RAG.format_knowledge (products without a price are left out)."""
+    snippets = [cache.render(KNOWLEDGE_SNIPPET, result) for result in knowledge if result.get('current_price')]
+    return ''.join(f"\n {i}) {snippet}" for i, snippet in enumerate(snippets, 1))
+
+
+def render_ask_context(results: List[dict], cache: SnippetCache = snippetCache) -> str:
+    return ''.join(
+        f"### {i}. {cache.render(ASK_SNIPPET, item)}" for i, item in enumerate(results, 1)
+    )
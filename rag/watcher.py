@@ -0,0 +1,224 @@
+import threading
+import time
+import traceback
+from typing import List, Optional
+
+from rag.local_index import DEFAULT_FIELDS
+
+
+class ProductWatcher():
+    """
+    Background thread that keeps in-process copies of the product collection
+    fresh without a rebuild.
+
+    Changes are read from a MongoDB change stream (replica set / Atlas) and
+    handed in batches to every sink's `apply_changes(upserts, deletes)`:
+    SnippetCache, SemanticAnswerCache, LocalVectorIndex, BM25Index. Where
+    change streams are unavailable (standalone mongod, mongomock), it polls
+    for documents past the last seen (`updated_at`, `_id`) and periodically
+    diffs `_id`s to find deletes; edits that do not bump `updated_at` are
+    then not seen. Polling creates the {updated_at: 1, _id: 1} index it reads.
+    """
+
+    def __init__(
+            self,
+            collection,
+            sinks: List,
+            fields: List[str] = DEFAULT_FIELDS,
+            withEmbedding: bool = False,
+            mode: str = "auto",
+            pollInterval: float = 5.0,
+            deleteScanInterval: float = 300.0,
+            batchSize: int = 500,
+            batchWaitMs: float = 200.0,
+            name: str = "products",
+        ):
+        if mode not in ("auto", "stream", "poll"):
+            raise ValueError(f"Unknown watcher mode '{mode}', expected 'auto', 'stream' or 'poll'")
+        self.collection = collection
+        self.sinks = sinks
+        self.projection = {field: 1 for field in fields}
+        if withEmbedding:
+            # Needed to move a product in a LocalVectorIndex after it was re-embedded
+            self.projection["embedding"] = 1
+        self.mode = mode
+        self.pollInterval = pollInterval
+        self.deleteScanInterval = deleteScanInterval
+        self.batchSize = batchSize
+        self.batchWait = batchWaitMs / 1000.0
+        self.name = name
+
+        self.resumeToken = None
+        self.activeMode = None
+        self.upserts = 0
+        self.deletes = 0
+        self.batches = 0
+        self.errors = 0
+        self.lastChangeAt = None
+
+        # Position of the last polled change: (updated_at, _id)
+        self._since = None
+        self._sinceId = None
+        self._knownIds = None
+        self._deleteScannedAt = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+
+    # === Applying changes ===
+    def apply(self, upserts: List[dict], deletes: List):
+        if not upserts and not deletes:
+            return
+        for sink in self.sinks:
+            try:
+                sink.apply_changes(upserts, deletes)
+            except Exception:
+                self.errors += 1
+                traceback.print_exc()
+        self.upserts += len(upserts)
+        self.deletes += len(deletes)
+        self.batches += 1
+        self.lastChangeAt = time.time()
+
+    # === Change stream ===
+    def _watch(self):
+        pipeline = [{"$match": {"operationType": {"$in": ["insert", "update", "replace", "delete"]}}}]
+        upserts, deletes, firstPending = [], [], None
+        with self.collection.watch(
+                pipeline, full_document="updateLookup", resume_after=self.resumeToken, max_await_time_ms=1000,
+            ) as stream:
+            self.activeMode = "stream"
+            print(f"✅ Watching {self.name} through a change stream")
+            while not self._stop.is_set():
+                change = stream.try_next()
+                if change is not None:
+                    if change["operationType"] == "delete" or change.get("fullDocument") is None:
+                        # A document updated then deleted before the lookup has no fullDocument
+                        deletes.append(change["documentKey"]["_id"])
+                    else:
+                        document = change["fullDocument"]
+                        upserts.append({field: document[field] for field in ["_id", *self.projection] if field in document})
+                    firstPending = firstPending or time.monotonic()
+
+                if firstPending and (
+                        change is None
+                        or len(upserts) + len(deletes) >= self.batchSize
+                        or time.monotonic() - firstPending >= self.batchWait):
+                    self.apply(upserts, deletes)
+                    upserts, deletes, firstPending = [], [], None
+                # Only advance past changes that were applied
+                if firstPending is None:
+                    self.resumeToken = stream.resume_token
+            self.apply(upserts, deletes)
+
+    # === updated_at polling ===
+    def _latest(self):
+        latest = self.collection.find_one(
+            {"updated_at": {"$exists": True}}, sort=[("updated_at", -1)], projection={"_id": 1, "updated_at": 1}
+        )
+        return latest.get("updated_at") if latest else None
+
+    def _scan_ids(self):
+        return {document["_id"] for document in self.collection.find({}, {"_id": 1})}
+
+    def poll_once(self):
+        """Apply everything changed since the previous poll; returns the number of changes."""
+        if self._since is None and self._knownIds is None:
+            # First call: start from the current state
+            since = self._latest()
+            sinceId = None
+            if since is not None:
+                last = self.collection.find_one({"updated_at": since}, sort=[("_id", -1)], projection={"_id": 1})
+                sinceId = last["_id"] if last else None
+            self._knownIds = self._scan_ids()
+            self._since, self._sinceId = since, sinceId
+            self._deleteScannedAt = time.monotonic()
+            return 0
+
+        # Keyset paging on (updated_at, _id): a bulk update that gives more than
+        # `batchSize` products one timestamp is read page by page, not re-read
+        if self._since is None:
+            query = {"updated_at": {"$exists": True}}
+        else:
+            query = {"$or": [
+                {"updated_at": {"$gt": self._since}},
+                {"updated_at": self._since, "_id": {"$gt": self._sinceId}},
+            ]}
+        cursor = self.collection.find(query, self.projection).sort([("updated_at", 1), ("_id", 1)])
+        upserts = list(cursor.limit(self.batchSize))
+
+        if upserts:
+            self._since, self._sinceId = upserts[-1]["updated_at"], upserts[-1]["_id"]
+            self._knownIds.update(document["_id"] for document in upserts)
+
+        deletes = []
+        if time.monotonic() - self._deleteScannedAt >= self.deleteScanInterval:
+            current = self._scan_ids()
+            deletes = list(self._knownIds - current)
+            self._knownIds = current
+            self._deleteScannedAt = time.monotonic()
+
+        self.apply(upserts, deletes)
+        return len(upserts) + len(deletes)
+
+    def _poll(self):
+        self.activeMode = "poll"
+        try:
+            self.collection.create_index([("updated_at", 1), ("_id", 1)], name="updated_at_id")
+        except Exception as e:
+            print(f"⚠️ Could not create the updated_at index on {self.name}: {e}")
+        print(f"✅ Watching {self.name} by polling updated_at every {self.pollInterval:g}s")
+        while not self._stop.is_set():
+            try:
+                # A full batch means more changes are waiting: poll again right away
+                if self.poll_once() >= self.batchSize:
+                    continue
+            except Exception:
+                self.errors += 1
+                traceback.print_exc()
+            self._stop.wait(self.pollInterval)
+
+    # === Thread ===
+    def _run(self):
+        if self.mode in ("auto", "stream"):
+            while not self._stop.is_set():
+                try:
+                    self._watch()
+                    return
+                except NotImplementedError as e:
+                    # mongomock and friends
+                    error = e
+                except Exception as e:
+                    # Standalone mongod: "The $changeStream stage is only supported on replica sets"
+                    error = e
+                    if self.activeMode == "stream":
+                        # The stream worked before: resume it after a short pause
+                        self.errors += 1
+                        print(f"⚠️ Change stream on {self.name} interrupted ({e}), resuming")
+                        self._stop.wait(1.0)
+                        continue
+                if self.mode == "stream":
+                    raise error
+                print(f"⚠️ Change streams unavailable on {self.name} ({error}), falling back to polling")
+                break
+        self._poll()
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name=f"watch-{self.name}", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout: Optional[float] = None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def stats(self):
+        return {
+            "stream": int(self.activeMode == "stream"),
+            "upserts": self.upserts,
+            "deletes": self.deletes,
+            "batches": self.batches,
+            "errors": self.errors,
+            "seconds_since_change": time.time() - self.lastChangeAt if self.lastChangeAt else 0.0,
+        }
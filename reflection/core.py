@@ -1,28 +1,141 @@
+import asyncio
+import re
+import threading
+import time
+
+import numpy as np
+
+from embeddings.base import estimate_tokens
+
+# Words that usually point back at something said earlier ("nó", "máy đó", "còn ... thì sao").
+REFERENCE_PATTERN = re.compile(
+    r"\b(nó|chúng|cái (này|đó|kia)|máy (này|đó|kia)|con (này|đó|kia)|loại (này|đó)|"
+    r"sản phẩm (này|đó|trên)|mẫu (này|đó)|đó|kia|ấy|trên|vậy|thế còn|còn .* thì sao|"
+    r"it|that|this one|those|them)\b",
+    re.IGNORECASE,
+)
+
+
 class Reflection():
-    def __init__(self, llm):
+    def __init__(
+            self,
+            llm,
+            embedding=None,
+            maxHistoryTokens: int = 1000,
+            minStandaloneWords: int = 4,
+            similarityThreshold: float = 0.9,
+        ):
+        """
+        Rewrites the latest question into a standalone one, but only when needed.
+
+        The LLM is skipped for first-turn questions and for questions that look
+        self-contained: no reference words, at least `minStandaloneWords` words
+        and, when an `embedding` is given, a question embedding that stays within
+        `similarityThreshold` cosine of the question embedded with the previous
+        user turn. Otherwise the most recent turns that fit in `maxHistoryTokens`
+        are sent.
+
+        Whether a question is a first turn is read from `firstTurn` when given:
+        the history from ConversationMemory.build may be trimmed down to one user
+        turn, so callers decide it on the client's history (`first_turn`).
+        """
         self.llm = llm
+        self.embedding = embedding
+        self.maxHistoryTokens = maxHistoryTokens
+        self.minStandaloneWords = minStandaloneWords
+        self.similarityThreshold = similarityThreshold
+
+        self.calls = 0
+        self.skipped = {"first_turn": 0, "standalone": 0}
+        self.llmCalls = 0
+        self.llmSeconds = 0.0
+        self._lock = threading.Lock()
+
+    def _text(self, entry):
+        return ' '.join(part.get('text', '') for part in entry.get('parts', []))
 
     def _concat_and_format_texts(self, data):
         concatenatedTexts = []
         for entry in data:
             role = entry.get('role', '')
-            all_texts = ' '.join(part.get('text', '') for part in entry['parts'])
+            all_texts = self._text(entry)
             concatenatedTexts.append(f"{role}: {all_texts} \n")
         return ''.join(concatenatedTexts)
 
+    def _window(self, chatHistory, lastItemsConsidereds=100):
+        """Most recent turns (always including the latest) that fit the token budget."""
+        chatHistory = chatHistory[-lastItemsConsidereds:]
+        window = []
+        used = 0
+        for entry in reversed(chatHistory):
+            tokens = estimate_tokens(self._text(entry))
+            if window and used + tokens > self.maxHistoryTokens:
+                break
+            window.append(entry)
+            used += tokens
+        return window[::-1]
+
+    @staticmethod
+    def first_turn(chatHistory):
+        """True when the (untrimmed) history holds at most one user turn."""
+        return sum(1 for entry in chatHistory if entry.get('role') == 'user') <= 1
+
+    def _skip_reason(self, chatHistory, firstTurn=None):
+        """Why the LLM rewrite is unnecessary, or None when it is needed."""
+        if firstTurn is None:
+            firstTurn = self.first_turn(chatHistory)
+        if firstTurn:
+            return "first_turn"
+
+        userTurns = [entry for entry in chatHistory if entry.get('role') == 'user']
+        question = self._text(userTurns[-1])
+        if REFERENCE_PATTERN.search(question) or len(question.split()) < self.minStandaloneWords:
+            return None
 
-    def __call__(self, chatHistory, lastItemsConsidereds=100):
-        
-        if len(chatHistory) >= lastItemsConsidereds:
-            chatHistory = chatHistory[len(chatHistory) - lastItemsConsidereds:]
+        if self.embedding is not None:
+            if len(userTurns) < 2:
+                # The earlier questions were trimmed away: nothing to compare with
+                return None
+            previous = self._text(userTurns[-2])
+            vectors = np.asarray(
+                self.embedding.encode([question, f"{previous} {question}"]), dtype=np.float32
+            )
+            vectors /= np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-12
+            if float(vectors[0] @ vectors[1]) < self.similarityThreshold:
+                return None
+        return "standalone"
 
-        historyString = self._concat_and_format_texts(chatHistory)
+    def _build_prompt(self, chatHistory, lastItemsConsidereds=100):
+        historyString = self._concat_and_format_texts(self._window(chatHistory, lastItemsConsidereds))
 
         higherLevelSummariesPrompt = """Given a chat history and the latest user question which might reference context in the chat history, formulate a standalone question in Vietnamese which can be understood without the chat history. Do NOT answer the question, just reformulate it if needed and otherwise return it as is. {historyString}
         """.format(historyString=historyString)
 
-        print(higherLevelSummariesPrompt)
+        return higherLevelSummariesPrompt
+
+    def _skip(self, chatHistory, firstTurn=None):
+        with self._lock:
+            self.calls += 1
+        reason = self._skip_reason(chatHistory, firstTurn)
+        if reason is None:
+            return None
+        with self._lock:
+            self.skipped[reason] += 1
+        return self._text(chatHistory[-1])
+
+    def _record_llm(self, seconds):
+        with self._lock:
+            self.llmCalls += 1
+            self.llmSeconds += seconds
+
+    def __call__(self, chatHistory, lastItemsConsidereds=100, firstTurn=None):
+        standalone = self._skip(chatHistory, firstTurn)
+        if standalone is not None:
+            return standalone
 
+        higherLevelSummariesPrompt = self._build_prompt(chatHistory, lastItemsConsidereds)
+
+        start = time.perf_counter()
         completion = self.llm.chat.completions.create(
             model="gpt-4o-mini",
             messages=[
@@ -32,6 +145,42 @@ class Reflection():
                 }
             ]
         )
-    
+        self._record_llm(time.perf_counter() - start)
+
+        return completion.choices[0].message.content
+
+    async def acall(self, chatHistory, lastItemsConsidereds=100, firstTurn=None):
+        """Async variant of __call__ for an openai.AsyncOpenAI client."""
+        # The skip check may encode: keep it off the event loop
+        standalone = await asyncio.to_thread(self._skip, chatHistory, firstTurn)
+        if standalone is not None:
+            return standalone
+
+        higherLevelSummariesPrompt = self._build_prompt(chatHistory, lastItemsConsidereds)
+
+        start = time.perf_counter()
+        completion = await self.llm.chat.completions.create(
+            model="gpt-4o-mini",
+            messages=[
+                {
+                    "role": "user",
+                    "content": higherLevelSummariesPrompt
+                }
+            ]
+        )
+        self._record_llm(time.perf_counter() - start)
+
         return completion.choices[0].message.content
 
+    def stats(self):
+        skipped = sum(self.skipped.values())
+        meanLlmSeconds = self.llmSeconds / self.llmCalls if self.llmCalls else 0.0
+        return {
+            "calls": self.calls,
+            "skipped": dict(self.skipped),
+            "skip_rate": skipped / self.calls if self.calls else 0.0,
+            "llm_calls": self.llmCalls,
+            "mean_llm_seconds": meanLlmSeconds,
+            # Every skip saves roughly one average reflection call
+            "estimated_seconds_saved": skipped * meanLlmSeconds,
+        }
@@ -1,4 +1,5 @@
 from semantic_router.route import Route
 from semantic_router.router import SemanticRouter
+from semantic_router.lexical import LexicalRouter, TieredRouter
 from semantic_router.samples import *
 
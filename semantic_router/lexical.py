@@ -0,0 +1,247 @@
+import re
+import threading
+import unicodedata
+import zlib
+
+import numpy as np
+
+from embeddings.cache import strip_accents
+
+_WORD = re.compile(r"\w+")
+# Politeness particles that do not change what a short message is ("cảm ơn nhé")
+_PARTICLES = {"ạ", "a", "nhé", "nhe", "nha", "nhá", "ha", "shop", "bạn", "ad", "admin"}
+
+
+def normalize_query(text: str) -> str:
+    """NFC, case-folded words without punctuation, single-spaced."""
+    return ' '.join(_WORD.findall(unicodedata.normalize('NFC', text).casefold()))
+
+
+class LexicalRouter():
+    """
+    Microsecond pre-router from the same routes as SemanticRouter.
+
+    Two cheap signals, both only used when they are confident:
+    - keywords: a route's `keywords` as whole words (brands, model lines) or
+      its `phrases` as the whole message (greetings, thanks); a message that
+      hits keywords of more than one route is left undecided;
+    - a linear model over hashed word unigrams and accent-free char n-grams,
+      trained on the route samples at start-up (softmax regression).
+
+    `classify` returns `(score, routeName, signal)` or None; everything it is
+    unsure about is left to the embedding router (see TieredRouter).
+    """
+
+    def __init__(
+            self,
+            routes,
+            threshold: float = 0.9,
+            minCoverage: float = 0.6,
+            ngramRange=(2, 4),
+            buckets: int = 2 ** 20,
+            l2: float = 1e-3,
+            epochs: int = 300,
+            learningRate: float = 2.0,
+        ):
+        self.routes = [route for route in routes if route.samples]
+        if not self.routes:
+            raise ValueError("LexicalRouter needs at least one route with samples")
+        self.routeNames = [route.name for route in self.routes]
+        self.threshold = threshold
+        # Share of a message's words seen in the samples below which the model abstains:
+        # char n-grams of unseen words still overlap the samples, the words do not
+        self.minCoverage = minCoverage
+        self.ngramRange = ngramRange
+        self.buckets = buckets
+
+        self._build_keywords()
+        self._train(l2, epochs, learningRate)
+
+    # === Features ===
+    def _features(self, normalized: str):
+        """Sorted unique hashed feature ids of a normalized query."""
+        words = normalized.split()
+        grams = [f"w:{word}" for word in words]
+        padded = f" {strip_accents(normalized)} "
+        low, high = self.ngramRange
+        for n in range(low, high + 1):
+            grams.extend(padded[i:i + n] for i in range(len(padded) - n + 1))
+        # crc32 rather than hash(): the same ids in every process and run
+        return np.unique(np.fromiter(
+            (zlib.crc32(gram.encode('utf-8')) % self.buckets for gram in grams), dtype=np.int64, count=len(grams)
+        ))
+
+    # === Keywords ===
+    def _build_keywords(self):
+        self._phrases = {}
+        patterns = []
+        for i, route in enumerate(self.routes):
+            for phrase in getattr(route, 'phrases', None) or []:
+                self._phrases[normalize_query(phrase)] = i
+            keywords = sorted({normalize_query(keyword) for keyword in getattr(route, 'keywords', None) or []}, key=len, reverse=True)
+            if keywords:
+                alternation = '|'.join(re.escape(keyword) for keyword in keywords if keyword)
+                patterns.append((i, re.compile(rf"(?<!\w)(?:{alternation})(?!\w)")))
+        self._keywordPatterns = patterns
+
+    def match_keywords(self, normalized: str):
+        """Index of the only route whose keywords or phrases match, else None."""
+        words = normalized.split()
+        while len(words) > 1 and words[-1] in _PARTICLES:
+            words.pop()
+        phrase = self._phrases.get(' '.join(words))
+        matched = {phrase} if phrase is not None else set()
+        for i, pattern in self._keywordPatterns:
+            if pattern.search(normalized):
+                matched.add(i)
+        return matched.pop() if len(matched) == 1 else None
+
+    # === Linear model ===
+    def _train(self, l2, epochs, learningRate):
+        samples = [normalize_query(sample) for route in self.routes for sample in route.samples]
+        labels = np.repeat(np.arange(len(self.routes)), [len(route.samples) for route in self.routes])
+        features = [self._features(sample) for sample in samples]
+        self._words = {word for sample in samples for word in sample.split()}
+
+        # Only buckets seen in training get a weight: a dense (samples, vocabulary) problem
+        vocabulary = np.unique(np.concatenate(features))
+        self._columns = {int(bucket): column for column, bucket in enumerate(vocabulary)}
+        X = np.zeros((len(samples), len(vocabulary)), dtype=np.float32)
+        for row, ids in enumerate(features):
+            X[row, np.searchsorted(vocabulary, ids)] = 1.0 / np.sqrt(len(ids))
+        Y = np.eye(len(self.routes), dtype=np.float32)[labels]
+
+        # Balanced classes: the routes have very different sample counts
+        weights = (len(labels) / (len(self.routes) * np.bincount(labels, minlength=len(self.routes))))[labels]
+        weights = (weights / weights.sum()).astype(np.float32)[:, None]
+
+        W = np.zeros((len(vocabulary), len(self.routes)), dtype=np.float32)
+        b = np.zeros(len(self.routes), dtype=np.float32)
+        for _ in range(epochs):
+            probabilities = self._softmax(X @ W + b)
+            error = (probabilities - Y) * weights
+            W -= learningRate * (X.T @ error + l2 * W)
+            b -= learningRate * error.sum(axis=0)
+        self._weights, self._bias = W, b
+
+    @staticmethod
+    def _softmax(logits):
+        logits = logits - logits.max(axis=-1, keepdims=True)
+        exp = np.exp(logits)
+        return exp / exp.sum(axis=-1, keepdims=True)
+
+    def _predict(self, normalized: str):
+        """Route probabilities, or None when no feature of the query was seen in training."""
+        ids = self._features(normalized)
+        columns = [column for column in map(self._columns.get, ids.tolist()) if column is not None]
+        if not columns:
+            return None
+        logits = self._bias + self._weights[columns].sum(axis=0) / np.sqrt(len(ids))
+        return self._softmax(logits)
+
+    def coverage(self, normalized: str) -> float:
+        words = normalized.split()
+        return sum(word in self._words for word in words) / len(words) if words else 0.0
+
+    def route_scores(self, query):
+        """Model probabilities for a query, best first: [(probability, routeName), ...]"""
+        probabilities = self._predict(normalize_query(query))
+        if probabilities is None:
+            return []
+        order = np.argsort(-probabilities)
+        return [(float(probabilities[i]), self.routeNames[i]) for i in order]
+
+    def classify(self, query):
+        """`(score, routeName, signal)` when confident (signal 'keyword' or 'model'), else None."""
+        normalized = normalize_query(query)
+        if not normalized:
+            return None
+        route = self.match_keywords(normalized)
+        if route is not None:
+            return 1.0, self.routeNames[route], 'keyword'
+
+        if self.coverage(normalized) < self.minCoverage:
+            return None
+        probabilities = self._predict(normalized)
+        if probabilities is None:
+            return None
+        best = int(probabilities.argmax())
+        if probabilities[best] < self.threshold:
+            return None
+        return float(probabilities[best]), self.routeNames[best], 'model'
+
+
+class TieredRouter():
+    """
+    LexicalRouter first, SemanticRouter for whatever it is unsure about.
+
+    Same `guide` / `guide_batch` interface as SemanticRouter (other attributes
+    are delegated to it). Scores of lexically resolved queries are the lexical
+    confidence (1.0 for keywords), not a cosine similarity. `stats()` reports
+    how many queries each tier resolved.
+    """
+
+    def __init__(self, semantic, lexical=None):
+        self.semantic = semantic
+        self.lexical = lexical
+        self.resolved = {"keyword": 0, "model": 0, "semantic": 0}
+        self._lock = threading.Lock()
+
+    def __getattr__(self, attr):
+        # routes, aggregation, cacheDir, route_scores, ... of the embedding router
+        if attr == 'semantic':
+            raise AttributeError(attr)
+        return getattr(self.semantic, attr)
+
+    def _count(self, signal, n=1):
+        with self._lock:
+            self.resolved[signal] += n
+
+    def guide_lexical(self, query):
+        """(score, routeName, 'lexical') when the lexical tier is confident, else None. No encode."""
+        decision = self.lexical.classify(query) if self.lexical is not None else None
+        if decision is None:
+            return None
+        score, name, signal = decision
+        self._count(signal)
+        return score, name, 'lexical'
+
+    def guide_semantic(self, query):
+        """(score, routeName, 'semantic') from the embedding router."""
+        score, name = self.semantic.guide(query)
+        self._count('semantic')
+        return score, name, 'semantic'
+
+    def guide_with_tier(self, query):
+        """(score, routeName, tier), tier being 'lexical' or 'semantic'."""
+        return self.guide_lexical(query) or self.guide_semantic(query)
+
+    def guide(self, query):
+        return self.guide_with_tier(query)[:2]
+
+    def guide_batch(self, queries):
+        """Lexical decisions where confident; one encode call for the rest."""
+        queries = list(queries)
+        decisions = [self.lexical.classify(query) if self.lexical is not None else None for query in queries]
+        pending = [i for i, decision in enumerate(decisions) if decision is None]
+        results = [decision[:2] if decision is not None else None for decision in decisions]
+        for i, result in zip(pending, self.semantic.guide_batch([queries[i] for i in pending])):
+            results[i] = result
+        with self._lock:
+            for decision in decisions:
+                self.resolved[decision[2] if decision is not None else 'semantic'] += 1
+        return results
+
+    def stats(self):
+        with self._lock:
+            resolved = dict(self.resolved)
+        lexical = resolved["keyword"] + resolved["model"]
+        total = lexical + resolved["semantic"]
+        return {
+            "queries": total,
+            "lexical": lexical,
+            "semantic": resolved["semantic"],
+            "lexical_by": {"keyword": resolved["keyword"], "model": resolved["model"]},
+            "lexical_rate": lexical / total if total else 0.0,
+            "semantic_rate": resolved["semantic"] / total if total else 0.0,
+        }
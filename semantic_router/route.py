@@ -3,8 +3,13 @@ class Route():
     def __init__(
         self,
         name: str = None,
-        samples:List = []
+        samples:List = [],
+        keywords:List = [],
+        phrases:List = [],
     ):
 
         self.name = name
         self.samples = samples
+        # Lexical hints for LexicalRouter: whole words anywhere / the whole message
+        self.keywords = keywords
+        self.phrases = phrases
@@ -1,30 +1,152 @@
+import hashlib
+import json
+import os
+
 import numpy as np
 
+# Bump when the on-disk route index layout or its normalization changes.
+ROUTE_INDEX_VERSION = 1
+
 class SemanticRouter():
-    def __init__(self, embedding, routes):
-        self.routes = routes
+    def __init__(self, embedding, routes, aggregation='mean', topK=5, cacheDir=None):
+        if aggregation not in ('mean', 'max', 'topk'):
+            raise ValueError(f"Unknown aggregation '{aggregation}', expected 'mean', 'max' or 'topk'")
+
+        self.routes = [route for route in routes if route.samples]
+        if not self.routes:
+            raise ValueError("SemanticRouter needs at least one route with samples")
         self.embedding = embedding
-        self.routesEmbedding = {}
+        self.aggregation = aggregation
+        self.topK = topK
+        self.routeNames = [route.name for route in self.routes]
+        # Directory for the precomputed route index (.npy + .json), or None to always encode
+        self.cacheDir = cacheDir
+
+        self._build_index()
+
+    def _build_index(self):
+        # One contiguous, row-normalized matrix for all samples of all routes.
+        # Samples of a route are stored next to each other, so per-route scores
+        # are segment reductions over [routeOffsets[i], routeOffsets[i + 1]).
+        samples = [sample for route in self.routes for sample in route.samples]
+        counts = np.array([len(route.samples) for route in self.routes], dtype=np.int64)
+
+        self.routeIndex = self._load_or_encode(samples)
+        self.routeIds = np.repeat(np.arange(len(self.routes)), counts)
+        self.routeCounts = counts
+        self.routeOffsets = np.concatenate(([0], np.cumsum(counts)))
+
+        # Padded gather indices for top-k: (routes, max samples), -1 where a route is shorter.
+        maxCount = int(counts.max())
+        positions = np.arange(maxCount)
+        self._paddedIndex = np.where(
+            positions[None, :] < counts[:, None],
+            self.routeOffsets[:-1, None] + positions[None, :],
+            -1,
+        )
+
+    def _fingerprint(self):
+        """Hash of everything the route index depends on, or None if the model is unknown."""
+        modelName = getattr(self.embedding, 'name', None)
+        if not modelName:
+            return None
+        payload = {
+            "version": ROUTE_INDEX_VERSION,
+            "model": modelName,
+            "backend": getattr(self.embedding, 'backend', None),
+            "routes": [[route.name, list(route.samples)] for route in self.routes],
+        }
+        return hashlib.sha256(json.dumps(payload, ensure_ascii=False, sort_keys=True).encode('utf-8')).hexdigest()
 
-        for route in self.routes:
-            self.routesEmbedding[
-                route.name
-            ] = self.embedding.encode(route.samples)
+    def _load_or_encode(self, samples):
+        fingerprint = self._fingerprint() if self.cacheDir else None
+        if fingerprint is None:
+            return self._normalize(self.embedding.encode(samples))
+
+        path = os.path.join(self.cacheDir, f"routes-{fingerprint[:16]}")
+        try:
+            with open(f"{path}.json", encoding='utf-8') as f:
+                meta = json.load(f)
+            if meta.get("fingerprint") == fingerprint:
+                # Memory-mapped: every server process maps the same page-cache copy
+                index = np.load(f"{path}.npy", mmap_mode='r')
+                if index.shape[0] == len(samples):
+                    return np.ascontiguousarray(index, dtype=np.float32)
+        except (OSError, ValueError):
+            pass
+
+        index = self._normalize(self.embedding.encode(samples))
+        try:
+            os.makedirs(self.cacheDir, exist_ok=True)
+            # Write to temporary files first so a concurrent worker never reads half an artifact
+            with open(f"{path}.npy.tmp", 'wb') as f:
+                np.save(f, index)
+            os.replace(f"{path}.npy.tmp", f"{path}.npy")
+            with open(f"{path}.json.tmp", 'w', encoding='utf-8') as f:
+                json.dump({
+                    "fingerprint": fingerprint,
+                    "version": ROUTE_INDEX_VERSION,
+                    "model": getattr(self.embedding, 'name', None),
+                    "routes": self.routeNames,
+                    "counts": [len(route.samples) for route in self.routes],
+                }, f, ensure_ascii=False)
+            os.replace(f"{path}.json.tmp", f"{path}.json")
+        except OSError as e:
+            print(f"⚠️ Could not save route index to {self.cacheDir}: {e}")
+        return index
+
+    @staticmethod
+    def _normalize(vectors):
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        if vectors.ndim == 1:
+            vectors = vectors[None, :]
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
 
     def get_routes(self):
         return self.routes
 
-    def guide(self, query):
-        queryEmbedding = self.embedding.encode([query]) 
-        queryEmbedding = queryEmbedding / np.linalg.norm(queryEmbedding)
-        scores = []
+    def _aggregate(self, sampleScores):
+        # sampleScores: (queries, samples) -> (queries, routes)
+        starts = self.routeOffsets[:-1]
+        if self.aggregation == 'mean':
+            return np.add.reduceat(sampleScores, starts, axis=1) / self.routeCounts
+        if self.aggregation == 'max':
+            return np.maximum.reduceat(sampleScores, starts, axis=1)
 
-        # Calculate the cosine similarity of the query embedding with the sample embeddings of the router.
+        k = np.minimum(self.topK, self.routeCounts)
+        padded = np.where(self._paddedIndex >= 0, sampleScores[:, self._paddedIndex], -np.inf)
+        # Descending sort along samples, then average the first k of each route.
+        padded = -np.sort(-padded, axis=2)
+        keep = np.arange(padded.shape[2])[None, :] < k[:, None]
+        return np.where(keep, padded, 0.0).sum(axis=2) / k
 
-        for route in self.routes:
-            routesEmbedding = self.routesEmbedding[route.name] / np.linalg.norm(self.routesEmbedding[route.name])
-            score = np.mean(np.dot(routesEmbedding, queryEmbedding.T).flatten())
-            scores.append((score, route.name))
+    def score(self, queryEmbeddings):
+        """Score already-encoded queries against every route, shape (queries, routes)."""
+        queries = self._normalize(queryEmbeddings)
+        return self._aggregate(queries @ self.routeIndex.T)
+
+    def route_scores(self, query):
+        """All route scores for a query, best first: [(score, routeName), ...]"""
+        scores = self.score(self.embedding.encode([query]))[0]
+        order = np.argsort(-scores)
+        return [(float(scores[i]), self.routeNames[i]) for i in order]
+
+    def guide_with_margin(self, query):
+        """Best route plus its confidence margin over the runner-up."""
+        ranked = self.route_scores(query)
+        score, name = ranked[0]
+        margin = score - ranked[1][0] if len(ranked) > 1 else score
+        return {"route": name, "score": score, "margin": margin, "scores": ranked}
+
+    def guide(self, query):
+        return self.route_scores(query)[0]
 
-        scores.sort(reverse=True)
-        return scores[0]
\ No newline at end of file
+    def guide_batch(self, queries):
+        """Route several queries with a single encode call: [(score, routeName), ...]"""
+        if not queries:
+            return []
+        scores = self.score(self.embedding.encode(list(queries)))
+        best = scores.argmax(axis=1)
+        return [(float(scores[i, j]), self.routeNames[j]) for i, j in enumerate(best)]
@@ -84,4 +84,18 @@ chitchatSample = [
     "Có bao nhiêu châu lục?",
     "Ai đã viết 'Giết con chim nhại'?",
     "Bạn có thể cho tôi một câu nói của Albert Einstein không?"
-]
\ No newline at end of file
+]
+
+# Phone brands and lines: a message naming one is a product question
+productsKeywords = [
+    "iphone", "ipad", "samsung", "galaxy", "xiaomi", "redmi", "poco", "oppo", "vivo", "realme",
+    "oneplus", "huawei", "pixel", "xperia", "nokia", "motorola", "zenfone", "blackberry",
+    "tecno", "infinix",
+]
+
+# Whole messages that are small talk
+chitchatPhrases = [
+    "xin chào", "chào", "chào bạn", "hello", "hi", "alo", "hey",
+    "cảm ơn", "cám ơn", "cảm ơn nhiều", "thank you", "thanks", "ok", "oke", "vâng", "dạ",
+    "tạm biệt", "bye", "bạn là ai", "bạn khỏe không",
+]
@@ -1,54 +1,35 @@
-
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_cors import CORS
-from dotenv import load_dotenv
+import json
 import os
 import traceback
 
-# === Google & OpenAI SDK ===
-import google.generativeai as genai
+# === OpenAI SDK ===
 import openai
 from openai import OpenAI
 
 # === RAG system ===
-from rag.core import RAG
-from embeddings import OpenAIEmbedding
-from embeddings.sbert import SBERTEmbedding
-from semantic_router import SemanticRouter, Route
-from semantic_router.samples import productsSample, chitchatSample
+from rag.core import RAG, stream_text, to_gpt_messages
+from rag.snippets import SEARCH_PROMPT
+from embeddings.cache import normalize_text
 from reflection import Reflection
+from metrics import RequestTrace, metrics
 
-# === MongoDB & SBERT for vector search ===
-from sentence_transformers import SentenceTransformer
-import pymongo
-
-# === Load .env ===
-load_dotenv()
-print("✅ OPEN_AI_KEY:", os.getenv('OPEN_AI_KEY'))
-
-# === ENV CONFIG ===
-MONGODB_URI = os.getenv('MONGODB_URI')
-DB_NAME = os.getenv('DB_NAME')
-DB_COLLECTION = os.getenv('DB_COLLECTION')
-LLM_KEY = os.getenv('GEMINI_KEY')
-OPEN_AI_KEY = os.getenv('OPEN_AI_KEY')
-EMBEDDING_MODEL = os.getenv('EMBEDDING_MODEL') or 'keepitreal/vietnamese-sbert'
-
-# === Embeddings & Routing ===
-sbertEmbedding = SBERTEmbedding(EMBEDDING_MODEL)
-semanticRouter = SemanticRouter(
-    sbertEmbedding,
-    routes=[
-        Route(name='products', samples=productsSample),
-        Route(name='chitchat', samples=chitchatSample)
-    ]
-)
+# === Shared components (configuration, encoder, router, retrievers, caches, watchers) ===
+from components import *
 
 # === LLMs ===
-genai.configure(api_key=LLM_KEY)
+if LLM_KEY:
+    # Only pay for the Gemini SDK import when it is configured
+    import google.generativeai as genai
+    genai.configure(api_key=LLM_KEY)
 llm = OpenAI(api_key=OPEN_AI_KEY)
 gpt = openai.OpenAI(api_key=OPEN_AI_KEY)
-reflection = Reflection(llm=gpt)
+reflection = Reflection(
+    llm=gpt,
+    embedding=queryEmbedding,
+    maxHistoryTokens=int(os.getenv('REFLECTION_MAX_TOKENS') or 1000),
+)
 
 # === RAG ===
 rag = RAG(
@@ -56,13 +37,22 @@ rag = RAG(
     dbName=DB_NAME,
     dbCollection=DB_COLLECTION,
     embeddingName=EMBEDDING_MODEL,
+    embeddingDevice=EMBEDDING_DEVICE,
+    embedding=queryEmbedding,
+    retriever=searchRetriever,
+    searchLimit=SEARCH_LIMIT,
     llm=llm,
 )
 
-# === Mongo Vector Search for /ask ===
-client = pymongo.MongoClient(os.getenv("MONGODB_URI"))
-mongo_collection = client["hoanghamobilenew"]["embedding_for_vector_search"]
-embedding_model = SentenceTransformer(EMBEDDING_MODEL)
+# === Metrics (/metrics) ===
+# The shared components are registered by components.py
+metrics.register_stats('reflection', reflection.stats)
+
+if not SERVE_PRELOAD:
+    start_background()
+
+# === Vector Search for /ask ===
+embedding_model = queryEmbedding  # same shared model and cache as the router
 openai_client = OpenAI(api_key=OPEN_AI_KEY)
 
 # === App setup ===
@@ -71,134 +61,211 @@ CORS(app)
 
 # === Helper for /ask ===
 def get_embedding(text):
-    return embedding_model.encode(text).tolist() if text.strip() else []
+    return embedding_model.encode(text) if text.strip() else None
 
 def vector_search(query, limit=5):
-    embedding = get_embedding(query)
-    pipeline = [
-        {"$vectorSearch": {
-            "index": "vector_index",
-            "queryVector": embedding,
-            "path": "embedding",
-            "numCandidates": 300,
-            "limit": limit,
-        }},
-        {"$unset": "embedding"},
-        {"$project": {
-            "_id": 0,
-            "title": 1,
-            "current_price": 1,
-            "product_promotion": 1,
-            "url": 1,
-            "product_specs": 1,
-            "color_options": 1,
-            "score": {"$meta": "vectorSearchScore"},
-        }}
-    ]
-    return list(mongo_collection.aggregate(pipeline))
-
-def build_prompt(user_query, search_results):
-    context = ""
-    for i, item in enumerate(search_results, 1):
-        title = item.get('title', 'N/A')
-        price = item.get('current_price', 'Liên hệ')
-        promotions = str(item.get('product_promotion', '')).strip() or 'Không có'
-        colors = ', '.join(item.get('color_options', [])) if isinstance(item.get('color_options'), list) else 'Không có'
-        specs = item.get('product_specs', '').replace("<br>", "; ") if isinstance(item.get('product_specs'), str) else 'Không có'
-        url = item.get('url', '')
-
-        context += f"### {i}. **{title}**\n"
-        context += f"- **Giá**: {price}\n"
-        context += f"- **Ưu đãi**: {promotions}\n"
-        context += f"- **Màu sắc**: {colors}\n"
-        context += f"- **Thông số**: {specs}\n"
-        if url:
-            context += f"- **[Xem chi tiết sản phẩm]({url})**\n"
-        context += "\n"
-
-    return f"""Bạn là một chuyên gia tư vấn bán điện thoại tại cửa hàng **DBIZ**.
-
-**Câu hỏi của khách hàng:** _{user_query}_
-
-Dưới đây là các sản phẩm liên quan:
-
-{context}
-Vui lòng trả lời khách một cách thân thiện, dễ hiểu và rõ ràng!  
-Nếu khách hàng muốn biết thêm, hãy mời họ bấm vào link để xem chi tiết sản phẩm.
-"""
+    return askRetriever.vector_search(query, limit)
+
+# === Streaming (Server-Sent Events) ===
+def wants_stream():
+    # POST /api/search?stream=true or /ask?stream=true
+    return request.args.get('stream', '').lower() in ('1', 'true', 'yes')
+
+def sse_response(chunks, onComplete=None):
+    """
+    Send text pieces as `data: {"text": ...}` events, then `event: done`.
+    Wrap `chunks` with RequestTrace.stream to time the generation.
+    """
+    def events():
+        parts = []
+        try:
+            for text in chunks:
+                parts.append(text)
+                yield f"data: {json.dumps({'text': text}, ensure_ascii=False)}\n\n"
+        except Exception as e:
+            traceback.print_exc()
+            yield f"event: error\ndata: {json.dumps({'error': str(e)}, ensure_ascii=False)}\n\n"
+            return
+        if onComplete:
+            onComplete(''.join(parts))
+        yield "event: done\ndata: {}\n\n"
+
+    return Response(
+        stream_with_context(events()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
+
+# === Endpoint: /metrics (Prometheus) ===
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
 
 # === Endpoint: /api/search (semantic + RAG + chitchat) ===
 @app.route('/api/search', methods=['POST'])
 def handle_query():
+    trace = RequestTrace('search', log=REQUEST_LOG)
     try:
         data = list(request.get_json())
         query = data[-1]["parts"][0]["text"].lower()
+        stream = wants_stream()
+        trace.set(stream=stream, turns=len(data))
 
         if not query:
+            trace.finish('bad_request')
             return jsonify({'error': 'No query provided'}), 400
 
-        guidedRoute = semanticRouter.guide(query)[1]
-        if guidedRoute == 'products':
-            reflected_query = reflection(data)
-            query = reflected_query
-            source_information = rag.enhance_prompt(query).replace('<br>', '\n')
-            combined_information = (
-                f"Hãy trở thành chuyên gia tư vấn bán hàng cho một cửa hàng điện thoại. "
-                f"Câu hỏi của khách hàng: {query}\n"
-                f"Trả lời dựa vào các thông tin dưới đây: {source_information}."
-            )
-            data.append({
-                "role": "user",
-                "parts": [{"text": combined_information}]
-            })
-
-            response = rag.generate_content(data)
-            return jsonify({'parts': [{'text': response.text}], 'role': 'model'})
+        with trace.stage('route'):
+            _, guidedRoute, routeTier = semanticRouter.guide_with_tier(query)
+        trace.set(route=guidedRoute, route_tier=routeTier)
+
+        # Only first-turn questions are cached: later turns depend on the history
+        cacheable = len(data) == 1
+        # Decided on the client's history: the built one may be trimmed to a single turn
+        firstTurn = reflection.first_turn(data)
+        with trace.stage('memory'):
+            data = conversationMemory.build(data, request.headers.get('X-Conversation-Id'))
+        if cacheable:
+            with trace.stage('cache_lookup'):
+                # The embedding router has already encoded the query; a lexical decision has not
+                queryVector = queryEmbedding.cached(query) if routeTier == 'lexical' else queryEmbedding.encode(query)
+                cached = answerCache.lookup(queryVector, namespace=f"search:{guidedRoute}")
+            trace.cache(cached is not None)
+            if cached is not None:
+                trace.finish()
+                if stream:
+                    return sse_response([cached])
+                return jsonify({'parts': [{'text': cached}], 'role': 'model'})
+
+        def remember(text):
+            if cacheable:
+                # Encoded only now, after the answer, when the lookup had no vector
+                vector = queryVector if queryVector is not None else queryEmbedding.encode(query)
+                answerCache.store(vector, text, namespace=f"search:{guidedRoute}")
+
+        def answer():
+            # Runs up to the LLM call eagerly; returns the answer's text pieces
+            if guidedRoute == 'products':
+                with trace.stage('reflection'):
+                    reflected_query = reflection(data, firstTurn=firstTurn)
+                with trace.stage('retrieve'):
+                    knowledge = rag.vector_search(reflected_query, rag.searchLimit)
+                with trace.stage('prompt'):
+                    combined_information = SEARCH_PROMPT.format(
+                        query=reflected_query, knowledge=rag.format_knowledge(knowledge)
+                    )
+                data.append({
+                    "role": "user",
+                    "parts": [{"text": combined_information}]
+                })
+                trace.tokens('prompt', ' '.join(m["parts"][0]["text"] for m in data))
+
+                with trace.stage('llm'):
+                    response = rag.generate_content(data, stream=stream)
+                return response if stream else [response.text]
+
+            # Client turns are "model", the memory summary's "assistant": OpenAI wants "assistant"
+            openai_messages = to_gpt_messages(data)
+            trace.tokens('prompt', ' '.join(m["content"] for m in openai_messages))
+            with trace.stage('llm'):
+                response = llm.chat.completions.create(
+                    model="gpt-4o-mini",
+                    messages=openai_messages,
+                    stream=stream,
+                )
+            return stream_text(response) if stream else [response.choices[0].message.content]
+
+        # Identical first-turn questions in flight together share one answer
+        flightKey = f"search:{guidedRoute}:{normalize_text(query)}" if cacheable and singleFlight else None
+        chunks, leader = singleFlight.run(flightKey, answer) if flightKey else (answer(), True)
+        trace.set(coalesced=not leader)
+        if stream:
+            return sse_response(trace.stream(chunks), onComplete=remember if leader else None)
+
+        if leader:
+            text = ''.join(chunks)
         else:
-            openai_messages = [
-                {"role": m["role"], "content": m["parts"][0]["text"]}
-                for m in data
-            ]
-            response = llm.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=openai_messages
-            )
-            return jsonify({
-                'parts': [{'text': response.choices[0].message.content}],
-                'role': 'model'
-            })
+            with trace.stage('coalesced_wait'):
+                text = ''.join(chunks)
+        trace.tokens('completion', text)
+        if leader:
+            remember(text)
+        trace.finish()
+        return jsonify({'parts': [{'text': text}], 'role': 'model'})
 
     except Exception as e:
         traceback.print_exc()
+        trace.finish('error')
         return jsonify({'error': str(e)}), 500
 
 # === Endpoint: /ask (Mongo vector search) ===
 @app.route("/ask", methods=["POST"])
 def ask():
+    trace = RequestTrace('ask', log=REQUEST_LOG)
     try:
         messages = request.get_json()
         user_message = next((m for m in reversed(messages) if m.get("role") == "user"), None)
         query = user_message["parts"][0]["text"] if user_message else ""
+        stream = wants_stream()
+        trace.set(stream=stream, turns=len(messages))
         if not query.strip():
+            trace.finish('bad_request')
             return jsonify({"error": "Empty query"}), 400
 
-        search_results = vector_search(query, limit=5)
-        prompt = build_prompt(query, search_results)
-        response = openai_client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": "Bạn là một trợ lý AI thông minh."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.7
-        )
+        # The /ask answer only depends on the last user question, so it is always cacheable
+        with trace.stage('cache_lookup'):
+            queryVector = embedding_model.encode(query)
+            cached = answerCache.lookup(queryVector, namespace="ask")
+        trace.cache(cached is not None)
+        if cached is not None:
+            trace.finish()
+            if stream:
+                return sse_response([cached])
+            return jsonify({"role": "model", "parts": [{"text": cached}]})
+
+        def remember(text):
+            answerCache.store(queryVector, text, namespace="ask")
+
+        def answer():
+            with trace.stage('retrieve'):
+                search_results = vector_search(query, limit=5)
+            with trace.stage('prompt'):
+                prompt = build_prompt(query, search_results)
+            trace.tokens('prompt', prompt)
+            with trace.stage('llm'):
+                response = openai_client.chat.completions.create(
+                    model="gpt-4o-mini",
+                    messages=[
+                        {"role": "system", "content": "Bạn là một trợ lý AI thông minh."},
+                        {"role": "user", "content": prompt}
+                    ],
+                    temperature=0.7,
+                    stream=stream,
+                )
+            return stream_text(response) if stream else [response.choices[0].message.content]
 
+        flightKey = f"ask:{normalize_text(query)}" if singleFlight else None
+        chunks, leader = singleFlight.run(flightKey, answer) if flightKey else (answer(), True)
+        trace.set(coalesced=not leader)
+        if stream:
+            return sse_response(trace.stream(chunks), onComplete=remember if leader else None)
+
+        if leader:
+            text = ''.join(chunks)
+        else:
+            with trace.stage('coalesced_wait'):
+                text = ''.join(chunks)
+        trace.tokens('completion', text)
+        if leader:
+            remember(text)
+        trace.finish()
         return jsonify({
             "role": "model",
-            "parts": [{"text": response.choices[0].message.content}]
+            "parts": [{"text": text}]
         })
     except Exception as e:
         traceback.print_exc()
+        trace.finish('error')
         return jsonify({"error": f"Processing error: {str(e)}"}), 500
 
 # === Run server ===
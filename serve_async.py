@@ -0,0 +1,358 @@
+# ASGI entry point: `hypercorn serve_async:app` (or `python serve_async.py`).
+# Models, router, caches and watchers come from components.py (shared with serve.py);
+# only the I/O clients are async.
+
+import asyncio
+import json
+import os
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+from quart import Quart, Response, request, jsonify
+from quart_cors import cors
+from openai import AsyncOpenAI
+
+from rag.core import RAG, astream_text, to_gpt_messages
+from rag.retriever import AtlasRetriever
+from rag.hybrid import HybridRetriever
+from rag.rerank import RerankingRetriever
+from rag.mongo import SEARCH_FIELDS, ASK_FIELDS, get_async_client
+from rag.snippets import SEARCH_PROMPT
+from embeddings.cache import normalize_text
+from reflection import Reflection
+from metrics import RequestTrace, metrics
+from components import (
+    MONGODB_URI, DB_NAME, DB_COLLECTION, OPEN_AI_KEY, EMBEDDING_MODEL,
+    RETRIEVER_BACKEND, ASK_DB_NAME, ASK_DB_COLLECTION, HYBRID_SEARCH, SEARCH_LIMIT, REQUEST_LOG,
+    searchLexicalIndex, askLexicalIndex, reranker,
+    semanticRouter, queryEmbedding, answerCache, searchRetriever, askRetriever, conversationMemory, singleFlight,
+    build_prompt, start_background,
+)
+
+# 'true' starts reflection while the embedding router is still deciding a follow-up turn,
+# overlapping it with the router and a speculative retrieval on the raw query (costs a
+# reflection call when the turn is chitchat). First turns check the answer cache instead,
+# and turns the lexical router decides know their route before anything starts.
+SPECULATIVE_REFLECTION = (os.getenv('SPECULATIVE_REFLECTION') or 'true').lower() == 'true'
+ENCODE_THREADS = int(os.getenv('ENCODE_THREADS') or 4)
+# conversationMemory.build blocks on the summary LLM call: its own pool, so it never
+# holds the encode threads that routing and the cache lookups wait on
+MEMORY_THREADS = int(os.getenv('MEMORY_THREADS') or 8)
+
+# === Async clients ===
+async_llm = AsyncOpenAI(api_key=OPEN_AI_KEY)
+async_reflection = Reflection(
+    llm=async_llm,
+    embedding=queryEmbedding,
+    maxHistoryTokens=int(os.getenv('REFLECTION_MAX_TOKENS') or 1000),
+)
+# components.py registered the shared components; only the async reflection is new here
+metrics.register_stats('async_reflection', async_reflection.stats)
+
+if RETRIEVER_BACKEND == 'atlas':
+    mongo_client = get_async_client(MONGODB_URI)
+    async_search_retriever = AtlasRetriever(
+        None, queryEmbedding, fields=SEARCH_FIELDS, name="search",
+        asyncCollection=mongo_client[DB_NAME][DB_COLLECTION],
+    )
+    async_ask_retriever = AtlasRetriever(
+        None, queryEmbedding, fields=ASK_FIELDS, numCandidates=300, name="ask",
+        asyncCollection=mongo_client[ASK_DB_NAME][ASK_DB_COLLECTION],
+    )
+    if HYBRID_SEARCH:
+        async_search_retriever = HybridRetriever(async_search_retriever, searchLexicalIndex)
+        async_ask_retriever = HybridRetriever(async_ask_retriever, askLexicalIndex)
+    if reranker is not None:
+        async_search_retriever = RerankingRetriever(
+            async_search_retriever, reranker, candidates=searchRetriever.candidates
+        )
+        async_ask_retriever = RerankingRetriever(
+            async_ask_retriever, reranker, candidates=askRetriever.candidates
+        )
+else:
+    # Local index: already in-process, avector_search runs it on the thread pool
+    async_search_retriever = searchRetriever
+    async_ask_retriever = askRetriever
+
+async_rag = RAG(
+    mongodbUri=MONGODB_URI,
+    dbName=DB_NAME,
+    dbCollection=DB_COLLECTION,
+    embeddingName=EMBEDDING_MODEL,
+    embedding=queryEmbedding,
+    retriever=async_search_retriever,
+    searchLimit=SEARCH_LIMIT,
+    llm=async_llm,
+)
+
+app = cors(Quart(__name__))
+memoryExecutor = ThreadPoolExecutor(max_workers=MEMORY_THREADS, thread_name_prefix="memory")
+
+
+@app.before_serving
+async def setup_executor():
+    # asyncio.to_thread (encoding, routing, local search, cache lookups) runs on this pool
+    asyncio.get_running_loop().set_default_executor(
+        ThreadPoolExecutor(max_workers=ENCODE_THREADS, thread_name_prefix="encode")
+    )
+    start_background()
+
+
+def cache_lookup(encode, query, namespace):
+    """
+    (query vector, cached answer) for `query`. Runs on a worker thread: the
+    lookup may poll the collection fingerprints with blocking pymongo calls.
+    """
+    queryVector = encode(query)
+    return queryVector, answerCache.lookup(queryVector, namespace=namespace)
+
+
+def wants_stream():
+    return request.args.get('stream', '').lower() in ('1', 'true', 'yes')
+
+
+def sse_response(chunks, onComplete=None):
+    """Async twin of serve.sse_response: `chunks` is an async iterable of text pieces."""
+    async def events():
+        parts = []
+        try:
+            async for text in chunks:
+                parts.append(text)
+                yield f"data: {json.dumps({'text': text}, ensure_ascii=False)}\n\n"
+        except Exception as e:
+            traceback.print_exc()
+            yield f"event: error\ndata: {json.dumps({'error': str(e)}, ensure_ascii=False)}\n\n"
+            return
+        if onComplete:
+            onComplete(''.join(parts))
+        yield "event: done\ndata: {}\n\n"
+
+    return Response(
+        events(),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
+
+
+async def _single(text):
+    yield text
+
+
+async def _cancel(*tasks):
+    for task in tasks:
+        if task is not None and not task.done():
+            task.cancel()
+
+
+# === Endpoint: /metrics (Prometheus) ===
+@app.route('/metrics', methods=['GET'])
+async def prometheus_metrics():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+
+# === Endpoint: /api/search (semantic + RAG + chitchat) ===
+@app.route('/api/search', methods=['POST'])
+async def handle_query():
+    reflectionTask = speculativeTask = None
+    trace = RequestTrace('search', log=REQUEST_LOG)
+    try:
+        data = list(await request.get_json())
+        query = data[-1]["parts"][0]["text"].lower()
+        stream = wants_stream()
+        trace.set(stream=stream, turns=len(data))
+
+        if not query:
+            trace.finish('bad_request')
+            return jsonify({'error': 'No query provided'}), 400
+
+        cacheable = len(data) == 1
+        # Decided on the client's history: the built one may be trimmed to a single turn
+        firstTurn = async_reflection.first_turn(data)
+        with trace.stage('memory'):
+            data = await asyncio.get_running_loop().run_in_executor(
+                memoryExecutor, conversationMemory.build, data, request.headers.get('X-Conversation-Id')
+            )
+
+        # Stages that overlap record how long the handler waited on them
+        with trace.stage('route'):
+            decision = semanticRouter.guide_lexical(query)
+            if decision is None:
+                # While the embedding router decides, a follow-up turn starts reflection
+                # and a retrieval on the raw query; first turns check the answer cache first
+                routeTask = asyncio.create_task(asyncio.to_thread(semanticRouter.guide_semantic, query))
+                if SPECULATIVE_REFLECTION and not cacheable:
+                    reflectionTask = asyncio.create_task(async_reflection.acall(data, firstTurn=firstTurn))
+                    speculativeTask = asyncio.create_task(async_search_retriever.avector_search(query, SEARCH_LIMIT))
+                decision = await routeTask
+        _, guidedRoute, routeTier = decision
+        trace.set(route=guidedRoute, route_tier=routeTier, speculative=reflectionTask is not None)
+
+        if cacheable:
+            with trace.stage('cache_lookup'):
+                # The embedding router has already encoded the query; a lexical decision has not
+                lookupVector = queryEmbedding.cached if routeTier == 'lexical' else queryEmbedding.encode
+                queryVector, cached = await asyncio.to_thread(
+                    cache_lookup, lookupVector, query, f"search:{guidedRoute}"
+                )
+            trace.cache(cached is not None)
+            if cached is not None:
+                trace.finish()
+                if stream:
+                    return sse_response(_single(cached))
+                return jsonify({'parts': [{'text': cached}], 'role': 'model'})
+
+        def store(text):
+            # Encoded only now, after the answer, when the lookup had no vector
+            vector = queryVector if queryVector is not None else queryEmbedding.encode(query)
+            answerCache.store(vector, text, namespace=f"search:{guidedRoute}")
+
+        def remember(text):
+            if cacheable:
+                # Off the event loop: it may encode
+                asyncio.get_running_loop().run_in_executor(None, store, text)
+
+        async def answer():
+            nonlocal reflectionTask, speculativeTask
+            if guidedRoute == 'products':
+                if reflectionTask is None:
+                    reflectionTask = asyncio.create_task(async_reflection.acall(data, firstTurn=firstTurn))
+                    speculativeTask = asyncio.create_task(async_search_retriever.avector_search(query, SEARCH_LIMIT))
+                with trace.stage('reflection'):
+                    reflected_query = await reflectionTask
+
+                # Reuse the speculative hits when reflection left the question unchanged
+                with trace.stage('retrieve'):
+                    if reflected_query.strip().lower() == query.strip():
+                        knowledge = await speculativeTask
+                        trace.set(speculative_hit=True)
+                    else:
+                        await _cancel(speculativeTask)
+                        knowledge = await async_search_retriever.avector_search(reflected_query, SEARCH_LIMIT)
+                        trace.set(speculative_hit=False)
+
+                with trace.stage('prompt'):
+                    combined_information = SEARCH_PROMPT.format(
+                        query=reflected_query, knowledge=async_rag.format_knowledge(knowledge)
+                    )
+                data.append({
+                    "role": "user",
+                    "parts": [{"text": combined_information}]
+                })
+                trace.tokens('prompt', ' '.join(m["parts"][0]["text"] for m in data))
+
+                with trace.stage('llm'):
+                    response = await async_rag.agenerate_content(data, stream=stream)
+                return response if stream else _single(response.text)
+
+            await _cancel(reflectionTask, speculativeTask)
+            # Client turns are "model", the memory summary's "assistant": OpenAI wants "assistant"
+            openai_messages = to_gpt_messages(data)
+            trace.tokens('prompt', ' '.join(m["content"] for m in openai_messages))
+            with trace.stage('llm'):
+                response = await async_llm.chat.completions.create(
+                    model="gpt-4o-mini",
+                    messages=openai_messages,
+                    stream=stream,
+                )
+            return astream_text(response) if stream else _single(response.choices[0].message.content)
+
+        # Identical first-turn questions in flight together share one answer
+        flightKey = f"search:{guidedRoute}:{normalize_text(query)}" if cacheable and singleFlight else None
+        chunks, leader = await singleFlight.arun(flightKey, answer) if flightKey else (await answer(), True)
+        trace.set(coalesced=not leader)
+        if not leader:
+            # The leader's answer is followed; a fallback starts its own reflection
+            await _cancel(reflectionTask, speculativeTask)
+            reflectionTask = speculativeTask = None
+        if stream:
+            return sse_response(trace.astream(chunks), onComplete=remember if leader else None)
+
+        if leader:
+            text = ''.join([text async for text in chunks])
+        else:
+            with trace.stage('coalesced_wait'):
+                text = ''.join([text async for text in chunks])
+        trace.tokens('completion', text)
+        if leader:
+            remember(text)
+        trace.finish()
+        return jsonify({'parts': [{'text': text}], 'role': 'model'})
+
+    except Exception as e:
+        await _cancel(reflectionTask, speculativeTask)
+        traceback.print_exc()
+        trace.finish('error')
+        return jsonify({'error': str(e)}), 500
+
+# === Endpoint: /ask (Mongo vector search) ===
+@app.route("/ask", methods=["POST"])
+async def ask():
+    trace = RequestTrace('ask', log=REQUEST_LOG)
+    try:
+        messages = await request.get_json()
+        user_message = next((m for m in reversed(messages) if m.get("role") == "user"), None)
+        query = user_message["parts"][0]["text"] if user_message else ""
+        stream = wants_stream()
+        trace.set(stream=stream, turns=len(messages))
+        if not query.strip():
+            trace.finish('bad_request')
+            return jsonify({"error": "Empty query"}), 400
+
+        with trace.stage('cache_lookup'):
+            queryVector, cached = await asyncio.to_thread(cache_lookup, queryEmbedding.encode, query, "ask")
+        trace.cache(cached is not None)
+        if cached is not None:
+            trace.finish()
+            if stream:
+                return sse_response(_single(cached))
+            return jsonify({"role": "model", "parts": [{"text": cached}]})
+
+        def remember(text):
+            answerCache.store(queryVector, text, namespace="ask")
+
+        async def answer():
+            with trace.stage('retrieve'):
+                search_results = await async_ask_retriever.avector_search(query, 5)
+            with trace.stage('prompt'):
+                prompt = build_prompt(query, search_results)
+            trace.tokens('prompt', prompt)
+            with trace.stage('llm'):
+                response = await async_llm.chat.completions.create(
+                    model="gpt-4o-mini",
+                    messages=[
+                        {"role": "system", "content": "Bạn là một trợ lý AI thông minh."},
+                        {"role": "user", "content": prompt}
+                    ],
+                    temperature=0.7,
+                    stream=stream,
+                )
+            return astream_text(response) if stream else _single(response.choices[0].message.content)
+
+        flightKey = f"ask:{normalize_text(query)}" if singleFlight else None
+        chunks, leader = await singleFlight.arun(flightKey, answer) if flightKey else (await answer(), True)
+        trace.set(coalesced=not leader)
+        if stream:
+            return sse_response(trace.astream(chunks), onComplete=remember if leader else None)
+
+        if leader:
+            text = ''.join([text async for text in chunks])
+        else:
+            with trace.stage('coalesced_wait'):
+                text = ''.join([text async for text in chunks])
+        trace.tokens('completion', text)
+        if leader:
+            remember(text)
+        trace.finish()
+
+        return jsonify({
+            "role": "model",
+            "parts": [{"text": text}]
+        })
+    except Exception as e:
+        traceback.print_exc()
+        trace.finish('error')
+        return jsonify({"error": f"Processing error: {str(e)}"}), 500
+
+# === Run server ===
+if __name__ == '__main__':
+    app.run(host='0.0.0.0', port=5002, debug=False)
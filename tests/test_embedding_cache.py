@@ -0,0 +1,53 @@
+import sqlite3
+
+import numpy as np
+
+from embeddings.cache import CachedEmbedding, EmbeddingCache
+
+
+class _Encoder():
+    name = "fake"
+
+    def __init__(self):
+        self.texts = []
+
+    def encode(self, texts):
+        self.texts.extend(texts)
+        return np.array([[len(text), 1.0] for text in texts], dtype=np.float32)
+
+
+def _rows(path):
+    with sqlite3.connect(path) as db:
+        return db.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+
+def test_writes_are_batched(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    cache = EmbeddingCache(path=path, flushSize=3, flushInterval=3600)
+    cache.set("a", np.ones(2))
+    cache.set("b", np.ones(2))
+    assert _rows(path) == 0
+    assert cache.stats()["pending_writes"] == 2
+
+    cache.set("c", np.ones(2))
+    assert _rows(path) == 3
+    assert cache.stats()["flushes"] == 1
+
+
+def test_flushed_entries_survive_a_restart(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    cache = EmbeddingCache(path=path, flushInterval=3600)
+    encoder = _Encoder()
+    CachedEmbedding(encoder, cache, namespace="m:torch").encode(["Xin chào"])
+    cache.flush()
+
+    restarted = CachedEmbedding(encoder, EmbeddingCache(path=path), namespace="m:torch")
+    np.testing.assert_array_equal(restarted.encode("xin  CHÀO"), [8.0, 1.0])
+    assert encoder.texts == ["Xin chào"]
+
+
+def test_namespaces_do_not_share_entries():
+    cache = EmbeddingCache()
+    encoder = _Encoder()
+    CachedEmbedding(encoder, cache, namespace="m:torch").encode("giá")
+    assert CachedEmbedding(encoder, cache, namespace="m:onnx").cached("giá") is None
@@ -0,0 +1,53 @@
+import pytest
+
+pytest.importorskip("pymongo")
+
+from rag.hybrid import BM25Index  # noqa: E402
+
+
+def _documents():
+    return [
+        {"_id": 1, "title": "iPhone 15 Pro Max", "product_specs": "pin 4400 mAh", "current_price": "30"},
+        {"_id": 2, "title": "Samsung Galaxy S24", "product_specs": "pin 4000 mAh", "current_price": "20"},
+        {"_id": 3, "title": "Xiaomi Redmi Note 13", "product_specs": "pin 5000 mAh", "current_price": "5"},
+    ]
+
+
+def _ids(index, query):
+    return [document["_id"] for _, _, document in index.search_documents(query, 10)]
+
+
+def _scores(index, query):
+    return sorted((document["_id"], round(score, 5)) for _, score, document in index.search_documents(query, 10))
+
+
+def test_price_edit_keeps_new_fields_without_reindexing():
+    index = BM25Index(_documents(), storedFields=["title", "current_price", "product_promotion"])
+    postings = index._state[3]
+    index.apply_changes([{"_id": 2, "title": "Samsung Galaxy S24", "product_specs": "pin 4000 mAh",
+                          "current_price": "18", "product_promotion": "Giảm 10%"}], [])
+    document = next(document for document in index.documents if document["_id"] == 2)
+    assert document["current_price"] == "18"
+    assert document["product_promotion"] == "Giảm 10%"
+    assert index._state[3] == postings
+
+
+def test_incremental_changes_match_a_fresh_index():
+    index = BM25Index(_documents())
+    index.apply_changes(
+        [
+            {"_id": 1, "title": "iPhone 16 Pro", "product_specs": "pin 4600 mAh"},
+            {"_id": 4, "title": "Oppo Find X7", "product_specs": "pin 5000 mAh"},
+        ],
+        [3],
+    )
+    fresh = BM25Index([
+        {"_id": 1, "title": "iPhone 16 Pro", "product_specs": "pin 4600 mAh"},
+        {"_id": 2, "title": "Samsung Galaxy S24", "product_specs": "pin 4000 mAh", "current_price": "20"},
+        {"_id": 4, "title": "Oppo Find X7", "product_specs": "pin 5000 mAh"},
+    ])
+    assert len(index) == 3
+    assert _ids(index, "redmi") == []
+    assert _ids(index, "iphone 15") == [1]
+    for query in ("iphone 16", "pin 5000", "oppo", "galaxy"):
+        assert _scores(index, query) == _scores(fresh, query)
@@ -0,0 +1,80 @@
+import numpy as np
+
+from rag.local_index import LocalVectorIndex
+
+
+def _unit(vector):
+    vector = np.asarray(vector, dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+def _index(nlist=0, count=40, dim=8, seed=0):
+    rng = np.random.default_rng(seed)
+    vectors = rng.normal(size=(count, dim)).astype(np.float32)
+    documents = [{"_id": str(i), "title": f"product {i}"} for i in range(count)]
+    if nlist:
+        return LocalVectorIndex.build(vectors, documents, nlist=nlist, nprobe=1), vectors
+    return LocalVectorIndex.build(vectors, documents), vectors
+
+
+def _top_id(index, query):
+    row, _ = index.search(query, limit=1)[0]
+    return index.documents[row]["_id"]
+
+
+def test_update_fields_only_keeps_vector():
+    index, vectors = _index()
+    index.apply_changes([{"_id": "3", "title": "renamed", "current_price": "1"}], [])
+    assert index.documents[3]["title"] == "renamed"
+    assert _top_id(index, vectors[3]) == "3"
+
+
+def test_reembedded_row_is_found_by_its_new_vector():
+    index, vectors = _index()
+    target = _unit(np.ones(vectors.shape[1]))
+    index.apply_changes([{"_id": "5", "title": "product 5", "embedding": target.tolist()}], [])
+    assert _top_id(index, target) == "5"
+
+
+def test_update_does_not_write_into_the_matrix_readers_hold():
+    index, vectors = _index()
+    before = index.vectors
+    snapshot = np.array(before)
+    index.apply_changes([{"_id": "0", "embedding": np.ones(vectors.shape[1]).tolist()}], [])
+    assert index.vectors is not before
+    np.testing.assert_array_equal(before, snapshot)
+
+
+def test_insert_and_delete():
+    index, vectors = _index()
+    new = _unit(-np.ones(vectors.shape[1]))
+    index.apply_changes([{"_id": "new", "title": "new", "embedding": new.tolist()}], ["7"])
+    assert len(index) == len(vectors)
+    assert _top_id(index, new) == "new"
+    assert all(index.documents[row]["_id"] != "7" for row, _ in index.search(vectors[7], limit=len(vectors)))
+
+
+def test_insert_without_embedding_is_skipped():
+    index, vectors = _index()
+    index.apply_changes([{"_id": "new", "title": "new"}], [])
+    assert len(index) == len(vectors)
+
+
+def test_ivf_reembedded_row_moves_to_its_nearest_list():
+    index, vectors = _index(nlist=4, count=200)
+    # Move row 0 next to the centroid of a list it is not in
+    lists = index._state[3]
+    bucket = next(i for i, rows in enumerate(lists) if 0 not in rows)
+    target = index.centroids[bucket]
+    index.apply_changes([{"_id": "0", "embedding": target.tolist()}], [])
+    lists = index._state[3]
+    assert 0 in lists[bucket]
+    assert sum(int(np.count_nonzero(rows == 0)) for rows in lists) == 1
+    assert _top_id(index, target) == "0"
+
+
+def test_ivf_appended_rows_are_searchable():
+    index, vectors = _index(nlist=4, count=200)
+    target = index.centroids[2]
+    index.apply_changes([{"_id": "new", "embedding": target.tolist()}], [])
+    assert _top_id(index, target) == "new"
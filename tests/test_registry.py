@@ -0,0 +1,26 @@
+import pytest
+
+from embeddings.registry import EmbeddingRegistry
+
+
+def _registry():
+    registry = EmbeddingRegistry()
+    registry._load = lambda name, device, backend, threads: (name, backend, threads)
+    return registry
+
+
+def test_onnx_sessions_are_kept_per_thread_count():
+    registry = _registry()
+    assert registry.get("m", backend="onnx", threads=2) == ("m", "onnx", 2)
+    assert registry.get("m", backend="onnx", threads=4) == ("m", "onnx", 4)
+    assert registry.get("m", backend="onnx", threads=2) is registry.get("m", backend="onnx", threads=2)
+
+
+def test_conflicting_torch_threads_are_rejected():
+    registry = _registry()
+    shared = registry.get("m", threads=4)
+    assert registry.torchThreads == 4
+    assert registry.get("m") is shared
+    assert registry.get("m", threads=4) is shared
+    with pytest.raises(ValueError):
+        registry.get("other", backend="torch-int8", threads=2)
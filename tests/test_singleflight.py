@@ -0,0 +1,115 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from rag.singleflight import SingleFlight
+
+
+def _wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.001)
+
+
+def _ask_concurrently(singleFlight, pipeline, release, followers=4):
+    """One leader and `followers` identical requests in flight together: [(leader, text or exception)]."""
+    results = []
+    lock = threading.Lock()
+
+    def ask():
+        try:
+            chunks, leader = singleFlight.run("search:products:giá iphone 15", pipeline)
+            try:
+                outcome = ''.join(chunks)
+            except Exception as e:
+                outcome = e
+        except Exception as e:
+            leader, outcome = True, e
+        with lock:
+            results.append((leader, outcome))
+
+    threads = [threading.Thread(target=ask)]
+    threads[0].start()
+    _wait_until(lambda: singleFlight.leaders == 1)
+    threads += [threading.Thread(target=ask) for _ in range(followers)]
+    for thread in threads[1:]:
+        thread.start()
+    _wait_until(lambda: singleFlight.followers == followers)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    return results
+
+
+def test_identical_questions_make_one_upstream_call():
+    singleFlight = SingleFlight(maxWait=5)
+    release = threading.Event()
+    calls = []
+
+    def pipeline():
+        calls.append(1)
+        release.wait(5)
+        return iter(["Giá ", "20 triệu"])
+
+    results = _ask_concurrently(singleFlight, pipeline, release)
+    assert len(calls) == 1
+    assert sorted(leader for leader, _ in results) == [False] * 4 + [True]
+    assert all(text == "Giá 20 triệu" for _, text in results)
+    assert singleFlight.stats()["in_flight"] == 0
+
+
+@pytest.mark.parametrize("eager", [True, False])
+def test_leader_error_reaches_every_waiter_without_poisoning_the_key(eager):
+    singleFlight = SingleFlight(maxWait=5)
+    release = threading.Event()
+    calls = []
+
+    def failing():
+        calls.append(1)
+        release.wait(5)
+        if eager:
+            raise RuntimeError("LLM unavailable")
+
+        def chunks():
+            yield "Giá "
+            raise RuntimeError("LLM unavailable")
+        return chunks()
+
+    results = _ask_concurrently(singleFlight, failing, release)
+    assert len(calls) == 1
+    assert len(results) == 5
+    assert all(isinstance(outcome, RuntimeError) for _, outcome in results)
+    assert singleFlight.fallbacks == 0
+
+    chunks, leader = singleFlight.run("search:products:giá iphone 15", lambda: calls.append(1) or iter(["ok"]))
+    assert leader and ''.join(chunks) == "ok"
+    assert len(calls) == 2
+
+
+def test_async_identical_questions_make_one_upstream_call():
+    singleFlight = SingleFlight(maxWait=5)
+    calls = []
+
+    async def pipeline():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+
+        async def chunks():
+            yield "Giá "
+            yield "20 triệu"
+        return chunks()
+
+    async def ask():
+        chunks, leader = await singleFlight.arun("ask:giá iphone 15", pipeline)
+        return leader, ''.join([text async for text in chunks])
+
+    async def main():
+        return await asyncio.gather(*(ask() for _ in range(5)))
+
+    results = asyncio.run(main())
+    assert len(calls) == 1
+    assert sorted(leader for leader, _ in results) == [False] * 4 + [True]
+    assert all(text == "Giá 20 triệu" for _, text in results)
@@ -0,0 +1,154 @@
+import datetime
+
+from rag.watcher import ProductWatcher
+
+
+class Cursor():
+    def __init__(self, documents):
+        self.documents = documents
+
+    def sort(self, keys, direction=None):
+        keys = [(keys, direction)] if isinstance(keys, str) else keys
+        # Stable sorts, least significant key first
+        for field, direction in reversed(keys):
+            self.documents = sorted(self.documents, key=lambda document: document[field], reverse=direction < 0)
+        return self
+
+    def limit(self, count):
+        self.documents = self.documents[:count]
+        return self
+
+    def __iter__(self):
+        return iter(self.documents)
+
+
+def _matches(document, query):
+    for field, condition in query.items():
+        if field == "$or":
+            if not any(_matches(document, branch) for branch in condition):
+                return False
+            continue
+        value = document.get(field)
+        if isinstance(condition, dict):
+            if "$exists" in condition and (value is not None) != condition["$exists"]:
+                return False
+            if "$gte" in condition and (value is None or value < condition["$gte"]):
+                return False
+            if "$gt" in condition and (value is None or value <= condition["$gt"]):
+                return False
+        elif value != condition:
+            return False
+    return True
+
+
+class Collection():
+    """The part of a pymongo collection ProductWatcher uses, without change streams."""
+
+    def __init__(self, documents):
+        self.documents = {document["_id"]: dict(document) for document in documents}
+
+    def watch(self, *args, **kwargs):
+        raise NotImplementedError("no change streams")
+
+    def create_index(self, keys, name=None):
+        return name
+
+    def find(self, query, projection=None):
+        found = [document for document in self.documents.values() if _matches(document, query)]
+        if projection:
+            found = [{field: document[field] for field in ["_id", *projection] if field in document} for document in found]
+        return Cursor(found)
+
+    def find_one(self, query, sort=None, projection=None):
+        documents = list(self.find(query, projection).sort(sort)) if sort else list(self.find(query, projection))
+        return documents[0] if documents else None
+
+
+class Sink():
+    def __init__(self):
+        self.changes = []
+
+    def apply_changes(self, upserts, deletes):
+        self.changes.append(([document["_id"] for document in upserts], list(deletes)))
+
+
+def _at(minute):
+    return datetime.datetime(2024, 1, 1, 0, minute)
+
+
+def _watcher(collection, sink, **kwargs):
+    return ProductWatcher(collection, [sink], mode="poll", pollInterval=0.01, **kwargs)
+
+
+def test_first_poll_starts_from_the_current_state():
+    collection = Collection([{"_id": 1, "title": "a", "updated_at": _at(0)}])
+    sink = Sink()
+    watcher = _watcher(collection, sink)
+    assert watcher.poll_once() == 0
+    assert watcher.poll_once() == 0
+    assert sink.changes == []
+
+
+def test_poll_applies_updates_once_including_equal_timestamps():
+    collection = Collection([{"_id": 1, "title": "a", "updated_at": _at(0)}])
+    sink = Sink()
+    watcher = _watcher(collection, sink)
+    watcher.poll_once()
+
+    collection.documents[1].update(title="b", updated_at=_at(1))
+    collection.documents[2] = {"_id": 2, "title": "c", "updated_at": _at(1)}
+    assert watcher.poll_once() == 2
+    assert watcher.poll_once() == 0
+
+    # Same timestamp as the last poll, different product: still picked up
+    collection.documents[3] = {"_id": 3, "title": "d", "updated_at": _at(1)}
+    assert watcher.poll_once() == 1
+    assert sink.changes == [([1, 2], []), ([3], [])]
+
+
+def test_poll_pages_through_a_bulk_update_with_one_timestamp():
+    collection = Collection([{"_id": i, "title": str(i), "updated_at": _at(0)} for i in range(5)])
+    sink = Sink()
+    watcher = _watcher(collection, sink, batchSize=2)
+    watcher.poll_once()
+
+    for document in collection.documents.values():
+        document["updated_at"] = _at(1)
+    assert [watcher.poll_once() for _ in range(4)] == [2, 2, 1, 0]
+    assert sink.changes == [([0, 1], []), ([2, 3], []), ([4], [])]
+
+
+def test_poll_finds_deletes_on_the_id_scan():
+    collection = Collection([{"_id": i, "title": str(i), "updated_at": _at(0)} for i in range(3)])
+    sink = Sink()
+    watcher = _watcher(collection, sink, deleteScanInterval=0)
+    watcher.poll_once()
+    del collection.documents[1]
+    assert watcher.poll_once() == 1
+    assert sink.changes == [([], [1])]
+
+
+def test_a_failing_sink_does_not_stop_the_others():
+    class Broken():
+        def apply_changes(self, upserts, deletes):
+            raise RuntimeError("boom")
+
+    sink = Sink()
+    watcher = ProductWatcher(Collection([]), [Broken(), sink], mode="poll")
+    watcher.apply([{"_id": 1}], [])
+    assert watcher.errors == 1
+    assert sink.changes == [([1], [])]
+
+
+def test_auto_mode_falls_back_to_polling():
+    collection = Collection([{"_id": 1, "title": "a", "updated_at": _at(0)}])
+    sink = Sink()
+    watcher = ProductWatcher(collection, [sink], mode="auto", pollInterval=0.01).start()
+    try:
+        import time
+        deadline = time.monotonic() + 2
+        while watcher.activeMode != "poll" and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert watcher.activeMode == "poll"
+    finally:
+        watcher.stop(timeout=2)